@@ -0,0 +1,360 @@
+"""
+API HTTP/JSON de db.py para escáneres y scripts de aprovisionamiento.
+
+Solo usa la biblioteca estándar: un hilo por petición sobre el pool de
+conexiones de db.py. Las rutas por lotes aceptan cientos de operaciones
+por petición y devuelven el resultado de cada una.
+
+Uso:
+    python api.py --puerto 8502
+    python api.py --db /ruta/inventario.db --agrupado
+
+Rutas:
+    GET  /salud                       Versión del esquema
+    GET  /metricas                    get_metricas
+    GET  /conteos                     get_conteos_tipo_estado
+    GET  /productos[?texto=&limite=]  get_productos / buscar_productos
+    POST /productos                   {"productos": [{"tipo", "nombre", "ref"}, ...]}
+    GET  /inventario?estado=&tipo=&texto=&orden=&cursor=&limite=
+    GET  /inventario/<id>             obtener_item_completo
+    POST /inventario/ingresos         {"entradas": [{"producto_id", "cantidad", "fecha_ingreso"}, ...]}
+    POST /inventario/defectuosos      {"ids": [...]}
+    POST /sd/configuraciones          {"ids": [...], "fecha": "AAAA-MM-DD"}
+    POST /dispositivos/reinicios      {"ids": [...], "fecha": "AAAA-MM-DD"}
+    POST /dispositivos/finalizaciones {"ids": [...], "fecha": "AAAA-MM-DD"}
+    GET  /envios?texto=&cursor=&limite=
+    GET  /envios/<id>                 get_detalle_envio
+    GET  /envios/stock[?producto_id=] contar_stock_para_envio
+    POST /envios                      {"items": [{"producto_id", "cantidad"}], "folio", "destino", "descripcion", "fecha_salida"}
+    POST /envios/lote                 {"envios": [<envío>, ...]}
+
+Los errores de validación responden 400 con {"error": "..."}.
+"""
+import argparse
+import json
+import re
+from datetime import date, datetime
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import db
+
+API_MAX_OPERACIONES = 1000          # Operaciones por petición en las rutas por lotes
+API_MAX_CUERPO_BYTES = 10 * 1024 * 1024
+API_LIMITE_PAGINA_MAXIMO = 500      # Filas por página del listado
+
+class ErrorApi(Exception):
+    """Error con código HTTP propio (404, 413...)"""
+    def __init__(self, estado: HTTPStatus, mensaje: str):
+        super().__init__(mensaje)
+        self.estado = estado
+
+# ========== LECTURA DE PARÁMETROS ==========
+def _objeto(valor) -> Dict[str, Any]:
+    if not isinstance(valor, dict):
+        raise ValueError("Se esperaba un objeto JSON")
+    return valor
+
+def _campo(cuerpo: Dict[str, Any], nombre: str):
+    if nombre not in _objeto(cuerpo):
+        raise ValueError(f"Falta el campo '{nombre}'")
+    return cuerpo[nombre]
+
+def _lista(cuerpo: Dict[str, Any], nombre: str) -> List[Any]:
+    valores = _campo(cuerpo, nombre)
+    if not isinstance(valores, list):
+        raise ValueError(f"'{nombre}' debe ser una lista")
+    if len(valores) > API_MAX_OPERACIONES:
+        raise ErrorApi(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                       f"Máximo {API_MAX_OPERACIONES} operaciones por petición")
+    return valores
+
+def _entero(valor, nombre: str) -> int:
+    # int(1.9) sería 1: un decimal solo vale si no tiene parte fraccionaria
+    if isinstance(valor, bool) or (isinstance(valor, float) and not valor.is_integer()):
+        raise ValueError(f"'{nombre}' debe ser un entero")
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        raise ValueError(f"'{nombre}' debe ser un entero")
+
+def _ids(cuerpo: Dict[str, Any]) -> List[int]:
+    return [_entero(i, 'ids') for i in _lista(cuerpo, 'ids')]
+
+def _fecha(valor, nombre: str) -> Optional[date]:
+    """Fecha AAAA-MM-DD opcional; una cadena que no lo es es un error, no None"""
+    if valor is None:
+        return None
+    fecha = db.parse_fecha(valor) if isinstance(valor, str) else None
+    if fecha is None:
+        raise ValueError(f"'{nombre}' debe ser una fecha AAAA-MM-DD")
+    return fecha
+
+def _parametro(consulta: Dict[str, List[str]], nombre: str) -> Optional[str]:
+    valores = consulta.get(nombre)
+    return valores[-1] if valores else None
+
+def _limite(consulta: Dict[str, List[str]], por_defecto: int) -> int:
+    """Parámetro 'limite': positivo y como máximo API_LIMITE_PAGINA_MAXIMO"""
+    limite = _entero(_parametro(consulta, 'limite') or por_defecto, 'limite')
+    if limite < 1:
+        raise ValueError("'limite' debe ser positivo")
+    return min(limite, API_LIMITE_PAGINA_MAXIMO)
+
+# ========== RUTAS ==========
+def salud(consulta, cuerpo):
+    return {'estado': 'ok', 'version_esquema': db.version_esquema()}
+
+def metricas(consulta, cuerpo):
+    return db.get_metricas()
+
+def conteos(consulta, cuerpo):
+    return db.get_conteos_tipo_estado()
+
+def productos(consulta, cuerpo):
+    texto = _parametro(consulta, 'texto')
+    if texto:
+        return db.buscar_productos(texto, _limite(consulta, db.BUSQUEDA_LIMITE))
+    return db.get_productos()
+
+def crear_productos(consulta, cuerpo):
+    nuevos = [
+        {'tipo': _campo(p, 'tipo'), 'nombre': p.get('nombre'), 'ref': p.get('ref')}
+        for p in _lista(cuerpo, 'productos')
+    ]
+    return {'ids': db.crear_productos(nuevos)}
+
+def listar_inventario(consulta, cuerpo):
+    return db.buscar_inventario(
+        estado=_parametro(consulta, 'estado'),
+        tipo=_parametro(consulta, 'tipo'),
+        texto=_parametro(consulta, 'texto'),
+        orden=_parametro(consulta, 'orden') or 'estado',
+        cursor=_parametro(consulta, 'cursor'),
+        limite=_limite(consulta, db.INVENTARIO_POR_PAGINA),
+    )
+
+def item_inventario(consulta, cuerpo, item_id):
+    item = db.obtener_item_completo(int(item_id))
+    if item is None:
+        raise ErrorApi(HTTPStatus.NOT_FOUND, "El item no existe")
+    return item
+
+def ingresar_stock(consulta, cuerpo):
+    entradas = [
+        {
+            'producto_id': _entero(_campo(e, 'producto_id'), 'producto_id'),
+            'cantidad': _entero(_campo(e, 'cantidad'), 'cantidad'),
+            'fecha_ingreso': _fecha(_objeto(e).get('fecha_ingreso'), 'fecha_ingreso'),
+        }
+        for e in _lista(cuerpo, 'entradas')
+    ]
+    return {'ids': db.agregar_items_a_inventario(entradas)}
+
+def marcar_defectuosos(consulta, cuerpo):
+    # Una transacción por unidad: el error de una no deshace las demás
+    procesados, errores = [], []
+    for item_id in _ids(cuerpo):
+        try:
+            db.marcar_como_defectuoso(item_id)
+            procesados.append(item_id)
+        except ValueError as e:
+            errores.append({'id': item_id, 'error': str(e)})
+    return {'procesados': procesados, 'errores': errores}
+
+def _transicion(funcion: Callable[[List[int], date], Dict[str, Any]]):
+    def ruta(consulta, cuerpo):
+        fecha = _fecha(_campo(cuerpo, 'fecha'), 'fecha')
+        if fecha is None:
+            raise ValueError("'fecha' es obligatoria")
+        return funcion(_ids(cuerpo), fecha)
+    return ruta
+
+def envios(consulta, cuerpo):
+    # Con texto, las coincidencias por relevancia (sin cursor); sin texto, por páginas
+    texto = _parametro(consulta, 'texto')
+    limite = _limite(consulta, db.ENVIOS_POR_PAGINA)
+    if texto:
+        return {'filas': db.buscar_envios(texto, limite), 'total': db.contar_envios(texto), 'siguiente': None}
+    return db.listar_envios(cursor=_parametro(consulta, 'cursor'), limite=limite)
+
+def detalle_envio(consulta, cuerpo, envio_id):
+    detalle = db.get_detalle_envio(int(envio_id))
+    if not detalle:
+        raise ErrorApi(HTTPStatus.NOT_FOUND, "El envío no existe")
+    return detalle
+
+def stock_para_envio(consulta, cuerpo):
+    producto_id = _parametro(consulta, 'producto_id')
+    return db.contar_stock_para_envio(_entero(producto_id, 'producto_id') if producto_id else None)
+
+def _procesar_envio(envio: Dict[str, Any]) -> Dict[str, Any]:
+    items = [
+        {'producto_id': _entero(_campo(i, 'producto_id'), 'producto_id'),
+         'cantidad': _entero(_campo(i, 'cantidad'), 'cantidad')}
+        for i in _lista(envio, 'items')
+    ]
+    return db.procesar_envio(
+        items,
+        str(_campo(envio, 'folio')),
+        destino=_objeto(envio).get('destino') or "",
+        descripcion=envio.get('descripcion') or "",
+        fecha_salida=_fecha(envio.get('fecha_salida'), 'fecha_salida'),
+    )
+
+def procesar_envio(consulta, cuerpo):
+    resultado = _procesar_envio(cuerpo)
+    db.archivar_en_segundo_plano()
+    return resultado
+
+def procesar_envios(consulta, cuerpo):
+    # En orden: cada envío toma el stock FIFO que dejaron los anteriores
+    procesados, errores = [], []
+    for indice, envio in enumerate(_lista(cuerpo, 'envios')):
+        try:
+            procesados.append({'indice': indice, **_procesar_envio(envio)})
+        except ValueError as e:
+            errores.append({'indice': indice, 'error': str(e)})
+    if procesados:
+        db.archivar_en_segundo_plano()
+    return {'procesados': procesados, 'errores': errores}
+
+RUTAS: List[Tuple[str, "re.Pattern[str]", Callable]] = [
+    (metodo, re.compile(f"^{patron}$"), ruta) for metodo, patron, ruta in (
+        ('GET', r"/salud", salud),
+        ('GET', r"/metricas", metricas),
+        ('GET', r"/conteos", conteos),
+        ('GET', r"/productos", productos),
+        ('POST', r"/productos", crear_productos),
+        ('GET', r"/inventario", listar_inventario),
+        ('GET', r"/inventario/(\d+)", item_inventario),
+        ('POST', r"/inventario/ingresos", ingresar_stock),
+        ('POST', r"/inventario/defectuosos", marcar_defectuosos),
+        ('POST', r"/sd/configuraciones", _transicion(db.configurar_sds)),
+        ('POST', r"/dispositivos/reinicios", _transicion(db.iniciar_configuracion_dispositivos)),
+        ('POST', r"/dispositivos/finalizaciones", _transicion(db.finalizar_configuracion_dispositivos)),
+        ('GET', r"/envios", envios),
+        ('GET', r"/envios/stock", stock_para_envio),
+        ('GET', r"/envios/(\d+)", detalle_envio),
+        ('POST', r"/envios", procesar_envio),
+        ('POST', r"/envios/lote", procesar_envios),
+    )
+]
+
+def resolver(metodo: str, ruta: str) -> Tuple[Callable, tuple]:
+    """Función de la ruta y sus grupos; 404 o 405 si no hay ninguna"""
+    metodos = []
+    for metodo_ruta, patron, funcion in RUTAS:
+        coincidencia = patron.match(ruta)
+        if coincidencia:
+            if metodo_ruta == metodo:
+                return funcion, coincidencia.groups()
+            metodos.append(metodo_ruta)
+    if metodos:
+        raise ErrorApi(HTTPStatus.METHOD_NOT_ALLOWED, f"Método no permitido; use {', '.join(metodos)}")
+    raise ErrorApi(HTTPStatus.NOT_FOUND, "Ruta no encontrada")
+
+# ========== SERVIDOR ==========
+def _a_json(valor) -> str:
+    if isinstance(valor, (date, datetime)):
+        return valor.isoformat()
+    raise TypeError(f"No serializable: {type(valor).__name__}")
+
+class ManejadorApi(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Conexiones persistentes para los escáneres
+
+    def do_GET(self):
+        self._atender('GET')
+
+    def do_POST(self):
+        self._atender('POST')
+
+    def _leer_cuerpo(self) -> bytes:
+        """
+        Consume el cuerpo antes de responder, sea cual sea la respuesta: lo que
+        quede en el socket se leería como la siguiente petición de la conexión.
+        Si no se puede consumir, la conexión se cierra tras responder.
+        """
+        try:
+            longitud = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            self.close_connection = True
+            raise ValueError("Content-Length inválido")
+        if longitud < 0 or longitud > API_MAX_CUERPO_BYTES:
+            self.close_connection = True
+            raise ErrorApi(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Cuerpo demasiado grande")
+        return self.rfile.read(longitud) if longitud else b""
+
+    @staticmethod
+    def _json(datos: bytes) -> Dict[str, Any]:
+        if not datos:
+            return {}
+        try:
+            cuerpo = json.loads(datos)
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            raise ValueError("El cuerpo debe ser JSON válido")
+        return _objeto(cuerpo)
+
+    def _atender(self, metodo: str):
+        partes = urlsplit(self.path)
+        try:
+            datos = self._leer_cuerpo()
+            funcion, grupos = resolver(metodo, partes.path.rstrip('/') or '/')
+            cuerpo = self._json(datos) if metodo == 'POST' else {}
+            respuesta = funcion(parse_qs(partes.query), cuerpo, *grupos)
+            estado = HTTPStatus.OK
+        except ErrorApi as e:
+            estado, respuesta = e.estado, {'error': str(e)}
+        except ValueError as e:
+            estado, respuesta = HTTPStatus.BAD_REQUEST, {'error': str(e)}
+        except Exception as e:
+            self.log_error("Error en %s %s: %r", metodo, self.path, e)
+            estado, respuesta = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': "Error interno"}
+        self._responder(estado, respuesta)
+
+    def _responder(self, estado: HTTPStatus, respuesta):
+        datos = json.dumps(respuesta, default=_a_json, ensure_ascii=False).encode('utf-8')
+        self.send_response(estado)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(datos)))
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(datos)
+
+def crear_servidor(host: str = "127.0.0.1", puerto: int = 8502) -> ThreadingHTTPServer:
+    """Deja el esquema al día y devuelve el servidor sin arrancarlo (puerto 0: uno libre)"""
+    db.init_db()
+    servidor = ThreadingHTTPServer((host, puerto), ManejadorApi)
+    servidor.daemon_threads = True
+    return servidor
+
+# ========== CLI ==========
+def main():
+    parser = argparse.ArgumentParser(description="API HTTP/JSON del inventario")
+    parser.add_argument("--host", default="127.0.0.1", help="Dirección en la que escuchar")
+    parser.add_argument("--puerto", type=int, default=8502, help="Puerto en el que escuchar")
+    parser.add_argument("--db", help="Archivo SQLite (por defecto el de db.py)")
+    parser.add_argument("--agrupado", action="store_true",
+                        help="Confirma las escrituras concurrentes por lotes (escritor agrupado)")
+    args = parser.parse_args()
+
+    if args.db:
+        db.DB_NAME = args.db
+    servidor = crear_servidor(args.host, args.puerto)
+    if args.agrupado:
+        db.activar_escritor_agrupado()
+    print(f"API del inventario en http://{args.host}:{servidor.server_address[1]}")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+        db.desactivar_escritor_agrupado()
+        db.cerrar_conexiones()
+
+if __name__ == "__main__":
+    main()
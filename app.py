@@ -2,6 +2,9 @@ import streamlit as st
 import pandas as pd
 from db import *
 from datetime import datetime
+import inspect
+import os
+import tempfile
 import time
 
 # Constantes
@@ -10,6 +13,9 @@ TIPOS_ITEM = ["DISPOSITIVO", "SD"] + TIPOS_CABLE
 MAX_FOLIO_LENGTH = 20
 MAX_DESTINO_LENGTH = 80
 MAX_DESCRIPCION_LENGTH = 250
+MAX_CANTIDAD_INGRESO = 100000
+MAX_FILAS_TABLA = 200
+AUTO_REFRESCO_SEGUNDOS = 5
 
 st.set_page_config(
     page_title="Sistema de Inventario - Nubix",
@@ -20,6 +26,37 @@ st.set_page_config(
 
 init_db()
 
+# ========== DATOS DEL RERUN ==========
+class DatosRerun:
+    """
+    Memoriza las lecturas de db.py durante una ejecución del script: cada
+    consulta se hace una sola vez y todas las pestañas ven los mismos datos.
+    Se crea de nuevo en cada rerun.
+    """
+    def __init__(self):
+        self._valores = {}
+
+    def leer(self, func, *args, **kwargs):
+        # Clave por argumentos ya resueltos: f(x), f(x, None) y f(x, texto=None)
+        # son la misma consulta si None es el valor por defecto
+        argumentos = inspect.signature(func).bind(*args, **kwargs)
+        argumentos.apply_defaults()
+        clave = (func.__name__, tuple(argumentos.arguments.items()))
+        if clave not in self._valores:
+            self._valores[clave] = func(*args, **kwargs)
+        return self._valores[clave]
+
+datos = DatosRerun()
+
+# Recoge los cambios hechos por otras sesiones o procesos antes de leer
+version_datos = revisar_cambios()
+
+@st.fragment(run_every=AUTO_REFRESCO_SEGUNDOS)
+def vigilar_cambios():
+    """Si está activo, vuelve a ejecutar la app solo cuando la base de datos cambió"""
+    if st.session_state.get('auto_refresco') and revisar_cambios() != version_datos:
+        st.rerun(scope="app")
+
 # Inicializar session state
 if 'carrito' not in st.session_state:
     st.session_state.carrito = []
@@ -58,7 +95,7 @@ with st.sidebar:
     st.markdown("---")
     st.markdown("<div style='text-align: center; margin: 10px 0;'><strong style='font-size: 1.1rem;'>Resumen de Inventario</strong></div>", unsafe_allow_html=True)
     
-    metricas = get_metricas()
+    metricas = datos.leer(get_metricas)
     
     st.markdown(f"""
     <div style='padding: 10px 0;'>
@@ -70,14 +107,39 @@ with st.sidebar:
         <div style='display: flex; justify-content: space-between; margin: 8px 0;'><strong>Dispositivos defectuosos:</strong> <span>{metricas.get('dispositivos_defectuosos', 0)}</span></div>
     </div>
     """, unsafe_allow_html=True)
-    
+
+    with st.expander("Unidades por tipo y estado"):
+        st.dataframe(pd.DataFrame(datos.leer(get_conteos_tipo_estado)).T, use_container_width=True)
+
+    trazas = obtener_trazas()
+    if trazas['activas']:
+        with st.expander("Trazas SQL"):
+            st.caption(f"Espera por bloqueo: {trazas['espera_bloqueo_ms']} ms · Umbral lento: {trazas['umbral_lento_ms']} ms")
+            resumen = [{'sql': sql, **totales} for sql, totales in list(trazas['resumen'].items())[:20]]
+            st.dataframe(pd.DataFrame(resumen), use_container_width=True, hide_index=True)
+            for lenta in reversed(trazas['lentas'][-5:]):
+                st.code(f"{lenta['ms']} ms · {lenta['filas']} filas\n{lenta['sql']}\n" + "\n".join(lenta.get('plan', [])), language="sql")
+
+    bloqueos = estadisticas_bloqueo()
+    if any(totales['con_espera'] for totales in bloqueos.values()):
+        with st.expander("Espera por bloqueo de escritura"):
+            st.dataframe(pd.DataFrame.from_dict(bloqueos, orient='index'), use_container_width=True)
+    escritor = estadisticas_escritor_agrupado()
+    if escritor['activo']:
+        st.caption(f"Escritor agrupado: {escritor['operaciones']} escrituras en {escritor['lotes']} transacciones "
+                   f"({escritor['operaciones_por_lote']} por lote)")
+
     st.markdown("---")
     st.markdown(f"<div style='text-align: center; padding: 10px 0;'><strong>Fecha de hoy:</strong> {datetime.now().strftime('%d/%m/%Y')}</div>", unsafe_allow_html=True)
     st.markdown("---")
     
     if st.button("Recargar Datos", use_container_width=True):
-        st.cache_data.clear()
+        limpiar_cache()
         st.rerun()
+    
+    st.toggle("Actualizar automáticamente", key="auto_refresco",
+              help=f"Revisa cada {AUTO_REFRESCO_SEGUNDOS} s si hubo cambios y solo entonces recarga")
+    vigilar_cambios()
 
 tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
     "Inventario",
@@ -94,7 +156,7 @@ def get_stock_ajustado(producto_id: int) -> int:
     Calcula stock disponible restando lo que ya está en el carrito.
     Garantiza que nunca retorne negativo.
     """
-    stock_total = len(obtener_items_para_envio(producto_id=producto_id))
+    stock_total = datos.leer(contar_stock_para_envio).get(producto_id, 0)
     en_carrito = sum(item['cantidad'] for item in st.session_state.carrito if item['producto_id'] == producto_id)
     return max(0, stock_total - en_carrito)
 
@@ -104,32 +166,168 @@ def salir_modo_edicion():
     st.session_state.modo_edicion = False
     st.session_state.item_editando = None
 
+# ========== SELECTORES ==========
+def etiquetas_por_id(filas, formato) -> dict:
+    """
+    Índice id → etiqueta construido en una sola pasada para format_func.
+    Buscar cada opción en la lista o en el DataFrame vuelve O(n²) el selector.
+    """
+    return {fila['id']: formato(fila) for fila in filas}
+
+def selector_unidades(seleccion: str, etiqueta: str, formato, clave: str) -> list:
+    """
+    Multiselect con búsqueda en el servidor: lista como máximo
+    OPCIONES_POR_SELECTOR coincidencias por ID, REF o nombre, más las ya
+    elegidas. "Seleccionar todas" devuelve todos los IDs sin listarlos.
+    """
+    total = datos.leer(buscar_unidades_seleccionables, seleccion)['total']
+    if st.checkbox(f"Seleccionar todas ({total})", key=f"{clave}_todas"):
+        return datos.leer(ids_unidades_seleccionables, seleccion)
+    
+    texto = st.text_input(f"Buscar en {etiqueta.lower()}", key=f"{clave}_buscar", placeholder="ID, REF o nombre")
+    resultado = datos.leer(buscar_unidades_seleccionables, seleccion, texto.strip() or None)
+    
+    # Las ya elegidas siguen siendo opciones aunque la búsqueda cambie
+    elegidas = st.session_state.get(clave, [])
+    conocidas = st.session_state.get(f"{clave}_etiquetas", {})
+    etiquetas = {i: conocidas[i] for i in elegidas if i in conocidas}
+    etiquetas.update(etiquetas_por_id(resultado['filas'], formato))
+    st.session_state[f"{clave}_etiquetas"] = etiquetas
+    
+    if resultado['total'] > len(resultado['filas']):
+        st.caption(f"Mostrando {len(resultado['filas'])} de {resultado['total']}; escriba para acotar la búsqueda")
+    return st.multiselect(etiqueta, options=list(etiquetas.keys()), format_func=etiquetas.get, key=clave)
+
+# ========== REPORTE DE OPERACIONES POR LOTES ==========
+def guardar_reporte_lote(clave: str, reporte: dict, mensaje: str):
+    """Guarda el resultado de una operación por lotes para mostrarlo tras el rerun"""
+    st.session_state[clave] = {'mensaje': mensaje, **reporte}
+
+def mostrar_reporte_lote(clave: str):
+    """Muestra (una sola vez) el resultado guardado con guardar_reporte_lote"""
+    reporte = st.session_state.pop(clave, None)
+    if not reporte:
+        return
+    if reporte['procesados']:
+        st.success(f"✅ {reporte['mensaje']}: {len(reporte['procesados'])}")
+    if reporte['errores']:
+        st.warning(f"⚠️ {len(reporte['errores'])} items no se pudieron procesar")
+        st.dataframe(pd.DataFrame(reporte['errores']), use_container_width=True, hide_index=True,
+                     column_config={"id": "ID", "error": "MOTIVO"})
+
+# ========== EXPORTACIÓN ==========
+# Los archivos preparados viven en un directorio propio: los de sesiones
+# abandonadas se borran por antigüedad al abrir una sesión y al preparar otro
+DIRECTORIO_EXPORTACIONES = os.path.join(tempfile.gettempdir(), "inventario_exportaciones")
+EXPORTACION_VIGENCIA_SEGUNDOS = 3600
+
+def limpiar_exportaciones(vigencia: float = EXPORTACION_VIGENCIA_SEGUNDOS):
+    """Borra las exportaciones preparadas hace más de `vigencia` segundos"""
+    os.makedirs(DIRECTORIO_EXPORTACIONES, exist_ok=True)
+    limite = time.time() - vigencia
+    for nombre in os.listdir(DIRECTORIO_EXPORTACIONES):
+        ruta = os.path.join(DIRECTORIO_EXPORTACIONES, nombre)
+        try:
+            if os.path.getmtime(ruta) < limite:
+                os.remove(ruta)
+        except OSError:
+            pass  # Otra sesión lo borró antes
+
+if 'exportaciones_limpias' not in st.session_state:
+    limpiar_exportaciones()
+    st.session_state.exportaciones_limpias = True
+
+def mostrar_exportacion(tabla: str, descripcion: str):
+    """
+    Exporta a un archivo temporal en disco (sin cargar la tabla en memoria)
+    solo cuando se pide, y ofrece descargarlo.
+    """
+    clave = f"exportacion_{tabla}"
+    with st.expander(f"📥 Exportar {descripcion}"):
+        col_f, col_p, col_d = st.columns(3)
+        with col_f:
+            formato = st.selectbox("Formato", FORMATOS_EXPORTACION, key=f"{clave}_formato",
+                                   format_func=str.upper, label_visibility="collapsed")
+        with col_p:
+            if st.button("Preparar archivo", key=f"{clave}_preparar", use_container_width=True):
+                anterior = st.session_state.pop(clave, None)
+                if anterior and os.path.exists(anterior['ruta']):
+                    os.remove(anterior['ruta'])
+                limpiar_exportaciones()
+                with tempfile.NamedTemporaryFile(suffix=f".{formato}", dir=DIRECTORIO_EXPORTACIONES,
+                                                 delete=False) as archivo:
+                    ruta = archivo.name
+                listo = False
+                try:
+                    with st.spinner("Exportando..."):
+                        filas = exportar(tabla, ruta, formato)
+                    st.session_state[clave] = {'ruta': ruta, 'formato': formato, 'filas': filas}
+                    listo = True
+                except ValueError as e:
+                    st.error(f"❌ {str(e)}")
+                except Exception as e:
+                    st.error(f"❌ Error: {str(e)}")
+                finally:
+                    # Un archivo a medio escribir no se ofrece ni se queda en disco
+                    if not listo:
+                        os.remove(ruta)
+        preparado = st.session_state.get(clave)
+        if preparado and os.path.exists(preparado['ruta']):
+            with col_d:
+                with open(preparado['ruta'], 'rb') as archivo:
+                    st.download_button(
+                        f"Descargar ({preparado['filas']} filas)", data=archivo,
+                        file_name=f"{tabla}_{datetime.now().strftime('%Y%m%d')}.{preparado['formato']}",
+                        key=f"{clave}_descargar", use_container_width=True
+                    )
+
 # ========== TAB 1: INVENTARIO ==========
 with tab1:
     st.subheader("Inventario Físico")
+    mostrar_exportacion('inventario', "inventario completo")
     
-    col1, col2, col3 = st.columns(3)
+    col1, col2, col3, col4 = st.columns(4)
     with col1:
         filtro_estado = st.selectbox("Filtrar por estado:", ["TODOS", "DISPONIBLE", "REINICIADO", "CONFIGURADO", "ENVIADO", "DEFECTUOSO"])
     with col2:
         filtro_tipo = st.selectbox("Filtrar por tipo:", ["TODOS"] + TIPOS_ITEM)
     with col3:
         search_term = st.text_input("Buscar:", placeholder="REF, nombre...")
+    with col4:
+        orden_inv = st.selectbox("Ordenar:", ORDENES_INVENTARIO,
+                                 format_func=lambda x: {'estado': 'Por estado', 'reciente': 'Más recientes', 'antiguo': 'Más antiguos'}[x])
+    
+    # Pila de cursores de las páginas visitadas; se reinicia al cambiar los filtros
+    filtros_inv = (filtro_estado, filtro_tipo, search_term.strip(), orden_inv)
+    if st.session_state.get('inv_filtros') != filtros_inv:
+        st.session_state.inv_filtros = filtros_inv
+        st.session_state.inv_cursores = [None]
     
-    inventario = obtener_todo_el_inventario()
+    pagina_inv = buscar_inventario(
+        estado=None if filtro_estado == "TODOS" else filtro_estado,
+        tipo=None if filtro_tipo == "TODOS" else filtro_tipo,
+        texto=search_term.strip() or None,
+        orden=orden_inv,
+        cursor=st.session_state.inv_cursores[-1]
+    )
+    inventario = pagina_inv['filas']
+    
+    numero_pagina = len(st.session_state.inv_cursores)
+    col_p1, col_p2, col_p3 = st.columns([1, 3, 1])
+    with col_p1:
+        if st.button("◀ Anterior", disabled=numero_pagina == 1, use_container_width=True, key="inv_anterior"):
+            st.session_state.inv_cursores.pop()
+            st.rerun()
+    with col_p2:
+        st.caption(f"Página {numero_pagina} · {len(inventario)} de {pagina_inv['total']} items")
+    with col_p3:
+        if st.button("Siguiente ▶", disabled=pagina_inv['siguiente'] is None, use_container_width=True, key="inv_siguiente"):
+            st.session_state.inv_cursores.append(pagina_inv['siguiente'])
+            st.rerun()
     
     if inventario:
         df_inv = pd.DataFrame(inventario)
         
-        if filtro_estado != "TODOS":
-            df_inv = df_inv[df_inv['estado'] == filtro_estado]
-        if filtro_tipo != "TODOS":
-            df_inv = df_inv[df_inv['tipo'] == filtro_tipo]
-        if search_term:
-            mask = (df_inv['ref_prod'].astype(str).str.contains(search_term, case=False, na=False) |
-                    df_inv['producto_nombre'].astype(str).str.contains(search_term, case=False, na=False))
-            df_inv = df_inv[mask]
-        
         # Función para colorear el estado
         def color_estado(val):
             colors = {
@@ -164,6 +362,8 @@ with tab1:
                     st.info("No hay items en el inventario")
                 else:
                     items_filtrados = df_inv['id'].tolist() if not df_inv.empty else []
+                    etiquetas_editar = etiquetas_por_id(inventario, lambda f: f"ID {f['id']} - {f['ref_prod']} - {f['producto_nombre']}")
+                    etiquetas_eliminar = etiquetas_por_id(inventario, lambda f: f"ID {f['id']} - {f['ref_prod']}")
                     
                     if items_filtrados:
                         # Si estamos en modo edición, mostrar formulario
@@ -296,7 +496,6 @@ with tab1:
                                         
                                         st.success("✅ Item actualizado correctamente")
                                         salir_modo_edicion()
-                                        st.cache_data.clear()
                                         time.sleep(1)
                                         st.rerun()
                                         
@@ -310,7 +509,6 @@ with tab1:
                                         marcar_como_defectuoso(selected_id)
                                         st.success("✅ Item marcado como defectuoso")
                                         salir_modo_edicion()
-                                        st.cache_data.clear()
                                         time.sleep(1)
                                         st.rerun()
                                     except ValueError as e:
@@ -330,7 +528,7 @@ with tab1:
                                 selected_id = st.selectbox(
                                     "Seleccionar item a editar:", 
                                     options=items_filtrados,
-                                    format_func=lambda x: f"ID {x} - {df_inv[df_inv['id']==x]['ref_prod'].iloc[0]} - {df_inv[df_inv['id']==x]['producto_nombre'].iloc[0]}"
+                                    format_func=etiquetas_editar.get
                                 )
                             
                             with col_action:
@@ -351,7 +549,7 @@ with tab1:
                                 item_a_eliminar = st.selectbox(
                                     "Seleccionar item a eliminar:",
                                     options=items_filtrados,
-                                    format_func=lambda x: f"ID {x} - {df_inv[df_inv['id']==x]['ref_prod'].iloc[0]}",
+                                    format_func=etiquetas_eliminar.get,
                                     key="select_eliminar"
                                 )
                             
@@ -364,7 +562,7 @@ with tab1:
                             # Confirmación de eliminación
                             if 'confirmar_eliminacion' in st.session_state:
                                 item_id_confirm = st.session_state['confirmar_eliminacion']
-                                item_info = df_inv[df_inv['id'] == item_id_confirm].iloc[0]
+                                item_info = obtener_item_completo(item_id_confirm)
                                 
                                 st.error(f"### ¿Eliminar permanentemente?")
                                 st.warning(f"**Item:** {item_info['ref_prod']} - {item_info['producto_nombre']}")
@@ -378,7 +576,6 @@ with tab1:
                                             eliminar_item_inventario(item_id_confirm)
                                             st.success("✅ Item eliminado permanentemente")
                                             del st.session_state['confirmar_eliminacion']
-                                            st.cache_data.clear()
                                             time.sleep(1)
                                             st.rerun()
                                         except ValueError as e:
@@ -423,32 +620,31 @@ with tab2:
                         try:
                             nuevo_id = crear_producto(tipo, nombre)
                             st.success(f"✅ Producto creado con referencia autogenerada.")
-                            st.cache_data.clear()
                             time.sleep(1)
                             st.rerun()
                         except ValueError as e:
                             st.error(f"❌ {str(e)}")
         
     with col2:
-        items = get_productos()
+        items = datos.leer(get_productos)
         if not items:
             st.info("No hay items en el inventario")
         else:
             with st.expander("Agregar stock al inventario", expanded=True):
                 with st.form("agregar_inventario"):
+                    etiquetas_items = etiquetas_por_id(items, lambda p: f"{p['ref_prod']} - {p['nombre']}")
                     item_seleccionado = st.selectbox(
                             "Seleccionar item:",
-                            options=[p['id'] for p in items],
-                            format_func=lambda x: f"{next(p['ref_prod'] for p in items if p['id']==x)} - {next(p['nombre'] for p in items if p['id']==x)}"
+                            options=list(etiquetas_items.keys()),
+                            format_func=etiquetas_items.get
                         )
-                    cantidad = st.number_input("Cantidad a ingresar:", min_value=1, max_value=100, value=1)
+                    cantidad = st.number_input("Cantidad a ingresar:", min_value=1, max_value=MAX_CANTIDAD_INGRESO, value=1)
                     fecha_ingreso = st.date_input("Fecha de ingreso:", value=datetime.now().date(), max_value=datetime.now().date())
                     
                     if st.form_submit_button("Registrar en Inventario", use_container_width=True, type="primary"):
                         try:
                             ids = agregar_item_a_inventario(item_seleccionado, cantidad, fecha_ingreso)
                             st.success(f"✅ {cantidad} unidad(es) agregada(s) al inventario")
-                            st.cache_data.clear()
                             time.sleep(1)
                             st.rerun()
                         except ValueError as e:
@@ -456,6 +652,30 @@ with tab2:
                         except Exception as e:
                             st.error(f"❌ Error: {str(e)}")
 
+            with st.expander("Importar stock desde archivo", expanded=False):
+                st.caption("Columnas requeridas: ref_prod, cantidad y fecha_ingreso (AAAA-MM-DD, opcional).")
+                archivo_stock = st.file_uploader("Archivo CSV o Excel:", type=["csv", "xlsx"], key="archivo_stock")
+
+                if archivo_stock and st.button("Importar stock", use_container_width=True, type="primary"):
+                    try:
+                        progreso = st.empty()
+                        reporte = importar_stock(
+                            archivo_stock,
+                            al_terminar_lote=lambda l: progreso.caption(
+                                f"Lote {l['lote']}: {l['unidades']} unidades ({l['unidades_por_segundo']:,.0f} u/s)"
+                            )
+                        )
+                        st.success(f"✅ {reporte['unidades']} unidad(es) importada(s) de {reporte['filas']} fila(s) en {len(reporte['lotes'])} lote(s)")
+                        if reporte['lotes']:
+                            st.dataframe(pd.DataFrame(reporte['lotes']), use_container_width=True, hide_index=True)
+                        if reporte['errores']:
+                            st.warning(f"⚠️ {len(reporte['errores'])} fila(s) omitida(s)")
+                            st.dataframe(pd.DataFrame(reporte['errores']), use_container_width=True, hide_index=True)
+                    except ValueError as e:
+                        st.error(f"❌ {str(e)}")
+                    except Exception as e:
+                        st.error(f"❌ Error: {str(e)}")
+
 # ========== TAB 6: REALIZAR ENVÍO ==========
 with tab6:
     st.subheader("Realizar Nuevo Envío")
@@ -468,19 +688,25 @@ with tab6:
                 st.session_state.error_envio = None
                 st.rerun()
     
-    productos = get_productos()
+    productos = datos.leer(get_productos)
     if not productos:
         st.warning("No hay productos en el catálogo. Ve a 'Agregar al inventario' para crear items.")
     else:
         col1, col2 = st.columns([2, 1])
         
         with col1:
-            producto_opciones = {f"{p['ref_prod']} - {p['nombre']}": p['id'] for p in productos}
-            producto_seleccionado = st.selectbox("Seleccionar producto:", options=list(producto_opciones.keys()), key="prod_select")
-            producto_id = producto_opciones[producto_seleccionado]
+            # Disponibilidad de todo el catálogo con una sola consulta agregada
+            stock_por_producto = datos.leer(contar_stock_para_envio)
+            producto_etiquetas = {p['id']: f"{p['ref_prod']} - {p['nombre']}" for p in productos}
+            producto_id = st.selectbox(
+                "Seleccionar producto:",
+                options=list(producto_etiquetas.keys()),
+                format_func=lambda x: f"{producto_etiquetas[x]} ({get_stock_ajustado(x)} disp.)",
+                key="prod_select"
+            )
             
             stock_ajustado = get_stock_ajustado(producto_id)
-            stock_total = len(obtener_items_para_envio(producto_id=producto_id))
+            stock_total = stock_por_producto.get(producto_id, 0)
             
             st.caption(f"Stock disponible: {stock_total} | En carrito: {stock_total - stock_ajustado} | Puede agregar: {stock_ajustado}")
             
@@ -555,6 +781,7 @@ with tab6:
             elif not st.session_state.carrito:
                 st.error("❌ El carrito está vacío")
             else:
+                resultado = None
                 try:
                     with st.spinner("Procesando envío..."):
                         items_envio = [
@@ -562,6 +789,17 @@ with tab6:
                             for item in st.session_state.carrito
                         ]
                         resultado = procesar_envio(items_envio, folio.strip(), destino, descripcion)
+                except ValueError as e:
+                    st.session_state.error_envio = str(e)
+                    st.error(f"❌ Error: {str(e)}")
+                except Exception as e:
+                    st.session_state.error_envio = f"Error inesperado: {str(e)}"
+                    st.error(f"❌ Error inesperado: {str(e)}")
+                
+                if resultado:
+                    # El envío ya está confirmado: el archivo de envíos antiguos
+                    # corre en otro hilo y sus errores no llegan a esta pantalla
+                    archivar_en_segundo_plano()
                     
                     st.success(f"""
                     **✅ Envío procesado exitosamente**
@@ -572,48 +810,49 @@ with tab6:
                     st.balloons()
                     st.session_state.carrito = []
                     st.session_state.error_envio = None
-                    st.cache_data.clear()
                     time.sleep(2)
                     st.rerun()
-                    
-                except ValueError as e:
-                    st.session_state.error_envio = str(e)
-                    st.error(f"❌ Error: {str(e)}")
-                except Exception as e:
-                    st.session_state.error_envio = f"Error inesperado: {str(e)}"
-                    st.error(f"❌ Error inesperado: {str(e)}")
 
 # ========== TAB 3: HISTORIAL DE ENVÍOS ==========
 with tab3:
     st.subheader("Historial de Envíos")
+    mostrar_exportacion('envios', "unidades enviadas")
     
-    envios = get_envios()
-    
-    if envios:
-        df_envios = pd.DataFrame(envios)
-        
-        search_folio = st.text_input("Buscar por folio:", key="search_envios")
+    if datos.leer(get_metricas)['total_envios']:
+        search_folio = st.text_input("Buscar por folio, destino o descripción:", key="search_envios")
         if search_folio:
-            mask = df_envios['folio'].astype(str).str.contains(search_folio, case=False, na=False)
-            df_envios = df_envios[mask]
+            # Solo las coincidencias del índice de texto, en orden de relevancia
+            df_envios = pd.DataFrame(datos.leer(buscar_envios, search_folio, limite=MAX_FILAS_TABLA))
+            if not df_envios.empty:
+                for columna in ('fecha_salida', 'created_at'):
+                    df_envios[columna] = pd.to_datetime(df_envios[columna])
+                coincidencias = datos.leer(contar_envios, search_folio)
+                if coincidencias > len(df_envios):
+                    st.caption(f"Mostrando {len(df_envios)} de {coincidencias}; escriba más para acotar la búsqueda")
+        else:
+            df_envios = datos.leer(get_envios_df)
         
         if not df_envios.empty:
             st.dataframe(df_envios, use_container_width=True, hide_index=True, column_config={
                 "id": "ID", 
                 "folio": "FOLIO", 
-                "fecha_salida": "FECHA SALIDA", 
+                "fecha_salida": st.column_config.DateColumn("FECHA SALIDA", format="YYYY-MM-DD"), 
                 "destino": "DESTINO", 
                 "total_items": "TOTAL ITEMS", 
-                "created_at": "FECHA REGISTRO"
+                "created_at": st.column_config.DatetimeColumn("FECHA REGISTRO", format="YYYY-MM-DD HH:mm:ss")
             })
             
             st.markdown("---")
             st.subheader("Ver Detalle de Envío")
             
+            etiquetas_envios = {
+                envio_id: f"Folio: {folio}"
+                for envio_id, folio in zip(df_envios['id'].tolist(), df_envios['folio'].tolist())
+            }
             selected_envio = st.selectbox(
                 "Seleccionar envío:",
-                options=df_envios['id'].tolist(),
-                format_func=lambda x: f"Folio: {df_envios[df_envios['id']==x]['folio'].iloc[0]}"
+                options=list(etiquetas_envios.keys()),
+                format_func=etiquetas_envios.get
             )
             
             if selected_envio:
@@ -631,35 +870,38 @@ with tab3:
 with tab4:
     st.subheader("Configurar Tarjetas SD")
     
-    sds_disponibles = obtener_sds_para_configurar()
+    # Solo se traen las filas que se muestran en la tabla, más el total
+    pagina_sds = datos.leer(buscar_unidades_seleccionables, 'sd_configurar', limite=MAX_FILAS_TABLA)
+    mostrar_reporte_lote('reporte_sds')
     
-    if sds_disponibles:
-        st.markdown("##### SDs disponibles para configurar:")
-        df_sds = pd.DataFrame(sds_disponibles)
+    if pagina_sds['filas']:
+        st.markdown(f"##### SDs disponibles para configurar: {pagina_sds['total']}")
+        df_sds = pd.DataFrame(pagina_sds['filas'])
         st.dataframe(df_sds[['id', 'ref_prod', 'producto_nombre', 'fecha_ingreso']], use_container_width=True, hide_index=True)
+        if pagina_sds['total'] > len(df_sds):
+            st.caption(f"Mostrando las {len(df_sds)} más antiguas de {pagina_sds['total']}")
         
         st.markdown("---")
         
-        with st.expander("Configurar SD", expanded=True):
+        with st.expander("Configurar SDs", expanded=True):
             col1, col2 = st.columns(2)
             with col1:
-                sd_seleccionada = st.selectbox(
-                    "Seleccionar SD a configurar:",
-                    options=[s['id'] for s in sds_disponibles],
-                    format_func=lambda x: f"ID {x} - {next(s['producto_nombre'] for s in sds_disponibles if s['id']==x)}"
+                sds_seleccionadas = selector_unidades(
+                    'sd_configurar', "SDs a configurar:",
+                    lambda s: f"ID {s['id']} - {s['producto_nombre']}", clave="sd"
                 )
             with col2:
                 config_final = st.date_input("Fecha de configuración final:", value=datetime.now().date(), max_value=datetime.now().date())
             
-            if st.button("Configurar SD", use_container_width=True, type="primary"):
+            if st.button(f"Configurar {len(sds_seleccionadas)} SD", use_container_width=True, type="primary",
+                         disabled=not sds_seleccionadas):
                 if not config_final:
                     st.error("❌ La fecha de configuración es obligatoria")
                 else:
                     try:
-                        configurar_sd(sd_seleccionada, config_final)
-                        st.success("✅ SD configurada exitosamente")
-                        st.cache_data.clear()
-                        time.sleep(1)
+                        reporte = configurar_sds(sds_seleccionadas, config_final)
+                        guardar_reporte_lote('reporte_sds', reporte, "SDs configuradas")
+                        st.session_state.pop("sd", None)
                         st.rerun()
                     except ValueError as e:
                         st.error(f"❌ {str(e)}")
@@ -672,57 +914,57 @@ with tab4:
 with tab5:
     st.subheader("Dispositivos")
     
-    todo_inventario = obtener_todo_el_inventario()
-    dispositivos = [d for d in todo_inventario if d['tipo'] == 'DISPOSITIVO']
+    conteo_dispositivos = datos.leer(get_conteos_tipo_estado)['DISPOSITIVO']
     
-    if not dispositivos:
+    if not sum(conteo_dispositivos.values()):
         st.warning("No hay dispositivos en el inventario")
     else:
-        # Separar por estados
-        disponibles = [d for d in dispositivos if d['estado'] == 'DISPONIBLE']
-        reiniciado = [d for d in dispositivos if d['estado'] == 'REINICIADO']
-        configurados = [d for d in dispositivos if d['estado'] == 'CONFIGURADO']
-        defectuosos = [d for d in dispositivos if d['estado'] == 'DEFECTUOSO']
+        # Solo se traen las filas que se muestran en las tablas
+        pagina_reiniciados = datos.leer(buscar_inventario, estado='REINICIADO', tipo='DISPOSITIVO', limite=MAX_FILAS_TABLA)
+        pagina_configurados = datos.leer(buscar_inventario, estado='CONFIGURADO', tipo='DISPOSITIVO', limite=MAX_FILAS_TABLA)
+        reiniciado = pagina_reiniciados['filas']
+        configurados = pagina_configurados['filas']
         
         # Mostrar resumen
         col1, col2, col3, col4 = st.columns(4)
         with col1:
-            st.info(f"Disponibles: {len(disponibles)}")
+            st.info(f"Disponibles: {conteo_dispositivos['DISPONIBLE']}")
         with col2:
-            st.warning(f"Reiniciados: {len(reiniciado)}")
+            st.warning(f"Reiniciados: {conteo_dispositivos['REINICIADO']}")
         with col3:
-            st.success(f"Configurados: {len(configurados)}")
+            st.success(f"Configurados: {conteo_dispositivos['CONFIGURADO']}")
         with col4:
-            st.error(f"Defectuosos: {len(defectuosos)}")
+            st.error(f"Defectuosos: {conteo_dispositivos['DEFECTUOSO']}")
         
         st.markdown("---")
         
+        mostrar_reporte_lote('reporte_dispositivos')
+        
         # Sección de reinicio
         col1, col2 = st.columns(2)
         with col1:
-            dispositivos_para_reiniciar = obtener_dispositivos_para_reiniciar()
+            # Solo el total: el selector trae las opciones que se muestran
+            por_reiniciar = datos.leer(buscar_unidades_seleccionables, 'dispositivo_reiniciar')['total']
             
-            if dispositivos_para_reiniciar:
-                with st.expander("Reinicio de Dispositivo", expanded=True):
-                    st.markdown("### Iniciar Reinicio de Dispositivo")
+            if por_reiniciar:
+                with st.expander("Reinicio de Dispositivos", expanded=True):
+                    st.markdown("### Iniciar Reinicio de Dispositivos")
                     
                     col_left, col_right = st.columns(2)
                     with col_left:
-                        dispositivo_inicio = st.selectbox(
-                            "Dispositivo disponible:",
-                            options=[d['id'] for d in dispositivos_para_reiniciar],
-                            format_func=lambda x: f"ID {x} - {next(d['producto_nombre'] for d in dispositivos_para_reiniciar if d['id']==x)}",
-                            key="inicio_config"
+                        dispositivos_inicio = selector_unidades(
+                            'dispositivo_reiniciar', "Dispositivos disponibles:",
+                            lambda d: f"ID {d['id']} - {d['producto_nombre']}", clave="reinicio"
                         )
                     with col_right:
                         fecha_reinicio = st.date_input("Fecha de reinicio:", value=datetime.now().date(), max_value=datetime.now().date(), key="fecha_reinicio")
                     
-                    if st.button("Reiniciar Dispositivo", use_container_width=True, type="primary"):
+                    if st.button(f"Reiniciar {len(dispositivos_inicio)} dispositivos", use_container_width=True, type="primary",
+                                 disabled=not dispositivos_inicio):
                         try:
-                            iniciar_configuracion_dispositivo(dispositivo_inicio, fecha_reinicio)
-                            st.success("✅ Dispositivo reiniciado correctamente")
-                            st.cache_data.clear()
-                            time.sleep(1)
+                            reporte = iniciar_configuracion_dispositivos(dispositivos_inicio, fecha_reinicio)
+                            guardar_reporte_lote('reporte_dispositivos', reporte, "Dispositivos reiniciados")
+                            st.session_state.pop("reinicio", None)
                             st.rerun()
                         except ValueError as e:
                             st.error(f"❌ {str(e)}")
@@ -733,38 +975,31 @@ with tab5:
         
         # Sección para configuración
         with col2:
-            dispositivos_reiniciados = obtener_dispositivos_reiniciados()
+            por_finalizar = datos.leer(buscar_unidades_seleccionables, 'dispositivo_finalizar')['total']
             
-            if dispositivos_reiniciados:
+            if por_finalizar:
                 with st.expander("Configurar Dispositivo Reiniciado", expanded=True):
                     st.markdown("### Finalizar Configuración")
                     
-                    # Crear opciones con texto seguro
-                    opciones_config = {
-                        d['id']: f"ID {d['id']} - {d['producto_nombre']} (Reiniciado: {d['fecha_config_inicio']})"
-                        for d in dispositivos_reiniciados
-                    }
-                    
                     col_left, col_right = st.columns(2)
                     with col_left:
-                        dispositivo_fin = st.selectbox(
-                            "Dispositivo reiniciado:",
-                            options=list(opciones_config.keys()),
-                            format_func=lambda x: opciones_config[x],
-                            key="fin_config"
+                        dispositivos_fin = selector_unidades(
+                            'dispositivo_finalizar', "Dispositivos reiniciados:",
+                            lambda d: f"ID {d['id']} - {d['producto_nombre']} (Reiniciado: {d['fecha_config_inicio']})",
+                            clave="fin"
                         )
                     with col_right:
                         fecha_fin = st.date_input("Fecha de configuración:", value=datetime.now().date(), max_value=datetime.now().date(), key="fecha_fin")
                     
-                    if st.button("Finalizar Configuración", use_container_width=True, type="primary"):
+                    if st.button(f"Finalizar {len(dispositivos_fin)} configuraciones", use_container_width=True, type="primary",
+                                 disabled=not dispositivos_fin):
                         if not fecha_fin:
                             st.error("❌ La fecha de finalización es obligatoria")
                         else:
                             try:
-                                finalizar_configuracion_dispositivo(dispositivo_fin, fecha_fin)
-                                st.success("✅ Configuración finalizada. Dispositivo marcado como CONFIGURADO")
-                                st.cache_data.clear()
-                                time.sleep(1)
+                                reporte = finalizar_configuracion_dispositivos(dispositivos_fin, fecha_fin)
+                                guardar_reporte_lote('reporte_dispositivos', reporte, "Dispositivos marcados como CONFIGURADO")
+                                st.session_state.pop("fin", None)
                                 st.rerun()
                             except ValueError as e:
                                 st.error(f"❌ {str(e)}")
@@ -782,6 +1017,8 @@ with tab5:
             if not dv_reiniciado.empty:
                 st.dataframe(dv_reiniciado[['id', 'ref_prod', 'producto_nombre', 'disp_fecha_config_inicio']], 
                             use_container_width=True, hide_index=True)
+                if pagina_reiniciados['siguiente']:
+                    st.caption(f"Mostrando los {len(reiniciado)} más recientes de {pagina_reiniciados['total']}")
         
         st.markdown("---")
         
@@ -792,5 +1029,17 @@ with tab5:
             if not df_config.empty:
                 st.dataframe(df_config[['id', 'ref_prod', 'producto_nombre', 'disp_fecha_config_inicio', 'disp_fecha_config_final', 'disp_fecha_accion']], 
                             use_container_width=True, hide_index=True)
+                if pagina_configurados['siguiente']:
+                    st.caption(f"Mostrando los {len(configurados)} más recientes de {pagina_configurados['total']}")
+        
+        # Tiempos de ciclo por etapa a partir del historial de transiciones
+        with st.expander("⏱️ Tiempos de ciclo"):
+            agrupar_ciclo = st.selectbox("Agrupar por", list(AGRUPACIONES_CICLO.keys()), key="ciclo_agrupar")
+            tiempos = datos.leer(reporte_tiempos_ciclo, agrupar=agrupar_ciclo)
+            if tiempos:
+                st.dataframe(pd.DataFrame(tiempos), use_container_width=True, hide_index=True)
+                st.caption(f"Días entre transiciones de las últimas {CICLO_SEMANAS_POR_DEFECTO} semanas")
+            else:
+                st.info("No hay transiciones registradas en el periodo")
 
 st.markdown("---")
\ No newline at end of file
@@ -0,0 +1,656 @@
+"""
+Benchmarks de db.py sobre bases de datos temporales.
+
+Uso:
+    python benchmark.py envio --unidades 2000
+    python benchmark.py planes --unidades 200000 --envios 20000
+    python benchmark.py suite --unidades 1000000 --envios 50000 --salida actual.json
+    python benchmark.py comparar anterior.json actual.json
+    python benchmark.py escritores --hilos 16 --operaciones 50
+"""
+import argparse
+import importlib.util
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+from itertools import islice
+from typing import Any, Dict, List, Optional
+
+import db
+
+# ========== UTILIDADES ==========
+@contextmanager
+def base_temporal():
+    """Apunta db.py a una base de datos nueva en un directorio temporal"""
+    directorio = tempfile.mkdtemp(prefix="bench_inventario_")
+    db_anterior = db.DB_NAME
+    db.DB_NAME = os.path.join(directorio, "bench.db")
+    try:
+        db.init_db()
+        yield db.DB_NAME
+    finally:
+        db.cerrar_conexiones()
+        db.limpiar_cache()
+        db.DB_NAME = db_anterior
+        shutil.rmtree(directorio, ignore_errors=True)
+
+class Trazador:
+    """
+    Cuenta las sentencias de nivel superior sobre la conexión del pool.
+    sqlite3 vuelve a pasar la sentencia de nivel superior (ya expandida) por
+    cada paso de un trigger, y las internas de FTS5 llegan con el prefijo
+    "--": ni unas ni otras se cuentan.
+    Requiere un solo hilo: el pool devuelve siempre la misma conexión.
+    El callback encarece cada sentencia: no medir tiempos mientras está activo.
+    """
+    def __init__(self):
+        self.sentencias = 0
+        self.sql: List[str] = []
+
+    def __call__(self, sql: str):
+        if sql.startswith("--") or (self.sql and sql == self.sql[-1]):
+            return
+        self.sentencias += 1
+        self.sql.append(sql)
+
+@contextmanager
+def trazar():
+    trazador = Trazador()
+    with db.get_connection(read_only=True) as conn:
+        conn.set_trace_callback(trazador)
+    try:
+        yield trazador
+    finally:
+        with db.get_connection(read_only=True) as conn:
+            conn.set_trace_callback(None)
+
+def mediana_ms(func, repeticiones: int = 9) -> float:
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        func()
+        tiempos.append(time.perf_counter() - inicio)
+    return round(sorted(tiempos)[len(tiempos) // 2] * 1000, 3)
+
+# ========== DATOS SINTÉTICOS ==========
+def generar_dataset(unidades: int, envios: int, productos_por_tipo: int = 20) -> Dict[str, Any]:
+    """
+    Genera un inventario sintético determinista: `unidades` repartidas entre
+    todos los tipos y estados (la mayoría ENVIADO, como en un histórico real),
+    sus configuraciones y `envios` envíos que reparten las unidades enviadas.
+    Se genera con SQL (CTE recursivo) para poder llegar a millones de filas.
+    """
+    producto_ids = db.crear_productos([
+        {'tipo': tipo, 'nombre': f"{tipo} {n + 1}"}
+        for tipo in db.TIPOS_PRODUCTO
+        for n in range(productos_por_tipo)
+    ])
+
+    with db.get_connection(read_only=False) as conn:
+        # Producto, estado y antigüedad salen de hashes multiplicativos de x (deterministas)
+        conn.execute("""
+            INSERT INTO inventario (producto_id, estado, fecha_ingreso)
+            WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n WHERE x < ?),
+            base AS (
+                SELECT x, ? + (x * 2654435761) % ? AS producto_id, ((x / ?) * 40503) % 100 AS r
+                FROM n
+            )
+            SELECT b.producto_id,
+                   CASE
+                       WHEN p.tipo = 'DISPOSITIVO' THEN
+                           CASE WHEN b.r < 10 THEN 'DISPONIBLE' WHEN b.r < 15 THEN 'REINICIADO'
+                                WHEN b.r < 25 THEN 'CONFIGURADO' WHEN b.r < 97 THEN 'ENVIADO'
+                                ELSE 'DEFECTUOSO' END
+                       WHEN p.tipo = 'SD' THEN
+                           CASE WHEN b.r < 10 THEN 'DISPONIBLE' WHEN b.r < 25 THEN 'CONFIGURADO'
+                                WHEN b.r < 97 THEN 'ENVIADO' ELSE 'DEFECTUOSO' END
+                       ELSE
+                           CASE WHEN b.r < 20 THEN 'DISPONIBLE' WHEN b.r < 98 THEN 'ENVIADO'
+                                ELSE 'DEFECTUOSO' END
+                   END,
+                   date('now', '-' || (10 + (b.x * 7919) % 1460) || ' days')
+            FROM base b
+            JOIN productos p ON p.id = b.producto_id
+        """, (unidades, producto_ids[0], len(producto_ids), len(producto_ids)))
+
+        conn.execute("""
+            INSERT INTO dispositivo_configuraciones
+                (inventario_id, fecha_config_inicio, fecha_config_final, fecha_finalizacion_accion)
+            SELECT i.id, date(i.fecha_ingreso, '+2 days'),
+                   CASE WHEN i.estado = 'REINICIADO' THEN NULL ELSE date(i.fecha_ingreso, '+5 days') END,
+                   CASE WHEN i.estado = 'REINICIADO' THEN NULL ELSE datetime(i.fecha_ingreso, '+5 days') END
+            FROM inventario i JOIN productos p ON i.producto_id = p.id
+            WHERE p.tipo = 'DISPOSITIVO' AND i.estado IN ('REINICIADO', 'CONFIGURADO', 'ENVIADO')
+        """)
+        conn.execute("""
+            INSERT INTO sd_configuraciones (inventario_id, config_final, fecha_configuracion)
+            SELECT i.id, date(i.fecha_ingreso, '+3 days'), date(i.fecha_ingreso, '+3 days')
+            FROM inventario i JOIN productos p ON i.producto_id = p.id
+            WHERE p.tipo = 'SD' AND i.estado IN ('CONFIGURADO', 'ENVIADO')
+        """)
+        conn.execute("""
+            UPDATE inventario SET fecha_defectuoso = datetime(fecha_ingreso, '+7 days')
+            WHERE estado = 'DEFECTUOSO'
+        """)
+
+        conn.execute("""
+            INSERT INTO envios (folio, fecha_salida, destino, descripcion)
+            WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n WHERE x < ?)
+            SELECT printf('BENCH-%07d', x), date('now', '-' || (x % 1460) || ' days'),
+                   'Cliente ' || (x % 500), 'Envío sintético ' || x
+            FROM n
+        """, (envios,))
+        primer_envio = conn.execute("SELECT MIN(id) FROM envios WHERE folio LIKE 'BENCH-%'").fetchone()[0]
+        if envios:
+            conn.execute("""
+                INSERT INTO envio_detalle (envio_id, inventario_id)
+                SELECT ? + (ROW_NUMBER() OVER (ORDER BY id)) % ?, id
+                FROM inventario WHERE estado = 'ENVIADO'
+            """, (primer_envio, envios))
+
+        db._reconstruir_transiciones(conn.cursor())
+
+    db.limpiar_cache()
+    return {'producto_ids': producto_ids, 'unidades': unidades, 'envios': envios}
+
+# ========== ENVÍOS ==========
+def poblar_para_envio(unidades: int, semilla: int = 42) -> List[Dict[str, int]]:
+    """
+    Crea un dispositivo, una SD y un cable con `unidades` listas para envío
+    cada uno, con fechas de ingreso aleatorias. Devuelve la solicitud de envío.
+    """
+    aleatorio = random.Random(semilla)
+    hoy = date.today()
+    producto_ids = db.crear_productos([
+        {'tipo': 'DISPOSITIVO', 'nombre': 'Dispositivo bench'},
+        {'tipo': 'SD'},
+        {'tipo': 'CABLE_USB'},
+    ])
+
+    # Lotes de 10 unidades con fechas mezcladas para que el orden FIFO importe
+    db.agregar_items_a_inventario([
+        {'producto_id': pid, 'cantidad': 10,
+         'fecha_ingreso': hoy - timedelta(days=aleatorio.randint(1, 365))}
+        for pid in producto_ids
+        for _ in range((unidades + 9) // 10)
+    ])
+
+    with db.get_connection(read_only=False) as conn:
+        conn.execute("""
+            INSERT INTO dispositivo_configuraciones (inventario_id, fecha_config_inicio, fecha_config_final)
+            SELECT id, fecha_ingreso, fecha_ingreso FROM inventario WHERE producto_id = ?
+        """, (producto_ids[0],))
+        conn.execute("""
+            INSERT INTO sd_configuraciones (inventario_id, config_final, fecha_configuracion)
+            SELECT id, fecha_ingreso, fecha_ingreso FROM inventario WHERE producto_id = ?
+        """, (producto_ids[1],))
+        conn.execute(
+            "UPDATE inventario SET estado = 'CONFIGURADO' WHERE producto_id IN (?, ?)",
+            producto_ids[:2]
+        )
+    db.limpiar_cache()
+
+    return [{'producto_id': pid, 'cantidad': unidades // 2} for pid in producto_ids]
+
+def procesar_envio_por_unidad(items: List[Dict[str, int]], folio: str) -> Dict[str, Any]:
+    """Algoritmo anterior de procesar_envio (una consulta por línea y dos sentencias por unidad)"""
+    with db.get_connection(read_only=False) as conn:
+        cursor = conn.cursor()
+        inventario_ids = []
+        for req in items:
+            cursor.execute("SELECT nombre FROM productos WHERE id = ?", (req['producto_id'],))
+            if not cursor.fetchone():
+                raise ValueError(f"El producto con ID {req['producto_id']} no existe")
+            cursor.execute("""
+                SELECT i.id, p.tipo, dc.fecha_config_final as disp_fecha_final,
+                       sc.config_final as sd_fecha_final
+                FROM inventario i
+                JOIN productos p ON i.producto_id = p.id
+                LEFT JOIN dispositivo_configuraciones dc ON i.id = dc.inventario_id
+                LEFT JOIN sd_configuraciones sc ON i.id = sc.inventario_id
+                WHERE i.producto_id = ?
+                AND (
+                    (p.tipo IN ('DISPOSITIVO', 'SD') AND i.estado = 'CONFIGURADO')
+                    OR
+                    (p.tipo IN ('CABLE_USB', 'CABLE_ETHERNET', 'CABLE_C') AND i.estado = 'DISPONIBLE')
+                )
+                ORDER BY i.fecha_ingreso ASC, i.id ASC
+                LIMIT ?
+            """, (req['producto_id'], req['cantidad']))
+            disponibles = cursor.fetchall()
+            if len(disponibles) < req['cantidad']:
+                raise ValueError("Stock insuficiente")
+            inventario_ids.extend(row['id'] for row in disponibles)
+
+        cursor.execute(
+            "INSERT INTO envios (folio, fecha_salida) VALUES (?, ?)",
+            (folio, db.format_fecha(date.today()))
+        )
+        envio_id = cursor.lastrowid
+        for inventario_id in inventario_ids:
+            cursor.execute("UPDATE inventario SET estado = 'ENVIADO' WHERE id = ?", (inventario_id,))
+            cursor.execute(
+                "INSERT INTO envio_detalle (envio_id, inventario_id) VALUES (?, ?)",
+                (envio_id, inventario_id)
+            )
+    return {'envio_id': envio_id, 'ids': inventario_ids}
+
+def bench_envio(unidades: int) -> Dict[str, Any]:
+    """
+    Compara el envío por unidad contra la asignación FIFO por conjuntos.
+    Cada algoritmo corre dos veces sobre datos idénticos: una sin trazas para
+    los tiempos (la retención del bloqueo la mide get_connection) y otra
+    trazada solo para contar sentencias.
+    """
+    resultados = {}
+    ids_por_algoritmo = {}
+
+    for nombre, ejecutar in (
+        ('por_unidad', lambda items: procesar_envio_por_unidad(items, "BENCH-1")['ids']),
+        ('conjuntos', lambda items: [d['id'] for d in db.procesar_envio(items, "BENCH-1")['detalle']]),
+    ):
+        with base_temporal():
+            items = poblar_para_envio(unidades)
+            db.reiniciar_estadisticas_bloqueo()
+            inicio = time.perf_counter()
+            ids_por_algoritmo[nombre] = ejecutar(items)
+            segundos = time.perf_counter() - inicio
+            bloqueo_ms = sum(datos['retencion_total_ms'] for datos in db.estadisticas_bloqueo().values())
+        with base_temporal():
+            items = poblar_para_envio(unidades)
+            with trazar() as trazador:
+                ejecutar(items)
+        resultados[nombre] = {
+            'unidades_enviadas': len(ids_por_algoritmo[nombre]),
+            'sentencias': trazador.sentencias,
+            'bloqueo_ms': round(bloqueo_ms, 3),
+            'total_ms': round(segundos * 1000, 3),
+        }
+
+    resultados['asignacion_identica'] = ids_por_algoritmo['por_unidad'] == ids_por_algoritmo['conjuntos']
+    return resultados
+
+# ========== ESCRITURAS CONCURRENTES ==========
+def bench_escritores(hilos: int, operaciones: int) -> Dict[str, Any]:
+    """
+    Varios hilos registran unidades a la vez: cada uno su propia transacción
+    contra el escritor agrupado, que las confirma por lotes.
+    """
+    resultados = {}
+    for nombre, agrupado in (('directo', False), ('agrupado', True)):
+        with base_temporal():
+            producto_id = db.crear_producto('CABLE_USB', 'Bench')
+            if agrupado:
+                db.activar_escritor_agrupado()
+            db.reiniciar_estadisticas_bloqueo()
+
+            def trabajador():
+                for _ in range(operaciones):
+                    db.agregar_item_a_inventario(producto_id, 1)
+
+            trabajadores = [threading.Thread(target=trabajador) for _ in range(hilos)]
+            inicio = time.perf_counter()
+            for hilo in trabajadores:
+                hilo.start()
+            for hilo in trabajadores:
+                hilo.join()
+            segundos = time.perf_counter() - inicio
+
+            resultados[nombre] = {
+                'operaciones': hilos * operaciones,
+                'total_ms': round(segundos * 1000, 3),
+                'operaciones_por_s': round(hilos * operaciones / segundos, 1),
+                'unidades': db.get_metricas()['total_en_inventario'],
+                'bloqueo': db.estadisticas_bloqueo(),
+            }
+            if agrupado:
+                resultados[nombre]['escritor'] = db.estadisticas_escritor_agrupado()
+                db.desactivar_escritor_agrupado()
+    return resultados
+
+# ========== PLANES DE CONSULTA ==========
+# Índices que creaba init_db antes de las migraciones versionadas
+INDICES_PREVIOS = {
+    'idx_inventario_estado': "CREATE INDEX idx_inventario_estado ON inventario(estado)",
+    'idx_inventario_producto': "CREATE INDEX idx_inventario_producto ON inventario(producto_id)",
+    'idx_envios_folio': "CREATE INDEX idx_envios_folio ON envios(folio)",
+    'idx_sd_config_inventario': "CREATE INDEX idx_sd_config_inventario ON sd_configuraciones(inventario_id)",
+    'idx_disp_config_inventario': "CREATE INDEX idx_disp_config_inventario ON dispositivo_configuraciones(inventario_id)",
+}
+
+def volver_a_indices_previos():
+    """Deja la base con el juego de índices original y user_version = 0"""
+    with db.get_connection(read_only=False) as conn:
+        actuales = {row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx_%'"
+        )}
+        for nombre in actuales - INDICES_PREVIOS.keys():
+            conn.execute(f"DROP INDEX {nombre}")
+        for nombre in INDICES_PREVIOS.keys() - actuales:
+            conn.execute(INDICES_PREVIOS[nombre])
+        conn.execute("PRAGMA user_version = 0")
+    db.cerrar_conexiones()  # Para que init_db vuelva a leer user_version
+
+def consultas_criticas(producto_ids: List[int]) -> Dict[str, Any]:
+    """Consultas de las rutas FIFO, sin pasar por la caché"""
+    sd_id = producto_ids[len(producto_ids) // 5]  # Primer producto SD
+    cable_id = producto_ids[-1]
+
+    def asignacion_fifo():
+        with db.get_connection(read_only=True) as conn:
+            db._asignar_fifo(conn.cursor(), {sd_id: 50, cable_id: 50})
+
+    return {
+        'obtener_items_para_envio(producto_id)': lambda: db.obtener_items_para_envio.sin_cache(producto_id=cable_id),
+        'obtener_items_para_envio(tipo)': lambda: db.obtener_items_para_envio.sin_cache(tipo='SD'),
+        'obtener_sds_para_configurar': db.obtener_sds_para_configurar.sin_cache,
+        'obtener_dispositivos_para_reiniciar': db.obtener_dispositivos_para_reiniciar.sin_cache,
+        'obtener_dispositivos_reiniciados': db.obtener_dispositivos_reiniciados.sin_cache,
+        'procesar_envio (asignación FIFO)': asignacion_fifo,
+        'get_envios': db.get_envios.sin_cache,
+        'get_detalle_envio': lambda: db.get_detalle_envio.sin_cache(1),
+    }
+
+def explicar(func) -> List[str]:
+    """Ejecuta func capturando sus consultas y devuelve el EXPLAIN QUERY PLAN de cada una"""
+    with trazar() as trazador:
+        func()
+    plan = []
+    with db.get_connection(read_only=True) as conn:
+        for sql in trazador.sql:
+            if sql.lstrip().upper().startswith(("SELECT", "WITH")):
+                plan.extend(row['detail'] for row in conn.execute("EXPLAIN QUERY PLAN " + sql))
+    return plan
+
+def bench_planes(unidades: int, envios: int) -> Dict[str, Any]:
+    """Planes y tiempos de las consultas FIFO con los índices previos y tras la migración"""
+    resultados: Dict[str, Any] = {}
+    with base_temporal():
+        datos = generar_dataset(unidades, envios)
+        consultas = consultas_criticas(datos['producto_ids'])
+
+        volver_a_indices_previos()
+        for nombre, func in consultas.items():
+            resultados[nombre] = {'antes': {'plan': explicar(func), 'ms': mediana_ms(func)}}
+
+        inicio = time.perf_counter()
+        db.init_db()  # Aplica las migraciones pendientes
+        migracion_ms = round((time.perf_counter() - inicio) * 1000, 3)
+
+        for nombre, func in consultas.items():
+            resultados[nombre]['despues'] = {'plan': explicar(func), 'ms': mediana_ms(func)}
+            for momento in ('antes', 'despues'):
+                resultado = resultados[nombre][momento]
+                resultado['ordenamiento_temporal'] = any('TEMP B-TREE' in paso for paso in resultado['plan'])
+
+    return {'unidades': unidades, 'envios': envios, 'migracion_ms': migracion_ms, 'consultas': resultados}
+
+# ========== SUITE COMPLETA ==========
+# Funciones públicas de db.py que no son operaciones de negocio
+NO_MEDIDAS = {
+    'cerrar_conexiones', 'get_connection', 'cache_consulta', 'escritura',
+    'invalidar_cache', 'limpiar_cache', 'estadisticas_cache',
+    'format_fecha', 'parse_fecha', 'validar_fecha_no_futura', 'validar_fechas_ordenadas',
+    'activar_trazas', 'desactivar_trazas', 'obtener_trazas',
+    'estadisticas_bloqueo', 'reiniciar_estadisticas_bloqueo',
+    'activar_escritor_agrupado', 'desactivar_escritor_agrupado', 'estadisticas_escritor_agrupado',
+    'archivar_en_segundo_plano',  # Lanza archivar_si_hace_falta en un hilo (ya medido)
+}
+
+def funciones_publicas() -> List[str]:
+    """Funciones públicas definidas en db.py"""
+    return sorted(
+        nombre for nombre, valor in vars(db).items()
+        if callable(valor) and not nombre.startswith('_') and not isinstance(valor, type)
+        and getattr(valor, '__module__', None) == db.__name__
+    )
+
+def casos_suite(datos: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """
+    Un caso por función pública: 'func' ejecuta una llamada. Las escrituras
+    toman de una reserva de ids preparada antes de medir, de modo que cada
+    repetición actúa sobre una unidad distinta en el estado correcto.
+    """
+    producto_ids = datos['producto_ids']
+    por_tipo = {tipo: producto_ids[i * len(producto_ids) // 5] for i, tipo in enumerate(db.TIPOS_PRODUCTO)}
+    hoy = date.today()
+
+    with db.get_connection(read_only=True) as conn:
+        def ids(sql, *params):
+            return iter([row[0] for row in conn.execute(sql, params)])
+        disponibles = ids("SELECT id FROM inventario WHERE estado = 'DISPONIBLE' AND producto_id = ? ORDER BY id DESC",
+                          por_tipo['CABLE_ETHERNET'])
+        para_defectuoso = ids("SELECT id FROM inventario WHERE estado = 'DISPONIBLE' AND producto_id = ? ORDER BY id DESC",
+                              por_tipo['CABLE_C'])
+        para_reiniciar = ids("""
+            SELECT i.id FROM inventario i JOIN productos p ON i.producto_id = p.id
+            LEFT JOIN dispositivo_configuraciones dc ON i.id = dc.inventario_id
+            WHERE p.tipo = 'DISPOSITIVO' AND i.estado = 'DISPONIBLE' AND dc.id IS NULL
+        """)
+        reiniciados = ids("SELECT inventario_id FROM dispositivo_configuraciones WHERE fecha_config_final IS NULL")
+        sds = ids("""
+            SELECT i.id FROM inventario i JOIN productos p ON i.producto_id = p.id
+            LEFT JOIN sd_configuraciones sc ON i.id = sc.inventario_id
+            WHERE p.tipo = 'SD' AND i.estado = 'DISPONIBLE' AND sc.id IS NULL
+        """)
+        refs_cable = [row[0] for row in conn.execute(
+            "SELECT ref_prod FROM productos WHERE tipo LIKE 'CABLE%' ORDER BY id"
+        )]
+        folio_ejemplo = conn.execute("SELECT folio FROM envios ORDER BY id DESC LIMIT 1").fetchone()
+    folio_ejemplo = folio_ejemplo[0] if folio_ejemplo else "BENCH"
+
+    contador = iter(range(1, 1_000_000))
+    item_estable = next(disponibles)
+
+    def csv_importacion(filas: int = 1000) -> io.StringIO:
+        texto = "ref_prod,cantidad,fecha_ingreso\n" + "".join(
+            f"{refs_cable[n % len(refs_cable)]},1,{hoy - timedelta(days=n % 365)}\n" for n in range(filas)
+        )
+        return io.StringIO(texto)
+
+    lectura = 'lectura'
+    escritura = 'escritura'
+    return {
+        # ----- Lecturas -----
+        'obtener_todo_el_inventario': {'tipo': lectura, 'func': db.obtener_todo_el_inventario},
+        'buscar_inventario': {'tipo': lectura, 'func': lambda: db.buscar_inventario(estado='ENVIADO', tipo='SD')},
+        'buscar_productos': {'tipo': lectura, 'func': lambda: db.buscar_productos('cable')},
+        'buscar_unidades_seleccionables': {'tipo': lectura, 'func': lambda: db.buscar_unidades_seleccionables('sd_configurar', 'sd')},
+        'ids_unidades_seleccionables': {'tipo': lectura, 'func': lambda: db.ids_unidades_seleccionables('dispositivo_reiniciar')},
+        'buscar_envios': {'tipo': lectura, 'func': lambda: db.buscar_envios(folio_ejemplo)},
+        'contar_envios': {'tipo': lectura, 'func': lambda: db.contar_envios(folio_ejemplo)},
+        'obtener_items_para_envio': {'tipo': lectura, 'func': lambda: db.obtener_items_para_envio(producto_id=por_tipo['SD'])},
+        'contar_stock_para_envio': {'tipo': lectura, 'func': db.contar_stock_para_envio},
+        'obtener_sds_para_configurar': {'tipo': lectura, 'func': db.obtener_sds_para_configurar},
+        'obtener_dispositivos_para_reiniciar': {'tipo': lectura, 'func': db.obtener_dispositivos_para_reiniciar},
+        'obtener_dispositivos_reiniciados': {'tipo': lectura, 'func': db.obtener_dispositivos_reiniciados},
+        'obtener_item_completo': {'tipo': lectura, 'func': lambda: db.obtener_item_completo(item_estable)},
+        'get_productos': {'tipo': lectura, 'func': db.get_productos},
+        'verificar_producto_existe': {'tipo': lectura, 'func': lambda: db.verificar_producto_existe(producto_ids[0])},
+        'get_envios': {'tipo': lectura, 'func': db.get_envios},
+        'listar_envios': {'tipo': lectura, 'func': db.listar_envios},
+        'get_envios_df': {'tipo': lectura, 'func': db.get_envios_df, 'requiere': 'pandas'},
+        'get_detalle_envio': {'tipo': lectura, 'func': lambda: db.get_detalle_envio(1)},
+        'get_metricas': {'tipo': lectura, 'func': db.get_metricas},
+        'get_conteos_tipo_estado': {'tipo': lectura, 'func': db.get_conteos_tipo_estado},
+        'calcular_metricas': {'tipo': lectura, 'func': db.calcular_metricas},
+        'verificar_contadores': {'tipo': lectura, 'func': db.verificar_contadores},
+        'verificar_inventario_vista': {'tipo': lectura, 'func': db.verificar_inventario_vista},
+        'archivar_si_hace_falta': {'tipo': lectura, 'func': lambda: db.archivar_si_hace_falta(umbral=10 ** 9)},  # Solo la comprobación
+        'version_esquema': {'tipo': lectura, 'func': db.version_esquema},
+        'revisar_cambios': {'tipo': lectura, 'func': db.revisar_cambios},
+        'reporte_tiempos_ciclo': {'tipo': lectura, 'func': lambda: db.reporte_tiempos_ciclo(agrupar='semana')},
+        'exportar': {'tipo': lectura, 'func': lambda: db.exportar('envios', os.devnull)},
+        'init_db': {'tipo': lectura, 'func': db.init_db},
+        # ----- Escrituras -----
+        'crear_producto': {'tipo': escritura, 'func': lambda: db.crear_producto('CABLE_USB', f"Bench {next(contador)}")},
+        'crear_productos': {'tipo': escritura, 'func': lambda: db.crear_productos(
+            [{'tipo': 'CABLE_C', 'nombre': f"Bench {next(contador)}"} for _ in range(100)])},
+        'reservar_refs': {'tipo': escritura, 'func': lambda: db.reservar_refs('SD', 100)},
+        'generar_ref': {'tipo': escritura, 'func': lambda: db.generar_ref('SD')},
+        'agregar_item_a_inventario': {'tipo': escritura, 'func': lambda: db.agregar_item_a_inventario(por_tipo['CABLE_USB'], 10)},
+        'agregar_items_a_inventario': {'tipo': escritura, 'func': lambda: db.agregar_items_a_inventario(
+            [{'producto_id': pid, 'cantidad': 10} for pid in producto_ids])},
+        'importar_stock': {'tipo': escritura, 'func': lambda: db.importar_stock(csv_importacion(), formato='csv')},
+        'actualizar_item': {'tipo': escritura, 'func': lambda: db.actualizar_item(item_estable, estado='DISPONIBLE')},
+        'marcar_como_defectuoso': {'tipo': escritura, 'func': lambda: db.marcar_como_defectuoso(next(para_defectuoso))},
+        'iniciar_configuracion_dispositivo': {'tipo': escritura, 'func': lambda: db.iniciar_configuracion_dispositivo(next(para_reiniciar), hoy)},
+        'finalizar_configuracion_dispositivo': {'tipo': escritura, 'func': lambda: db.finalizar_configuracion_dispositivo(next(reiniciados), hoy)},
+        'configurar_sd': {'tipo': escritura, 'func': lambda: db.configurar_sd(next(sds), hoy)},
+        'configurar_sds': {'tipo': escritura, 'func': lambda: db.configurar_sds(list(islice(sds, 50)), hoy)},
+        'iniciar_configuracion_dispositivos': {'tipo': escritura, 'func': lambda: db.iniciar_configuracion_dispositivos(
+            list(islice(para_reiniciar, 50)), hoy)},
+        'finalizar_configuracion_dispositivos': {'tipo': escritura, 'func': lambda: db.finalizar_configuracion_dispositivos(
+            list(islice(reiniciados, 50)), hoy)},
+        'eliminar_item_inventario': {'tipo': escritura, 'func': lambda: db.eliminar_item_inventario(next(disponibles))},
+        'procesar_envio': {'tipo': escritura, 'func': lambda: db.procesar_envio(
+            [{'producto_id': por_tipo['CABLE_USB'], 'cantidad': 5}, {'producto_id': por_tipo['CABLE_ETHERNET'], 'cantidad': 5}],
+            f"SUITE-{next(contador)}")},
+        # Al final: deja la tabla de trabajo sin las unidades de envíos antiguos
+        'archivar_enviados': {'tipo': escritura, 'func': db.archivar_enviados},
+    }
+
+def bench_suite(unidades: int, envios: int, repeticiones: int = 5) -> Dict[str, Any]:
+    """
+    Mide cada función pública de db.py sobre un dataset sintético.
+    Las lecturas se miden sin caché ('ms') y con la caché ya caliente ('cache_ms').
+    """
+    resultado: Dict[str, Any] = {
+        'entorno': {
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'plataforma': platform.platform(),
+            'commit': commit_actual(),
+        },
+        'parametros': {'unidades': unidades, 'envios': envios, 'repeticiones': repeticiones},
+        'funciones': {},
+    }
+
+    with base_temporal() as ruta:
+        inicio = time.perf_counter()
+        datos = generar_dataset(unidades, envios)
+        with db.get_connection(read_only=False) as conn:
+            conn.execute("ANALYZE")
+        resultado['dataset'] = {
+            'segundos': round(time.perf_counter() - inicio, 3),
+            'bytes': os.path.getsize(ruta),
+        }
+
+        casos = casos_suite(datos)
+        for nombre, caso in casos.items():
+            func = caso['func']
+            medicion = {'tipo': caso['tipo']}
+            if caso.get('requiere') and importlib.util.find_spec(caso['requiere']) is None:
+                medicion['omitida'] = f"requiere {caso['requiere']}"
+                resultado['funciones'][nombre] = medicion
+                continue
+            sin_cache = getattr(getattr(db, nombre, None), 'sin_cache', None)
+            if sin_cache is not None:
+                # Misma llamada que el caso, pero evitando la caché
+                original = getattr(db, nombre)
+                setattr(db, nombre, sin_cache)
+                try:
+                    medicion['ms'] = mediana_ms(sin_cache if func is original else func, repeticiones)
+                finally:
+                    setattr(db, nombre, original)
+                func()
+                medicion['cache_ms'] = mediana_ms(func, repeticiones)
+            else:
+                medicion['ms'] = mediana_ms(func, repeticiones)
+            resultado['funciones'][nombre] = medicion
+
+    resultado['sin_medir'] = [n for n in funciones_publicas() if n not in casos and n not in NO_MEDIDAS]
+    return resultado
+
+def commit_actual() -> Optional[str]:
+    """Hash del commit de git del árbol de trabajo, si está disponible"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def comparar(anterior: Dict[str, Any], actual: Dict[str, Any], umbral: float = 1.25) -> Dict[str, Any]:
+    """Cociente actual/anterior por función; marca como regresión lo que supera el umbral"""
+    comparacion = {}
+    for nombre, medicion in actual['funciones'].items():
+        previa = anterior['funciones'].get(nombre)
+        if not previa or not previa.get('ms') or 'ms' not in medicion:
+            continue
+        cociente = round(medicion['ms'] / previa['ms'], 3)
+        comparacion[nombre] = {
+            'antes_ms': previa['ms'],
+            'despues_ms': medicion['ms'],
+            'cociente': cociente,
+            'regresion': cociente > umbral,
+        }
+    return {
+        'commits': [anterior['entorno'].get('commit'), actual['entorno'].get('commit')],
+        'umbral': umbral,
+        'funciones': comparacion,
+        'regresiones': sorted(n for n, c in comparacion.items() if c['regresion']),
+    }
+
+# ========== CLI ==========
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks de db.py")
+    subcomandos = parser.add_subparsers(dest="comando", required=True)
+
+    envio = subcomandos.add_parser("envio", help="Sentencias y tiempo de bloqueo de procesar_envio")
+    envio.add_argument("--unidades", type=int, default=2000, help="Unidades listas por producto")
+
+    planes = subcomandos.add_parser("planes", help="Planes de consulta antes y después de los índices versionados")
+    planes.add_argument("--unidades", type=int, default=200000, help="Unidades de inventario sintéticas")
+    planes.add_argument("--envios", type=int, default=20000, help="Envíos sintéticos")
+
+    suite = subcomandos.add_parser("suite", help="Tiempo de cada función pública de db.py")
+    suite.add_argument("--unidades", type=int, default=100000, help="Unidades de inventario sintéticas")
+    suite.add_argument("--envios", type=int, default=10000, help="Envíos sintéticos")
+    suite.add_argument("--repeticiones", type=int, default=5, help="Repeticiones por función (se reporta la mediana)")
+    suite.add_argument("--salida", help="Archivo JSON donde guardar los resultados")
+
+    comparacion = subcomandos.add_parser("comparar", help="Compara dos resultados de 'suite'")
+    comparacion.add_argument("anterior", help="JSON de referencia")
+    comparacion.add_argument("actual", help="JSON a comparar")
+    comparacion.add_argument("--umbral", type=float, default=1.25, help="Cociente a partir del cual hay regresión")
+
+    escritores = subcomandos.add_parser("escritores", help="Escrituras concurrentes con y sin el escritor agrupado")
+    escritores.add_argument("--hilos", type=int, default=16, help="Hilos que escriben a la vez")
+    escritores.add_argument("--operaciones", type=int, default=50, help="Escrituras por hilo")
+
+    args = parser.parse_args()
+
+    if args.comando == "envio":
+        resultado = bench_envio(args.unidades)
+    elif args.comando == "planes":
+        resultado = bench_planes(args.unidades, args.envios)
+    elif args.comando == "suite":
+        resultado = bench_suite(args.unidades, args.envios, args.repeticiones)
+        if args.salida:
+            with open(args.salida, "w", encoding="utf-8") as f:
+                json.dump(resultado, f, indent=2, ensure_ascii=False)
+    elif args.comando == "comparar":
+        with open(args.anterior, encoding="utf-8") as f:
+            anterior = json.load(f)
+        with open(args.actual, encoding="utf-8") as f:
+            actual = json.load(f)
+        resultado = comparar(anterior, actual, args.umbral)
+    elif args.comando == "escritores":
+        resultado = bench_escritores(args.hilos, args.operaciones)
+
+    print(json.dumps(resultado, indent=2, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
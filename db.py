@@ -1,24 +1,134 @@
+import csv
+import io
+import json
+import logging
+import os
+import queue
+import random
+import re
 import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
 from contextlib import contextmanager
-from datetime import datetime, date
-from typing import Optional, List, Dict, Any, Union
+from functools import wraps
+from datetime import datetime, date, timedelta
+from typing import Optional, List, Dict, Any, Union, Iterator, Callable
 
 DB_NAME = "inventario.db"
 
+TIPOS_PRODUCTO = ['DISPOSITIVO', 'SD', 'CABLE_USB', 'CABLE_ETHERNET', 'CABLE_C']
+ESTADOS_INVENTARIO = ['DISPONIBLE', 'REINICIADO', 'CONFIGURADO', 'ENVIADO', 'DEFECTUOSO']
+
+# ========== POOL DE CONEXIONES ==========
+POOL_MAX_INACTIVAS = 8      # Conexiones ociosas que se conservan por base de datos
+BUSY_TIMEOUT_MS = 5000      # Espera máxima ante un bloqueo antes de fallar
+
+class _PoolConexiones:
+    """
+    Pool acotado de conexiones SQLite de larga vida para una base de datos.
+    Las conexiones se abren en modo WAL para que los lectores no se bloqueen
+    con los escritores. Nunca bloquea: si no hay conexiones libres abre una
+    nueva, y al devolverla solo conserva hasta max_inactivas.
+    """
+    def __init__(self, db_name: str, max_inactivas: int = POOL_MAX_INACTIVAS):
+        self.db_name = db_name
+        self.max_inactivas = max_inactivas
+        self._inactivas: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+    def _abrir(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.db_name,
+            timeout=BUSY_TIMEOUT_MS / 1000,
+            isolation_level=None,  # Para manejo manual de transacciones
+            check_same_thread=False  # Streamlit usa un hilo distinto en cada rerun
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")  # Seguro en WAL, evita un fsync por commit
+        conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+        return conn
+
+    def obtener(self) -> sqlite3.Connection:
+        with self._lock:
+            if self._inactivas:
+                return self._inactivas.pop()
+        return self._abrir()
+
+    def devolver(self, conn: sqlite3.Connection):
+        # Nunca devolver al pool una conexión con transacción abierta
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            if len(self._inactivas) < self.max_inactivas:
+                self._inactivas.append(conn)
+                return
+        conn.close()
+
+    def cerrar(self):
+        with self._lock:
+            conexiones, self._inactivas = self._inactivas, []
+        for conn in conexiones:
+            conn.close()
+
+_pools: Dict[str, _PoolConexiones] = {}
+_pools_lock = threading.Lock()
+
+def _obtener_pool() -> _PoolConexiones:
+    """Obtiene el pool de la base de datos actual (DB_NAME puede cambiar en pruebas)"""
+    pool = _pools.get(DB_NAME)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.setdefault(DB_NAME, _PoolConexiones(DB_NAME))
+    return pool
+
+def cerrar_conexiones():
+    """Cierra todas las conexiones inactivas de todos los pools"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.cerrar()
+    _cerrar_monitores()
+    _esquemas_al_dia.clear()
+
 @contextmanager
 def get_connection(read_only: bool = False):
     """
     Context manager para manejo seguro de conexiones.
     read_only=True: No inicia transacción, solo lectura.
     read_only=False: Inicia transacción para escritura.
+    Las conexiones provienen de un pool y se reutilizan entre llamadas.
+    En el hilo del escritor agrupado todo ocurre dentro de la transacción del
+    lote: las escrituras anidan un SAVEPOINT en lugar de BEGIN/COMMIT.
     """
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    conn.isolation_level = None  # Para manejo manual de transacciones
+    conn_lote = getattr(_hilo_escritor, 'conn', None)
+    if conn_lote is not None:
+        if read_only:
+            yield conn_lote
+            return
+        conn_lote.execute("SAVEPOINT escritura")
+        try:
+            yield conn_lote
+        except Exception:
+            conn_lote.execute("ROLLBACK TO escritura")
+            conn_lote.execute("RELEASE escritura")
+            raise
+        conn_lote.execute("RELEASE escritura")
+        return
+    
+    pool = _obtener_pool()
+    conn = pool.obtener()
+    trazas = _trazas
+    if trazas is not None:
+        conn = _ConexionTrazada(conn, trazas)
     
+    tomado = None
     try:
         if not read_only:
-            conn.execute("BEGIN IMMEDIATE")  # Solo bloqueamos si vamos a escribir
+            tomado = _tomar_bloqueo_escritura(conn)  # Solo bloqueamos si vamos a escribir
         yield conn
         if not read_only:
             conn.commit()
@@ -27,104 +137,1557 @@ def get_connection(read_only: bool = False):
             conn.rollback()
         raise e
     finally:
-        conn.close()
+        if tomado is not None:
+            _bloqueos.registrar_retencion(_funcion_escritura(), (time.perf_counter() - tomado) * 1000)
+        if trazas is not None:
+            conn = conn.cerrar_trazas()
+        pool.devolver(conn)
+
+# ========== ESPERA POR EL BLOQUEO DE ESCRITURA ==========
+# BEGIN IMMEDIATE toma el bloqueo de escritura antes de hacer nada. Si otro
+# escritor lo tiene, busy_timeout espera hasta BUSY_TIMEOUT_MS; si aun así
+# falla ("database is locked") se reintenta con espera exponencial con jitter
+# hasta ESCRITURA_PLAZO_S. Reintentar ahí es seguro: la transacción no empezó.
+ESCRITURA_PLAZO_S = 30.0            # Tiempo máximo total esperando el bloqueo
+ESCRITURA_ESPERA_BASE_S = 0.05      # Tope de la primera espera entre intentos (se duplica)
+ESCRITURA_ESPERA_MAX_S = 2.0        # Tope de cada espera entre intentos
+BLOQUEO_ESPERA_MINIMA_MS = 1.0      # Por debajo, tomar el bloqueo no cuenta como espera
+
+class _EstadisticasBloqueo:
+    """
+    Esperas por el bloqueo de escritura y tiempo que se retuvo (de BEGIN
+    IMMEDIATE concedido a COMMIT/ROLLBACK), agrupados por función de escritura
+    """
+    def __init__(self):
+        self._por_funcion: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def _datos(self, funcion: str) -> Dict[str, float]:
+        return self._por_funcion.setdefault(funcion, {
+            'transacciones': 0, 'con_espera': 0, 'reintentos': 0, 'agotadas': 0,
+            'espera_total_ms': 0.0, 'espera_max_ms': 0.0,
+            'retencion_total_ms': 0.0, 'retencion_max_ms': 0.0,
+        })
+
+    def registrar(self, funcion: str, ms: float, reintentos: int, agotada: bool):
+        with self._lock:
+            datos = self._datos(funcion)
+            datos['transacciones'] += 1
+            datos['reintentos'] += reintentos
+            datos['agotadas'] += int(agotada)
+            if ms >= BLOQUEO_ESPERA_MINIMA_MS:
+                datos['con_espera'] += 1
+                datos['espera_total_ms'] += ms
+                datos['espera_max_ms'] = max(datos['espera_max_ms'], ms)
+
+    def registrar_retencion(self, funcion: str, ms: float):
+        with self._lock:
+            datos = self._datos(funcion)
+            datos['retencion_total_ms'] += ms
+            datos['retencion_max_ms'] = max(datos['retencion_max_ms'], ms)
+
+    def resumen(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                funcion: {
+                    **datos,
+                    'espera_total_ms': round(datos['espera_total_ms'], 3),
+                    'espera_max_ms': round(datos['espera_max_ms'], 3),
+                    'retencion_total_ms': round(datos['retencion_total_ms'], 3),
+                    'retencion_max_ms': round(datos['retencion_max_ms'], 3),
+                    'espera_media_ms': round(datos['espera_total_ms'] / datos['con_espera'], 3)
+                                       if datos['con_espera'] else 0.0,
+                }
+                for funcion, datos in sorted(self._por_funcion.items(),
+                                             key=lambda item: -item[1]['espera_total_ms'])
+            }
+
+    def reiniciar(self):
+        with self._lock:
+            self._por_funcion.clear()
+
+_bloqueos = _EstadisticasBloqueo()
+_escritura_actual = threading.local()  # Función @escritura más externa del hilo
+
+def _es_bloqueo(error: sqlite3.OperationalError) -> bool:
+    mensaje = str(error).lower()
+    return 'locked' in mensaje or 'busy' in mensaje
+
+def _funcion_escritura() -> str:
+    return getattr(_escritura_actual, 'nombre', None) or 'get_connection'
+
+def _tomar_bloqueo_escritura(conn: sqlite3.Connection) -> float:
+    """
+    BEGIN IMMEDIATE con reintentos; registra la espera a nombre de la función
+    de escritura. Devuelve el instante (perf_counter) en que se obtuvo el bloqueo.
+    """
+    funcion = _funcion_escritura()
+    inicio = time.perf_counter()
+    reintentos = 0
+    while True:
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            break
+        except sqlite3.OperationalError as e:
+            transcurrido = time.perf_counter() - inicio
+            restante = ESCRITURA_PLAZO_S - transcurrido
+            if not _es_bloqueo(e) or restante <= 0:
+                if _es_bloqueo(e):
+                    _bloqueos.registrar(funcion, transcurrido * 1000, reintentos, agotada=True)
+                raise
+            # Jitter completo: escritores que chocaron no vuelven a intentar a la vez
+            espera = random.uniform(0, min(ESCRITURA_ESPERA_MAX_S, ESCRITURA_ESPERA_BASE_S * 2 ** reintentos))
+            time.sleep(min(espera, restante))
+            reintentos += 1
+    tomado = time.perf_counter()
+    _bloqueos.registrar(funcion, (tomado - inicio) * 1000, reintentos, agotada=False)
+    return tomado
+
+def estadisticas_bloqueo() -> Dict[str, Dict[str, Any]]:
+    """
+    Por función de escritura: transacciones, cuántas esperaron el bloqueo,
+    reintentos, cuántas agotaron el plazo, tiempos de espera (total, máximo y
+    media de las que esperaron) y tiempo reteniendo el bloqueo (total y
+    máximo), de mayor a menor espera total.
+    """
+    return _bloqueos.resumen()
+
+def reiniciar_estadisticas_bloqueo():
+    """Descarta las estadísticas de espera acumuladas"""
+    _bloqueos.reiniciar()
+
+# ========== TRAZAS DE CONSULTAS ==========
+# Opcional: con las trazas desactivadas get_connection entrega la conexión
+# del pool sin envolver. Se activan con activar_trazas() o con la variable de
+# entorno INVENTARIO_TRAZAS_MS (umbral de consulta lenta en milisegundos).
+TRAZAS_MAX_SENTENCIAS = 1000    # Sentencias recientes que se conservan
+TRAZAS_MAX_LENTAS = 200         # Consultas lentas que se conservan
+TRAZAS_UMBRAL_LENTO_MS = 100.0
+
+_logger_sql = logging.getLogger("inventario.sql")
+
+def _forma_parametros(parametros) -> str:
+    """Describe los parámetros sin exponer sus valores: 'tupla[3]', 'dict[a, b]'"""
+    if parametros is None:
+        return "sin parámetros"
+    if isinstance(parametros, dict):
+        return f"dict[{', '.join(sorted(parametros))}]"
+    return f"{type(parametros).__name__}[{len(parametros)}]"
+
+class _RegistroTrazas:
+    """Guarda las sentencias medidas, un resumen por texto SQL y las consultas lentas"""
+    def __init__(self, umbral_lento_ms: float):
+        self.umbral_lento_ms = umbral_lento_ms
+        self.sentencias: deque = deque(maxlen=TRAZAS_MAX_SENTENCIAS)
+        self.lentas: deque = deque(maxlen=TRAZAS_MAX_LENTAS)
+        self.resumen: Dict[str, Dict[str, Any]] = {}
+        self.espera_bloqueo_ms = 0.0
+        self._lock = threading.Lock()
+
+    def registrar(self, conn: sqlite3.Connection, medicion: Dict[str, Any]):
+        sql = " ".join(medicion['sql'].split())
+        medicion['sql'] = sql
+        medicion['ms'] = round(medicion['ms'], 3)
+        
+        lenta = medicion['ms'] >= self.umbral_lento_ms
+        if lenta and medicion.get('plan_parametros', False) is not False:
+            medicion['plan'] = self._plan(conn, sql, medicion['plan_parametros'])
+        medicion.pop('plan_parametros', None)
+        
+        with self._lock:
+            self.sentencias.append(medicion)
+            total = self.resumen.setdefault(sql, {'ejecuciones': 0, 'ms_total': 0.0, 'ms_max': 0.0, 'filas': 0})
+            total['ejecuciones'] += 1
+            total['ms_total'] = round(total['ms_total'] + medicion['ms'], 3)
+            total['ms_max'] = max(total['ms_max'], medicion['ms'])
+            total['filas'] += medicion['filas']
+            if medicion.get('espera_bloqueo'):
+                self.espera_bloqueo_ms += medicion['ms']
+            if lenta:
+                self.lentas.append(medicion)
+        if lenta:
+            _logger_sql.warning("Consulta lenta (%.1f ms, %d filas): %s | plan: %s",
+                                medicion['ms'], medicion['filas'], sql, " / ".join(medicion.get('plan', [])))
+
+    @staticmethod
+    def _plan(conn: sqlite3.Connection, sql: str, parametros) -> List[str]:
+        try:
+            filas = conn.execute("EXPLAIN QUERY PLAN " + sql, parametros if parametros is not None else ())
+            return [fila[3] for fila in filas]
+        except sqlite3.Error as e:
+            return [f"(sin plan: {e})"]
+
+class _CursorTrazado:
+    """
+    Envuelve un cursor y mide cada sentencia desde execute hasta agotar las
+    filas (SQLite produce las filas al leerlas, no al ejecutar).
+    """
+    def __init__(self, cursor: sqlite3.Cursor, conexion: '_ConexionTrazada'):
+        self._cursor = cursor
+        self._conexion = conexion
+        self._medicion: Optional[Dict[str, Any]] = None
+
+    def _medir(self, metodo, *args):
+        inicio = time.perf_counter()
+        try:
+            return metodo(*args)
+        finally:
+            if self._medicion is not None:
+                self._medicion['ms'] += (time.perf_counter() - inicio) * 1000
+
+    def _cerrar_medicion(self):
+        medicion, self._medicion = self._medicion, None
+        if medicion is not None:
+            if medicion['filas'] == 0 and self._cursor.rowcount > 0:
+                medicion['filas'] = self._cursor.rowcount  # Sentencias de escritura
+            self._conexion.registro.registrar(self._conexion.conexion, medicion)
+
+    def _iniciar(self, sql: str, parametros, plan_parametros):
+        self._cerrar_medicion()
+        self._medicion = {
+            'sql': sql, 'parametros': parametros, 'ms': 0.0, 'filas': 0,
+            'plan_parametros': plan_parametros,
+        }
+
+    def execute(self, sql: str, parametros=None):
+        self._iniciar(sql, _forma_parametros(parametros), parametros)
+        args = (sql,) if parametros is None else (sql, parametros)
+        self._medir(self._cursor.execute, *args)
+        return self
+
+    def executemany(self, sql: str, secuencia):
+        secuencia = list(secuencia)
+        forma = f"executemany[{len(secuencia)} x {_forma_parametros(secuencia[0]) if secuencia else '-'}]"
+        self._iniciar(sql, forma, secuencia[0] if secuencia else False)
+        self._medir(self._cursor.executemany, sql, secuencia)
+        self._cerrar_medicion()
+        return self
+
+    def fetchone(self):
+        fila = self._medir(self._cursor.fetchone)
+        if fila is None:
+            self._cerrar_medicion()
+        elif self._medicion is not None:
+            self._medicion['filas'] += 1
+        return fila
+
+    def fetchmany(self, *args):
+        filas = self._medir(self._cursor.fetchmany, *args)
+        if self._medicion is not None:
+            self._medicion['filas'] += len(filas)
+        if not filas:
+            self._cerrar_medicion()
+        return filas
+
+    def fetchall(self):
+        filas = self._medir(self._cursor.fetchall)
+        if self._medicion is not None:
+            self._medicion['filas'] += len(filas)
+        self._cerrar_medicion()
+        return filas
+
+    def __iter__(self):
+        while True:
+            fila = self.fetchone()
+            if fila is None:
+                return
+            yield fila
+
+    def close(self):
+        self._cerrar_medicion()
+        self._cursor.close()
+
+    def __getattr__(self, nombre):
+        return getattr(self._cursor, nombre)
+
+    def __setattr__(self, nombre, valor):
+        # Atributos propios con '_'; el resto (p. ej. row_factory) van al cursor real
+        if nombre.startswith('_'):
+            object.__setattr__(self, nombre, valor)
+        else:
+            setattr(self._cursor, nombre, valor)
+
+class _ConexionTrazada:
+    """Envuelve una conexión del pool para que sus cursores registren trazas"""
+    def __init__(self, conexion: sqlite3.Connection, registro: _RegistroTrazas):
+        self.conexion = conexion
+        self.registro = registro
+        self._cursores: List[_CursorTrazado] = []
+
+    def cursor(self) -> _CursorTrazado:
+        cursor = _CursorTrazado(self.conexion.cursor(), self)
+        self._cursores.append(cursor)
+        return cursor
+
+    def execute(self, sql: str, parametros=None) -> _CursorTrazado:
+        if sql.lstrip().upper().startswith("BEGIN"):
+            # Lo que tarda BEGIN IMMEDIATE es la espera por el bloqueo de escritura
+            cursor = self.cursor().execute(sql, parametros)
+            cursor._medicion.update(espera_bloqueo=True, plan_parametros=False)
+            cursor._cerrar_medicion()
+            return cursor
+        return self.cursor().execute(sql, parametros)
+
+    def executemany(self, sql: str, secuencia) -> _CursorTrazado:
+        return self.cursor().executemany(sql, secuencia)
+
+    def _medir_fin(self, nombre: str, metodo):
+        self._cerrar_cursores()
+        inicio = time.perf_counter()
+        metodo()
+        self.registro.registrar(self.conexion, {
+            'sql': nombre, 'parametros': "sin parámetros",
+            'ms': (time.perf_counter() - inicio) * 1000, 'filas': 0,
+        })
+
+    def commit(self):
+        self._medir_fin("COMMIT", self.conexion.commit)
+
+    def rollback(self):
+        self._medir_fin("ROLLBACK", self.conexion.rollback)
+
+    def _cerrar_cursores(self):
+        for cursor in self._cursores:
+            cursor._cerrar_medicion()
+        self._cursores.clear()
+
+    def cerrar_trazas(self) -> sqlite3.Connection:
+        """Registra las mediciones pendientes y devuelve la conexión original"""
+        self._cerrar_cursores()
+        return self.conexion
+
+    def __getattr__(self, nombre):
+        return getattr(self.conexion, nombre)
+
+_trazas: Optional[_RegistroTrazas] = None
+
+def activar_trazas(umbral_lento_ms: float = TRAZAS_UMBRAL_LENTO_MS):
+    """Empieza a medir cada sentencia; las que superan el umbral se registran como lentas"""
+    global _trazas
+    _trazas = _RegistroTrazas(umbral_lento_ms)
+
+def desactivar_trazas():
+    global _trazas
+    _trazas = None
+
+def obtener_trazas() -> Dict[str, Any]:
+    """
+    Devuelve las trazas acumuladas: 'sentencias' recientes, 'resumen' por texto
+    SQL (ordenado por tiempo total), 'lentas' con su EXPLAIN QUERY PLAN y
+    'espera_bloqueo_ms' total en BEGIN IMMEDIATE.
+    """
+    trazas = _trazas
+    if trazas is None:
+        return {'activas': False, 'sentencias': [], 'resumen': {}, 'lentas': [], 'espera_bloqueo_ms': 0.0}
+    with trazas._lock:
+        sentencias = list(trazas.sentencias)
+        resumen = dict(sorted(trazas.resumen.items(), key=lambda par: -par[1]['ms_total']))
+        lentas = list(trazas.lentas)
+        espera_bloqueo_ms = round(trazas.espera_bloqueo_ms, 3)
+    return {
+        'activas': True,
+        'umbral_lento_ms': trazas.umbral_lento_ms,
+        'sentencias': sentencias,
+        'resumen': resumen,
+        'lentas': lentas,
+        'espera_bloqueo_ms': espera_bloqueo_ms,
+    }
+
+if os.environ.get("INVENTARIO_TRAZAS_MS"):
+    activar_trazas(float(os.environ["INVENTARIO_TRAZAS_MS"]))
+
+# ========== CACHÉ DE CONSULTAS ==========
+CACHE_MAX_ENTRADAS = 256       # Resultados distintos que se conservan
+CACHE_MAX_FILAS = 200_000      # Presupuesto de memoria aproximado (filas en caché)
+
+class _CacheConsultas:
+    """
+    Caché LRU de resultados de lectura con invalidación por tabla.
+    Cada entrada recuerda las tablas de las que depende; una escritura sobre
+    una tabla descarta solo las entradas que la usan. Las generaciones por
+    tabla evitan guardar un resultado leído antes de una escritura concurrente.
+    """
+    def __init__(self, max_entradas: int = CACHE_MAX_ENTRADAS, max_filas: int = CACHE_MAX_FILAS):
+        self.max_entradas = max_entradas
+        self.max_filas = max_filas
+        self._entradas: "OrderedDict[tuple, tuple]" = OrderedDict()  # clave -> (valor, peso, tablas)
+        self._por_tabla: Dict[str, set] = {}
+        self._generaciones: Dict[str, int] = {}
+        self._filas = 0
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.invalidaciones = 0
+        self.desalojos = 0
+
+    def generaciones(self, tablas: tuple) -> tuple:
+        with self._lock:
+            return tuple(self._generaciones.get(t, 0) for t in tablas)
+
+    def obtener(self, clave: tuple):
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                self.fallos += 1
+                return False, None
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            return True, entrada[0]
+
+    def guardar(self, clave: tuple, valor: Any, tablas: tuple, generaciones: tuple):
+        peso = max(1, len(valor)) if isinstance(valor, list) or hasattr(valor, 'columns') else 1
+        if peso > self.max_filas:
+            return
+        with self._lock:
+            # Una escritura ocurrió mientras se leía: el resultado puede estar obsoleto
+            if tuple(self._generaciones.get(t, 0) for t in tablas) != generaciones:
+                return
+            self._descartar(clave)
+            self._entradas[clave] = (valor, peso, tablas)
+            self._filas += peso
+            for tabla in tablas:
+                self._por_tabla.setdefault(tabla, set()).add(clave)
+            while len(self._entradas) > self.max_entradas or self._filas > self.max_filas:
+                self._descartar(next(iter(self._entradas)))
+                self.desalojos += 1
+
+    def _descartar(self, clave: tuple):
+        entrada = self._entradas.pop(clave, None)
+        if entrada is None:
+            return
+        self._filas -= entrada[1]
+        for tabla in entrada[2]:
+            claves = self._por_tabla.get(tabla)
+            if claves:
+                claves.discard(clave)
+
+    def invalidar(self, tablas: tuple):
+        with self._lock:
+            for tabla in tablas:
+                self._generaciones[tabla] = self._generaciones.get(tabla, 0) + 1
+                for clave in list(self._por_tabla.pop(tabla, ())):
+                    self._descartar(clave)
+                    self.invalidaciones += 1
+
+    def limpiar(self):
+        with self._lock:
+            for tabla in self._generaciones:
+                self._generaciones[tabla] += 1
+            self._entradas.clear()
+            self._por_tabla.clear()
+            self._filas = 0
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                'entradas': len(self._entradas),
+                'filas': self._filas,
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'tasa_aciertos': self.aciertos / consultas if consultas else 0.0,
+                'invalidaciones': self.invalidaciones,
+                'desalojos': self.desalojos,
+            }
+
+_cache = _CacheConsultas()
+
+def cache_consulta(*tablas: str):
+    """
+    Decorador para funciones de lectura: guarda el resultado por función y
+    argumentos hasta que una escritura toque alguna de las tablas indicadas.
+    Los resultados se comparten entre sesiones y deben tratarse como de solo lectura.
+    """
+    def decorador(func):
+        @wraps(func)
+        def envoltura(*args, **kwargs):
+            clave = (DB_NAME, func.__name__, args, tuple(sorted(kwargs.items())))
+            try:
+                hash(clave)
+            except TypeError:
+                return func(*args, **kwargs)  # Argumentos no hasheables: sin caché
+            
+            _revisar_cambios_periodico()
+            encontrado, valor = _cache.obtener(clave)
+            if encontrado:
+                return valor
+            
+            generaciones = _cache.generaciones(tablas)
+            valor = func(*args, **kwargs)
+            _cache.guardar(clave, valor, tablas, generaciones)
+            return valor
+        envoltura.sin_cache = func
+        envoltura.tablas = tablas
+        return envoltura
+    return decorador
+
+def escritura(*tablas: str, agrupable: bool = True):
+    """
+    Decorador para funciones de escritura: invalida la caché de las tablas que
+    modifican y atribuye a la función las esperas por el bloqueo de escritura.
+    Con el escritor agrupado activo, las funciones agrupables se ejecutan en
+    su hilo (ver activar_escritor_agrupado); agrupable=False para las que
+    confirman varias transacciones por su cuenta.
+    """
+    def decorador(func):
+        @wraps(func)
+        def envoltura(*args, **kwargs):
+            escritor = _escritor
+            if (agrupable and escritor is not None and escritor.db_name == DB_NAME
+                    and getattr(_hilo_escritor, 'conn', None) is None):
+                return escritor.encolar(envoltura, args, kwargs).result()
+            
+            externa = getattr(_escritura_actual, 'nombre', None) is None
+            if externa:
+                _escritura_actual.nombre = func.__name__
+            try:
+                return func(*args, **kwargs)
+            finally:
+                if externa:
+                    _escritura_actual.nombre = None
+                _cache.invalidar(tablas)
+        envoltura.tablas = tablas
+        return envoltura
+    return decorador
+
+def invalidar_cache(*tablas: str):
+    """Invalida manualmente las entradas que dependen de las tablas indicadas"""
+    _cache.invalidar(tablas)
+
+def limpiar_cache():
+    """Descarta todos los resultados en caché"""
+    _cache.limpiar()
+
+def estadisticas_cache() -> Dict[str, Any]:
+    """Devuelve contadores de aciertos, fallos, invalidaciones y tamaño de la caché"""
+    return _cache.estadisticas()
+
+# ========== ESCRITOR AGRUPADO ==========
+# Opcional: un solo hilo aplica las escrituras de todas las sesiones. Junta
+# las operaciones que llegan durante ESCRITOR_ESPERA_MS (hasta
+# ESCRITOR_MAX_LOTE) y las aplica en una sola transacción, cada una dentro de
+# su propio SAVEPOINT: la que falla se deshace sola y su error vuelve a quien
+# la pidió; las demás se confirman juntas con un único COMMIT.
+# Se activa con activar_escritor_agrupado() o la variable de entorno
+# INVENTARIO_ESCRITOR_AGRUPADO.
+ESCRITOR_MAX_LOTE = 64          # Operaciones por transacción
+ESCRITOR_ESPERA_MS = 1.0        # Espera a más operaciones tras la primera (0: solo las ya encoladas)
+
+_hilo_escritor = threading.local()  # conn: conexión del lote en el hilo del escritor
+
+class _OperacionEscritura:
+    __slots__ = ('func', 'args', 'kwargs', 'futuro', 'resultado')
+
+    def __init__(self, func: Callable, args: tuple, kwargs: dict):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.futuro: Future = Future()
+        self.resultado = None
+
+class _EscritorAgrupado:
+    """Hilo único que aplica las operaciones encoladas por lotes"""
+    def __init__(self, db_name: str, max_lote: int, espera_s: float):
+        self.db_name = db_name
+        self.max_lote = max_lote
+        self.espera_s = espera_s
+        self._cola: "queue.Queue[Optional[_OperacionEscritura]]" = queue.Queue()
+        self._estadisticas = {'lotes': 0, 'operaciones': 0, 'errores': 0, 'lote_maximo': 0, 'lotes_fallidos': 0}
+        self._hilo = threading.Thread(target=self._ejecutar, name="escritor-agrupado", daemon=True)
+        self._hilo.start()
+
+    def encolar(self, func: Callable, args: tuple, kwargs: dict) -> Future:
+        operacion = _OperacionEscritura(func, args, kwargs)
+        self._cola.put(operacion)
+        return operacion.futuro
+
+    def detener(self):
+        self._cola.put(None)
+        self._hilo.join()
+
+    def estadisticas(self) -> Dict[str, Any]:
+        datos = dict(self._estadisticas)
+        datos['operaciones_por_lote'] = round(datos['operaciones'] / datos['lotes'], 2) if datos['lotes'] else 0.0
+        datos['pendientes'] = self._cola.qsize()
+        return datos
+
+    def _ejecutar(self):
+        conn = _PoolConexiones(self.db_name)._abrir()
+        try:
+            activo = True
+            while activo:
+                operacion = self._cola.get()
+                if operacion is None:
+                    break
+                lote = [operacion]
+                limite = time.monotonic() + self.espera_s
+                while len(lote) < self.max_lote:
+                    try:
+                        restante = limite - time.monotonic()
+                        operacion = self._cola.get(timeout=restante) if restante > 0 else self._cola.get_nowait()
+                    except queue.Empty:
+                        break
+                    if operacion is None:
+                        activo = False
+                        break
+                    lote.append(operacion)
+                self._aplicar(conn, lote)
+        finally:
+            conn.close()
+
+    def _aplicar(self, conn: sqlite3.Connection, lote: List[_OperacionEscritura]):
+        lote = [op for op in lote if op.futuro.set_running_or_notify_cancel()]
+        if not lote:
+            return
+        tablas = set()
+        correctas = []
+        tomado = None
+        try:
+            _escritura_actual.nombre = 'escritor_agrupado'
+            try:
+                tomado = _tomar_bloqueo_escritura(conn)
+            finally:
+                _escritura_actual.nombre = None
+            _hilo_escritor.conn = conn
+            try:
+                for op in lote:
+                    tablas.update(getattr(op.func, 'tablas', ()))
+                    conn.execute("SAVEPOINT operacion")
+                    try:
+                        op.resultado = op.func(*op.args, **op.kwargs)
+                    except Exception as e:
+                        conn.execute("ROLLBACK TO operacion")
+                        conn.execute("RELEASE operacion")
+                        self._estadisticas['errores'] += 1
+                        op.futuro.set_exception(e)
+                        continue
+                    conn.execute("RELEASE operacion")
+                    correctas.append(op)
+            finally:
+                _hilo_escritor.conn = None
+            conn.commit()
+        except Exception as e:
+            # Sin COMMIT no se confirmó nada: fallan todas las que no habían fallado ya
+            if conn.in_transaction:
+                conn.rollback()
+            self._estadisticas['lotes_fallidos'] += 1
+            for op in lote:
+                if not op.futuro.done():
+                    op.futuro.set_exception(e)
+            return
+        finally:
+            if tomado is not None:
+                _bloqueos.registrar_retencion('escritor_agrupado', (time.perf_counter() - tomado) * 1000)
+            # Otras conexiones pudieron leer y cachear antes del COMMIT
+            _cache.invalidar(tablas)
+        
+        self._estadisticas['lotes'] += 1
+        self._estadisticas['operaciones'] += len(lote)
+        self._estadisticas['lote_maximo'] = max(self._estadisticas['lote_maximo'], len(lote))
+        for op in correctas:
+            op.futuro.set_result(op.resultado)
+
+_escritor: Optional[_EscritorAgrupado] = None
+_escritor_lock = threading.Lock()
+
+def activar_escritor_agrupado(max_lote: int = ESCRITOR_MAX_LOTE, espera_ms: float = ESCRITOR_ESPERA_MS):
+    """
+    Inicia el escritor agrupado para la base de datos actual. Desde entonces
+    las funciones @escritura agrupables de cualquier hilo esperan a que su
+    lote se confirme y devuelven su propio resultado o error.
+    """
+    global _escritor
+    if max_lote <= 0:
+        raise ValueError("El tamaño de lote debe ser positivo")
+    with _escritor_lock:
+        if _escritor is not None:
+            _escritor.detener()
+        _escritor = _EscritorAgrupado(DB_NAME, max_lote, espera_ms / 1000)
+
+def desactivar_escritor_agrupado():
+    """Aplica lo pendiente y detiene el escritor; las escrituras vuelven a ir directo"""
+    global _escritor
+    with _escritor_lock:
+        escritor, _escritor = _escritor, None
+    if escritor is not None:
+        escritor.detener()
+
+def estadisticas_escritor_agrupado() -> Dict[str, Any]:
+    """Lotes confirmados, operaciones, errores y tamaño de lote del escritor agrupado"""
+    escritor = _escritor
+    if escritor is None:
+        return {'activo': False}
+    return {'activo': True, **escritor.estadisticas()}
+
+if os.environ.get("INVENTARIO_ESCRITOR_AGRUPADO"):
+    activar_escritor_agrupado()
+
+# ========== DETECCIÓN DE CAMBIOS ==========
+# Las escrituras de este proceso invalidan la caché al instante (@escritura).
+# Las de otros procesos se detectan con PRAGMA data_version, que cambia cuando
+# otra conexión confirma una transacción; solo entonces se lee la tabla
+# generaciones para invalidar únicamente las tablas que cambiaron.
+CAMBIOS_INTERVALO_S = 1.0   # Frecuencia máxima de revisión desde las lecturas en caché
+
+class _MonitorCambios:
+    """Vigila una base de datos con una conexión propia que nunca escribe"""
+    def __init__(self, db_name: str):
+        self.db_name = db_name
+        self.version = 0  # Aumenta cada vez que se detectan tablas modificadas
+        self._conn: Optional[sqlite3.Connection] = None
+        self._data_version: Optional[int] = None
+        self._generaciones: Dict[str, int] = {}
+        self._ultima_revision = 0.0
+        self._lock = threading.Lock()
+
+    def revisar(self, forzar: bool = True) -> int:
+        if not forzar and time.monotonic() - self._ultima_revision < CAMBIOS_INTERVALO_S:
+            return self.version
+        with self._lock:
+            self._ultima_revision = time.monotonic()
+            if self._conn is None:
+                self._conn = sqlite3.connect(self.db_name, timeout=BUSY_TIMEOUT_MS / 1000,
+                                             isolation_level=None, check_same_thread=False)
+            data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            if data_version == self._data_version:
+                return self.version
+            try:
+                generaciones = dict(self._conn.execute("SELECT tabla, generacion FROM generaciones"))
+            except sqlite3.OperationalError:
+                return self.version  # Esquema aún sin migrar
+            self._data_version = data_version
+            
+            cambiadas = tuple(t for t, g in generaciones.items() if self._generaciones.get(t) != g)
+            primera_lectura = not self._generaciones
+            self._generaciones = generaciones
+            if cambiadas and not primera_lectura:
+                self.version += 1
+                _cache.invalidar(cambiadas)
+            return self.version
+
+    def cerrar(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+_monitores: Dict[str, _MonitorCambios] = {}
+
+def _obtener_monitor() -> _MonitorCambios:
+    monitor = _monitores.get(DB_NAME)
+    if monitor is None:
+        with _pools_lock:
+            monitor = _monitores.setdefault(DB_NAME, _MonitorCambios(DB_NAME))
+    return monitor
+
+def _revisar_cambios_periodico():
+    _obtener_monitor().revisar(forzar=False)
+
+def _cerrar_monitores():
+    with _pools_lock:
+        monitores = list(_monitores.values())
+        _monitores.clear()
+    for monitor in monitores:
+        monitor.cerrar()
+
+def revisar_cambios() -> int:
+    """
+    Detecta escrituras confirmadas por otras conexiones desde la última revisión
+    e invalida la caché de las tablas afectadas. Si no hubo cambios cuesta una
+    sola consulta (PRAGMA data_version). Devuelve un número de versión que
+    aumenta cada vez que se detectan cambios.
+    """
+    return _obtener_monitor().revisar()
+
+# ========== INICIALIZACIÓN DEL ESQUEMA ==========
+# app.py llama a init_db en cada rerun: solo la primera llamada del proceso
+# lee PRAGMA user_version, y solo si el esquema está atrasado se toma el
+# bloqueo de escritura para crear las tablas y aplicar las migraciones.
+_esquemas_al_dia = set()
+_esquemas_lock = threading.Lock()
 
 def init_db():
-    """Inicializa todas las tablas de la base de datos"""
-    with get_connection(read_only=False) as conn:
-        cursor = conn.cursor()
-        
-        # ===== TABLAS MAESTRAS (CATÁLOGOS) =====
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS productos (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                ref_prod TEXT UNIQUE NOT NULL,
-                nombre TEXT NOT NULL,
-                tipo TEXT NOT NULL CHECK(tipo IN ('DISPOSITIVO', 'SD', 'CABLE_USB', 'CABLE_ETHERNET', 'CABLE_C')),
-                descripcion TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
+    """
+    Deja el esquema de la base de datos al día (tablas base y migraciones).
+    Con el esquema vigente cuesta una lectura la primera vez y nada después.
+    """
+    if DB_NAME in _esquemas_al_dia:
+        return
+    with _esquemas_lock:
+        if DB_NAME in _esquemas_al_dia:
+            return
+        if version_esquema() < VERSION_ESQUEMA:
+            with get_connection(read_only=False) as conn:
+                cursor = conn.cursor()
+                _crear_esquema_base(cursor)
+                # Vuelve a leer user_version dentro de la transacción: otro proceso pudo migrar antes
+                _aplicar_migraciones(cursor)
+                # Estadísticas para las tablas e índices nuevos
+                cursor.execute("PRAGMA optimize")
+        _esquemas_al_dia.add(DB_NAME)
 
-        # ===== INVENTARIO FÍSICO =====
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS inventario (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                producto_id INTEGER NOT NULL,
-                estado TEXT NOT NULL DEFAULT 'DISPONIBLE' 
-                    CHECK(estado IN ('DISPONIBLE', 'REINICIADO', 'CONFIGURADO', 'ENVIADO', 'DEFECTUOSO')),
-                fecha_ingreso DATE NOT NULL,
-                fecha_defectuoso TIMESTAMP,  -- Nuevo campo para trazabilidad
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (producto_id) REFERENCES productos(id) ON DELETE RESTRICT
-            )
-        """)
+def _crear_esquema_base(cursor: sqlite3.Cursor):
+    """Tablas de la versión 0 del esquema (idempotente); los cambios posteriores van en MIGRACIONES"""
+    # ===== TABLAS MAESTRAS (CATÁLOGOS) =====
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS productos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ref_prod TEXT UNIQUE NOT NULL,
+            nombre TEXT NOT NULL,
+            tipo TEXT NOT NULL CHECK(tipo IN ('DISPOSITIVO', 'SD', 'CABLE_USB', 'CABLE_ETHERNET', 'CABLE_C')),
+            descripcion TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
 
-        # ===== CONFIGURACIONES DE SD =====
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS sd_configuraciones (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                inventario_id INTEGER NOT NULL UNIQUE,
-                config_final DATE NOT NULL,
-                fecha_configuracion DATE NOT NULL,
-                imagen_quemada TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (inventario_id) REFERENCES inventario(id) ON DELETE CASCADE
-            )
-        """)
+    # ===== INVENTARIO FÍSICO =====
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS inventario (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            producto_id INTEGER NOT NULL,
+            estado TEXT NOT NULL DEFAULT 'DISPONIBLE' 
+                CHECK(estado IN ('DISPONIBLE', 'REINICIADO', 'CONFIGURADO', 'ENVIADO', 'DEFECTUOSO')),
+            fecha_ingreso DATE NOT NULL,
+            fecha_defectuoso TIMESTAMP,  -- Nuevo campo para trazabilidad
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (producto_id) REFERENCES productos(id) ON DELETE RESTRICT
+        )
+    """)
 
-        # ===== CONFIGURACIONES DE DISPOSITIVOS =====
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS dispositivo_configuraciones (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                inventario_id INTEGER NOT NULL UNIQUE,
-                fecha_config_inicio DATE NOT NULL,
-                fecha_config_final DATE,
-                fecha_finalizacion_accion TIMESTAMP,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (inventario_id) REFERENCES inventario(id) ON DELETE CASCADE
-            )
-        """)
+    # ===== CONFIGURACIONES DE SD =====
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sd_configuraciones (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            inventario_id INTEGER NOT NULL UNIQUE,
+            config_final DATE NOT NULL,
+            fecha_configuracion DATE NOT NULL,
+            imagen_quemada TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (inventario_id) REFERENCES inventario(id) ON DELETE CASCADE
+        )
+    """)
 
-        # ===== MOVIMIENTOS (ENVÍOS) =====
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS envios (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                folio TEXT UNIQUE NOT NULL,
-                fecha_salida DATE NOT NULL,
-                destino TEXT,
-                descripcion TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
+    # ===== CONFIGURACIONES DE DISPOSITIVOS =====
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS dispositivo_configuraciones (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            inventario_id INTEGER NOT NULL UNIQUE,
+            fecha_config_inicio DATE NOT NULL,
+            fecha_config_final DATE,
+            fecha_finalizacion_accion TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (inventario_id) REFERENCES inventario(id) ON DELETE CASCADE
+        )
+    """)
 
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS envio_detalle (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                envio_id INTEGER NOT NULL,
-                inventario_id INTEGER NOT NULL UNIQUE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (envio_id) REFERENCES envios(id) ON DELETE CASCADE,
-                FOREIGN KEY (inventario_id) REFERENCES inventario(id) ON DELETE RESTRICT
-            )
+    # ===== MOVIMIENTOS (ENVÍOS) =====
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS envios (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            folio TEXT UNIQUE NOT NULL,
+            fecha_salida DATE NOT NULL,
+            destino TEXT,
+            descripcion TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS envio_detalle (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            envio_id INTEGER NOT NULL,
+            inventario_id INTEGER NOT NULL UNIQUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (envio_id) REFERENCES envios(id) ON DELETE CASCADE,
+            FOREIGN KEY (inventario_id) REFERENCES inventario(id) ON DELETE RESTRICT
+        )
+    """)
+
+    # ===== TABLA DE SECUENCIAS PARA REFERENCIAS =====
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS secuencias (
+            tipo TEXT PRIMARY KEY,
+            ultimo_numero INTEGER DEFAULT 0
+        )
+    """)
+
+    # ===== ÍNDICES PARA MEJORAR RENDIMIENTO =====
+    # Se crean con migraciones versionadas (ver MIGRACIONES)
+    
+    # ===== CONTADORES PARA MÉTRICAS =====
+    _crear_contadores(cursor)
+
+def _crear_contadores(cursor: sqlite3.Cursor):
+    """
+    Crea las tablas de contadores y los triggers que las mantienen al día,
+    para que las métricas cuesten O(1) sin importar el tamaño del inventario.
+    Si las tablas son nuevas, las inicializa a partir de los datos existentes.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS contadores_inventario (
+            tipo TEXT NOT NULL,
+            estado TEXT NOT NULL,
+            total INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (tipo, estado)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS contadores (
+            clave TEXT PRIMARY KEY,
+            valor INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    """)
+    
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_contadores_inventario_insert
+        AFTER INSERT ON inventario
+        BEGIN
+            UPDATE contadores_inventario SET total = total + 1
+            WHERE tipo = (SELECT tipo FROM productos WHERE id = NEW.producto_id) AND estado = NEW.estado;
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_contadores_inventario_delete
+        AFTER DELETE ON inventario
+        BEGIN
+            UPDATE contadores_inventario SET total = total - 1
+            WHERE tipo = (SELECT tipo FROM productos WHERE id = OLD.producto_id) AND estado = OLD.estado;
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_contadores_inventario_update
+        AFTER UPDATE OF estado, producto_id ON inventario
+        WHEN OLD.estado IS NOT NEW.estado OR OLD.producto_id IS NOT NEW.producto_id
+        BEGIN
+            UPDATE contadores_inventario SET total = total - 1
+            WHERE tipo = (SELECT tipo FROM productos WHERE id = OLD.producto_id) AND estado = OLD.estado;
+            UPDATE contadores_inventario SET total = total + 1
+            WHERE tipo = (SELECT tipo FROM productos WHERE id = NEW.producto_id) AND estado = NEW.estado;
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_contadores_envios_insert
+        AFTER INSERT ON envios
+        BEGIN
+            UPDATE contadores SET valor = valor + 1 WHERE clave = 'envios';
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_contadores_envios_delete
+        AFTER DELETE ON envios
+        BEGIN
+            UPDATE contadores SET valor = valor - 1 WHERE clave = 'envios';
+        END
+    """)
+    
+    cursor.execute("SELECT COUNT(*) FROM contadores_inventario")
+    if cursor.fetchone()[0] == 0:
+        _reconstruir_contadores(cursor)
+
+def _reconstruir_contadores(cursor: sqlite3.Cursor):
+    """Recalcula todos los contadores desde las tablas base (un solo recorrido)"""
+    cursor.execute("""
+        SELECT p.tipo, i.estado, COUNT(*) AS total
+        FROM inventario i
+        JOIN productos p ON i.producto_id = p.id
+        GROUP BY p.tipo, i.estado
+    """)
+    conteos = _agrupar_conteos(cursor.fetchall())
+    
+    cursor.execute("DELETE FROM contadores_inventario")
+    cursor.executemany(
+        "INSERT INTO contadores_inventario (tipo, estado, total) VALUES (?, ?, ?)",
+        [(tipo, estado, conteos[tipo][estado]) for tipo in TIPOS_PRODUCTO for estado in ESTADOS_INVENTARIO]
+    )
+    cursor.execute("""
+        INSERT INTO contadores (clave, valor) VALUES ('envios', (SELECT COUNT(*) FROM envios))
+        ON CONFLICT(clave) DO UPDATE SET valor = excluded.valor
+    """)
+
+# ========== MIGRACIONES ==========
+def _detectar_fts5() -> bool:
+    """Indica si el SQLite enlazado incluye el módulo FTS5"""
+    conn = sqlite3.connect(":memory:")
+    try:
+        conn.execute("CREATE VIRTUAL TABLE prueba USING fts5(texto)")
+        return True
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        conn.close()
+
+_SOPORTA_FTS5 = _detectar_fts5()
+
+def _migracion_indices_fifo(cursor: sqlite3.Cursor):
+    """
+    Índices compuestos y parciales para las consultas FIFO: filtran por
+    producto/estado y ordenan por fecha_ingreso sin ordenar en un B-tree temporal.
+    """
+    # (producto_id, estado, fecha_ingreso, rowid): stock enviable de un producto ya en orden FIFO
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_inventario_producto_estado_fecha
+        ON inventario(producto_id, estado, fecha_ingreso)
+    """)
+    # Unidades disponibles (SDs y dispositivos por configurar, cables enviables) en orden FIFO
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_inventario_disponibles_fecha
+        ON inventario(fecha_ingreso, producto_id) WHERE estado = 'DISPONIBLE'
+    """)
+    # Unidades configuradas (dispositivos y SDs enviables) en orden FIFO
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_inventario_configurados_fecha
+        ON inventario(fecha_ingreso, producto_id) WHERE estado = 'CONFIGURADO'
+    """)
+    # Dispositivos reiniciados pendientes de finalizar
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_disp_config_pendientes
+        ON dispositivo_configuraciones(fecha_config_inicio) WHERE fecha_config_final IS NULL
+    """)
+    # Detalle por envío (get_envios y get_detalle_envio)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_envio_detalle_envio ON envio_detalle(envio_id)")
+    
+    # Redundantes: prefijo del índice compuesto o duplicados de índices UNIQUE
+    cursor.execute("DROP INDEX IF EXISTS idx_inventario_producto")
+    cursor.execute("DROP INDEX IF EXISTS idx_envios_folio")
+    cursor.execute("DROP INDEX IF EXISTS idx_sd_config_inventario")
+    cursor.execute("DROP INDEX IF EXISTS idx_disp_config_inventario")
+    
+    # Estadísticas para que el planificador elija entre los índices nuevos
+    cursor.execute("ANALYZE")
+
+def _migracion_indices_listado(cursor: sqlite3.Cursor):
+    """Índices para el listado paginado del inventario (filtro por estado y orden por fecha)"""
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_inventario_estado_fecha
+        ON inventario(estado, fecha_ingreso)
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_inventario_fecha ON inventario(fecha_ingreso)")
+    
+    # Reemplazado por idx_inventario_estado_fecha
+    cursor.execute("DROP INDEX IF EXISTS idx_inventario_estado")
+    
+    cursor.execute("PRAGMA analysis_limit = 1000")
+    cursor.execute("ANALYZE")
+
+def _migracion_busqueda_texto(cursor: sqlite3.Cursor):
+    """Índices FTS5 (contenido externo) sobre productos y envíos, sincronizados por triggers"""
+    if not _SOPORTA_FTS5:
+        return
+    
+    # Los tokens se indexan sin acentos y con prefijos de 2 y 3 caracteres precalculados
+    opciones = "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'"
+    cursor.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS productos_fts USING fts5(
+            ref_prod, nombre, content = 'productos', content_rowid = 'id', {opciones}
+        )
+    """)
+    cursor.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS envios_fts USING fts5(
+            folio, destino, descripcion, content = 'envios', content_rowid = 'id', {opciones}
+        )
+    """)
+    
+    for tabla, columnas in (('productos', ['ref_prod', 'nombre']),
+                            ('envios', ['folio', 'destino', 'descripcion'])):
+        lista = ", ".join(columnas)
+        nuevos = ", ".join(f"new.{c}" for c in columnas)
+        viejos = ", ".join(f"old.{c}" for c in columnas)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{tabla}_fts_insert
+            AFTER INSERT ON {tabla}
+            BEGIN
+                INSERT INTO {tabla}_fts (rowid, {lista}) VALUES (new.id, {nuevos});
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{tabla}_fts_delete
+            AFTER DELETE ON {tabla}
+            BEGIN
+                INSERT INTO {tabla}_fts ({tabla}_fts, rowid, {lista}) VALUES ('delete', old.id, {viejos});
+            END
         """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{tabla}_fts_update
+            AFTER UPDATE OF {lista} ON {tabla}
+            BEGIN
+                INSERT INTO {tabla}_fts ({tabla}_fts, rowid, {lista}) VALUES ('delete', old.id, {viejos});
+                INSERT INTO {tabla}_fts (rowid, {lista}) VALUES (new.id, {nuevos});
+            END
+        """)
+        # Indexa las filas existentes
+        cursor.execute(f"INSERT INTO {tabla}_fts ({tabla}_fts) VALUES ('rebuild')")
 
-        # ===== TABLA DE SECUENCIAS PARA REFERENCIAS =====
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS secuencias (
-                tipo TEXT PRIMARY KEY,
-                ultimo_numero INTEGER DEFAULT 0
-            )
+def _migracion_generaciones(cursor: sqlite3.Cursor):
+    """
+    Contador de escrituras por tabla, avanzado por triggers. Permite saber qué
+    tablas cambiaron otras conexiones (u otros procesos) sin releer los datos.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS generaciones (
+            tabla TEXT PRIMARY KEY,
+            generacion INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    """)
+    for tabla in ('productos', 'inventario', 'sd_configuraciones',
+                  'dispositivo_configuraciones', 'envios', 'envio_detalle'):
+        cursor.execute("INSERT OR IGNORE INTO generaciones (tabla) VALUES (?)", (tabla,))
+        for evento in ('INSERT', 'UPDATE', 'DELETE'):
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_generaciones_{tabla}_{evento.lower()}
+                AFTER {evento} ON {tabla}
+                BEGIN
+                    UPDATE generaciones SET generacion = generacion + 1 WHERE tabla = '{tabla}';
+                END
+            """)
+
+def _migracion_transiciones(cursor: sqlite3.Cursor):
+    """
+    Historial de cambios de estado (solo se agregan filas). Lo escribe un
+    trigger sobre inventario, así que cubre todas las funciones que cambian
+    el estado. La fecha es la del negocio (reinicio, configuración, salida
+    del envío...), no la del registro, y 'dias' es el tiempo desde el estado
+    anterior (o desde fecha_ingreso en la primera transición).
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS transiciones_inventario (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            inventario_id INTEGER NOT NULL,
+            producto_id INTEGER NOT NULL,
+            estado_anterior TEXT NOT NULL,
+            estado_nuevo TEXT NOT NULL,
+            fecha DATE NOT NULL,
+            dias REAL,
+            registrado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    # Última transición de una unidad (el rowid ordena dentro del índice)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_transiciones_inventario
+        ON transiciones_inventario(inventario_id)
+    """)
+    # Cubre los reportes por rango de fechas sin leer la tabla
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_transiciones_fecha
+        ON transiciones_inventario(fecha, estado_anterior, estado_nuevo, producto_id, dias)
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_transiciones_inventario
+        AFTER UPDATE OF estado ON inventario
+        WHEN OLD.estado IS NOT NEW.estado
+        BEGIN
+            INSERT INTO transiciones_inventario
+                (inventario_id, producto_id, estado_anterior, estado_nuevo, fecha, dias)
+            SELECT NEW.id, NEW.producto_id, OLD.estado, NEW.estado, f.fecha,
+                   julianday(f.fecha) - julianday(COALESCE(
+                       (SELECT t.fecha FROM transiciones_inventario t
+                        WHERE t.inventario_id = NEW.id ORDER BY t.id DESC LIMIT 1),
+                       NEW.fecha_ingreso))
+            FROM (
+                SELECT COALESCE(CASE NEW.estado
+                    WHEN 'REINICIADO' THEN
+                        (SELECT fecha_config_inicio FROM dispositivo_configuraciones WHERE inventario_id = NEW.id)
+                    WHEN 'CONFIGURADO' THEN COALESCE(
+                        (SELECT fecha_config_final FROM dispositivo_configuraciones WHERE inventario_id = NEW.id),
+                        (SELECT config_final FROM sd_configuraciones WHERE inventario_id = NEW.id))
+                    WHEN 'ENVIADO' THEN
+                        (SELECT e.fecha_salida FROM envio_detalle ed JOIN envios e ON e.id = ed.envio_id
+                         WHERE ed.inventario_id = NEW.id)
+                    WHEN 'DEFECTUOSO' THEN date(NEW.fecha_defectuoso)
+                END, date('now')) AS fecha
+            ) f;
+        END
+    """)
+    _reconstruir_transiciones(cursor)
+
+def _reconstruir_transiciones(cursor: sqlite3.Cursor):
+    """
+    Reconstruye la historia a partir de las fechas guardadas en inventario,
+    configuraciones y envíos. Solo actúa si la tabla de transiciones está vacía.
+    """
+    cursor.execute("""
+        INSERT INTO transiciones_inventario
+            (inventario_id, producto_id, estado_anterior, estado_nuevo, fecha, dias)
+        WITH eventos(inventario_id, producto_id, fecha_ingreso, orden, estado, fecha) AS (
+            SELECT i.id, i.producto_id, i.fecha_ingreso, 1, 'REINICIADO', dc.fecha_config_inicio
+            FROM inventario i JOIN dispositivo_configuraciones dc ON dc.inventario_id = i.id
+            UNION ALL
+            SELECT i.id, i.producto_id, i.fecha_ingreso, 2, 'CONFIGURADO', dc.fecha_config_final
+            FROM inventario i JOIN dispositivo_configuraciones dc ON dc.inventario_id = i.id
+            WHERE dc.fecha_config_final IS NOT NULL
+            UNION ALL
+            SELECT i.id, i.producto_id, i.fecha_ingreso, 2, 'CONFIGURADO', sc.config_final
+            FROM inventario i JOIN sd_configuraciones sc ON sc.inventario_id = i.id
+            UNION ALL
+            SELECT i.id, i.producto_id, i.fecha_ingreso, 3, 'ENVIADO', e.fecha_salida
+            FROM inventario i
+            JOIN envio_detalle ed ON ed.inventario_id = i.id
+            JOIN envios e ON e.id = ed.envio_id
+            WHERE i.estado = 'ENVIADO'
+            UNION ALL
+            SELECT i.id, i.producto_id, i.fecha_ingreso, 3, 'DEFECTUOSO', date(i.fecha_defectuoso)
+            FROM inventario i
+            WHERE i.estado = 'DEFECTUOSO' AND i.fecha_defectuoso IS NOT NULL
+        ),
+        ordenados AS (
+            SELECT inventario_id, producto_id, estado, fecha,
+                   LAG(estado, 1, 'DISPONIBLE') OVER w AS estado_anterior,
+                   LAG(fecha, 1, fecha_ingreso) OVER w AS fecha_anterior
+            FROM eventos
+            WINDOW w AS (PARTITION BY inventario_id ORDER BY orden)
+        )
+        SELECT inventario_id, producto_id, estado_anterior, estado, fecha,
+               julianday(fecha) - julianday(fecha_anterior)
+        FROM ordenados
+        WHERE NOT EXISTS (SELECT 1 FROM transiciones_inventario)
+        ORDER BY inventario_id
+    """)
+
+# Fila aplanada de una unidad: inventario + producto + configuraciones
+_SQL_FILAS_INVENTARIO_VISTA = """
+    SELECT
+        i.id,
+        i.producto_id,
+        i.estado,
+        i.fecha_ingreso,
+        i.fecha_defectuoso,
+        i.created_at,
+        p.nombre,
+        p.ref_prod,
+        p.tipo,
+        sc.id,
+        sc.config_final,
+        sc.fecha_configuracion,
+        dc.id,
+        dc.fecha_config_inicio,
+        dc.fecha_config_final,
+        dc.fecha_finalizacion_accion
+    FROM inventario i
+    JOIN productos p ON i.producto_id = p.id
+    LEFT JOIN sd_configuraciones sc ON i.id = sc.inventario_id
+    LEFT JOIN dispositivo_configuraciones dc ON i.id = dc.inventario_id
+"""
+
+def _migracion_inventario_vista(cursor: sqlite3.Cursor):
+    """
+    Modelo de lectura desnormalizado: una fila por unidad con los datos del
+    producto y las fechas de configuración, mantenida por triggers sobre las
+    tablas base. Los listados la leen sin joins, por índices de una sola tabla.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS inventario_vista (
+            id INTEGER PRIMARY KEY,
+            producto_id INTEGER NOT NULL,
+            estado TEXT NOT NULL,
+            fecha_ingreso DATE NOT NULL,
+            fecha_defectuoso TIMESTAMP,
+            created_at TIMESTAMP,
+            producto_nombre TEXT NOT NULL,
+            ref_prod TEXT NOT NULL,
+            tipo TEXT NOT NULL,
+            sd_config_id INTEGER,
+            sd_config_final DATE,
+            sd_fecha_configuracion DATE,
+            disp_config_id INTEGER,
+            disp_fecha_config_inicio DATE,
+            disp_fecha_config_final DATE,
+            disp_fecha_accion TIMESTAMP
+        )
+    """)
+    # Listado por estado y por fecha (paginación por keyset)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_vista_estado_fecha ON inventario_vista(estado, fecha_ingreso)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_vista_fecha ON inventario_vista(fecha_ingreso)")
+    # Stock enviable en orden FIFO por producto o por tipo; también sirve a los cambios de producto
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_vista_producto_estado_fecha
+        ON inventario_vista(producto_id, estado, fecha_ingreso)
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_vista_tipo_estado_fecha
+        ON inventario_vista(tipo, estado, fecha_ingreso)
+    """)
+    
+    # Inventario: alta, cambios y baja de la unidad
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_vista_inventario_insert
+        AFTER INSERT ON inventario
+        BEGIN
+            INSERT INTO inventario_vista (id, producto_id, estado, fecha_ingreso, fecha_defectuoso,
+                                          created_at, producto_nombre, ref_prod, tipo)
+            SELECT NEW.id, NEW.producto_id, NEW.estado, NEW.fecha_ingreso, NEW.fecha_defectuoso,
+                   NEW.created_at, p.nombre, p.ref_prod, p.tipo
+            FROM productos p WHERE p.id = NEW.producto_id;
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_vista_inventario_update
+        AFTER UPDATE ON inventario
+        BEGIN
+            UPDATE inventario_vista SET
+                estado = NEW.estado,
+                fecha_ingreso = NEW.fecha_ingreso,
+                fecha_defectuoso = NEW.fecha_defectuoso,
+                created_at = NEW.created_at
+            WHERE id = NEW.id;
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_vista_inventario_producto
+        AFTER UPDATE OF producto_id ON inventario
+        WHEN OLD.producto_id IS NOT NEW.producto_id
+        BEGIN
+            UPDATE inventario_vista SET
+                (producto_id, producto_nombre, ref_prod, tipo) =
+                (SELECT id, nombre, ref_prod, tipo FROM productos WHERE id = NEW.producto_id)
+            WHERE id = NEW.id;
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_vista_inventario_delete
+        AFTER DELETE ON inventario
+        BEGIN
+            DELETE FROM inventario_vista WHERE id = OLD.id;
+        END
+    """)
+    # Productos: renombrar o cambiar la REF se propaga a sus unidades
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_vista_productos_update
+        AFTER UPDATE OF nombre, ref_prod, tipo ON productos
+        BEGIN
+            UPDATE inventario_vista SET producto_nombre = NEW.nombre, ref_prod = NEW.ref_prod, tipo = NEW.tipo
+            WHERE producto_id = NEW.id;
+        END
+    """)
+    
+    # Configuraciones: una por unidad como máximo (inventario_id UNIQUE)
+    for tabla, prefijo, columnas in (
+        ('sd_configuraciones', 'sd',
+         {'sd_config_final': 'config_final', 'sd_fecha_configuracion': 'fecha_configuracion'}),
+        ('dispositivo_configuraciones', 'disp',
+         {'disp_fecha_config_inicio': 'fecha_config_inicio',
+          'disp_fecha_config_final': 'fecha_config_final',
+          'disp_fecha_accion': 'fecha_finalizacion_accion'}),
+    ):
+        asignar = ", ".join(f"{destino} = NEW.{origen}" for destino, origen in columnas.items())
+        limpiar = ", ".join(f"{destino} = NULL" for destino in columnas)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_vista_{tabla}_insert
+            AFTER INSERT ON {tabla}
+            BEGIN
+                UPDATE inventario_vista SET {prefijo}_config_id = NEW.id, {asignar}
+                WHERE id = NEW.inventario_id;
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_vista_{tabla}_update
+            AFTER UPDATE ON {tabla}
+            BEGIN
+                UPDATE inventario_vista SET {prefijo}_config_id = NULL, {limpiar}
+                WHERE id = OLD.inventario_id AND OLD.inventario_id IS NOT NEW.inventario_id;
+                UPDATE inventario_vista SET {prefijo}_config_id = NEW.id, {asignar}
+                WHERE id = NEW.inventario_id;
+            END
         """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_vista_{tabla}_delete
+            AFTER DELETE ON {tabla}
+            BEGIN
+                UPDATE inventario_vista SET {prefijo}_config_id = NULL, {limpiar}
+                WHERE id = OLD.inventario_id;
+            END
+        """)
+    
+    # Índices de lecturas que ahora usan la vista: solo encarecían las escrituras
+    # (idx_inventario_producto_estado_fecha se queda para la asignación FIFO y los conteos)
+    for indice in ('idx_inventario_estado_fecha', 'idx_inventario_fecha', 'idx_inventario_disponibles_fecha',
+                   'idx_inventario_configurados_fecha', 'idx_disp_config_pendientes'):
+        cursor.execute(f"DROP INDEX IF EXISTS {indice}")
+    
+    _reconstruir_inventario_vista(cursor)
+    cursor.execute("ANALYZE inventario_vista")
 
-        # ===== ÍNDICES PARA MEJORAR RENDIMIENTO =====
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_inventario_estado ON inventario(estado)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_inventario_producto ON inventario(producto_id)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_envios_folio ON envios(folio)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_sd_config_inventario ON sd_configuraciones(inventario_id)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_disp_config_inventario ON dispositivo_configuraciones(inventario_id)")
-        
-        # No hacer commit explícito, el context manager lo hace
+def _reconstruir_inventario_vista(cursor: sqlite3.Cursor):
+    """Vuelve a llenar inventario_vista desde las tablas base (un solo recorrido)"""
+    cursor.execute("DELETE FROM inventario_vista")
+    cursor.execute(f"INSERT INTO inventario_vista {_SQL_FILAS_INVENTARIO_VISTA}")
+
+def _migracion_archivo(cursor: sqlite3.Cursor):
+    """
+    Tablas de archivo para las unidades ENVIADO (ya no cambian) y sus
+    configuraciones, con los mismos id que tenían en las tablas de trabajo.
+    inventario_historial une el modelo de lectura con el archivo aplanado.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS inventario_archivo (
+            id INTEGER PRIMARY KEY,
+            producto_id INTEGER NOT NULL,
+            estado TEXT NOT NULL,
+            fecha_ingreso DATE NOT NULL,
+            fecha_defectuoso TIMESTAMP,
+            created_at TIMESTAMP,
+            archivado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sd_configuraciones_archivo (
+            id INTEGER PRIMARY KEY,
+            inventario_id INTEGER NOT NULL UNIQUE,
+            config_final DATE NOT NULL,
+            fecha_configuracion DATE NOT NULL,
+            imagen_quemada TEXT,
+            created_at TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS dispositivo_configuraciones_archivo (
+            id INTEGER PRIMARY KEY,
+            inventario_id INTEGER NOT NULL UNIQUE,
+            fecha_config_inicio DATE NOT NULL,
+            fecha_config_final DATE,
+            fecha_finalizacion_accion TIMESTAMP,
+            created_at TIMESTAMP
+        )
+    """)
+    
+    # Unidades archivadas por tipo: se suman a ENVIADO en get_conteos_tipo_estado
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS contadores_archivo (
+            tipo TEXT PRIMARY KEY,
+            total INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_contadores_archivo_insert
+        AFTER INSERT ON inventario_archivo
+        BEGIN
+            UPDATE contadores_archivo SET total = total + 1
+            WHERE tipo = (SELECT tipo FROM productos WHERE id = NEW.producto_id);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_contadores_archivo_delete
+        AFTER DELETE ON inventario_archivo
+        BEGIN
+            UPDATE contadores_archivo SET total = total - 1
+            WHERE tipo = (SELECT tipo FROM productos WHERE id = OLD.producto_id);
+        END
+    """)
+    _reconstruir_contadores_archivo(cursor)
+    
+    cursor.execute("""
+        CREATE VIEW IF NOT EXISTS inventario_historial AS
+        SELECT * FROM inventario_vista
+        UNION ALL
+        SELECT
+            a.id,
+            a.producto_id,
+            a.estado,
+            a.fecha_ingreso,
+            a.fecha_defectuoso,
+            a.created_at,
+            p.nombre,
+            p.ref_prod,
+            p.tipo,
+            sc.id,
+            sc.config_final,
+            sc.fecha_configuracion,
+            dc.id,
+            dc.fecha_config_inicio,
+            dc.fecha_config_final,
+            dc.fecha_finalizacion_accion
+        FROM inventario_archivo a
+        JOIN productos p ON a.producto_id = p.id
+        LEFT JOIN sd_configuraciones_archivo sc ON a.id = sc.inventario_id
+        LEFT JOIN dispositivo_configuraciones_archivo dc ON a.id = dc.inventario_id
+    """)
+
+def _reconstruir_contadores_archivo(cursor: sqlite3.Cursor):
+    """Recalcula las unidades archivadas por tipo desde inventario_archivo"""
+    cursor.execute("DELETE FROM contadores_archivo")
+    cursor.executemany("INSERT INTO contadores_archivo (tipo) VALUES (?)", [(tipo,) for tipo in TIPOS_PRODUCTO])
+    cursor.execute("""
+        UPDATE contadores_archivo SET total = (
+            SELECT COUNT(*) FROM inventario_archivo a
+            JOIN productos p ON a.producto_id = p.id
+            WHERE p.tipo = contadores_archivo.tipo
+        )
+    """)
+
+def _migracion_listado_archivo(cursor: sqlite3.Cursor):
+    """
+    inventario_archivo_vista: el archivo aplanado con las columnas de
+    inventario_vista, e índices por fecha para que el listado pagine las
+    unidades archivadas igual que las de la tabla de trabajo.
+    """
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_archivo_fecha ON inventario_archivo(fecha_ingreso)")
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_archivo_producto_fecha
+        ON inventario_archivo(producto_id, fecha_ingreso)
+    """)
+    cursor.execute("""
+        CREATE VIEW IF NOT EXISTS inventario_archivo_vista AS
+        SELECT
+            a.id,
+            a.producto_id,
+            a.estado,
+            a.fecha_ingreso,
+            a.fecha_defectuoso,
+            a.created_at,
+            p.nombre AS producto_nombre,
+            p.ref_prod,
+            p.tipo,
+            sc.id AS sd_config_id,
+            sc.config_final AS sd_config_final,
+            sc.fecha_configuracion AS sd_fecha_configuracion,
+            dc.id AS disp_config_id,
+            dc.fecha_config_inicio AS disp_fecha_config_inicio,
+            dc.fecha_config_final AS disp_fecha_config_final,
+            dc.fecha_finalizacion_accion AS disp_fecha_accion
+        FROM inventario_archivo a
+        JOIN productos p ON a.producto_id = p.id
+        LEFT JOIN sd_configuraciones_archivo sc ON a.id = sc.inventario_id
+        LEFT JOIN dispositivo_configuraciones_archivo dc ON a.id = dc.inventario_id
+    """)
+    cursor.execute("DROP VIEW IF EXISTS inventario_historial")
+    cursor.execute("""
+        CREATE VIEW inventario_historial AS
+        SELECT * FROM inventario_vista
+        UNION ALL
+        SELECT * FROM inventario_archivo_vista
+    """)
+
+def _migracion_indice_envios(cursor: sqlite3.Cursor):
+    """Listado de envíos del más reciente al más antiguo (paginación por keyset)"""
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_envios_fecha_salida ON envios(fecha_salida)")
+
+# Lista ordenada de migraciones: (versión, descripción, función)
+# Nunca modificar una migración publicada; agregar una nueva con la siguiente versión.
+MIGRACIONES = [
+    (1, "Índices compuestos y parciales para consultas FIFO", _migracion_indices_fifo),
+    (2, "Índices para el listado paginado del inventario", _migracion_indices_listado),
+    (3, "Búsqueda de texto completo (FTS5) en productos y envíos", _migracion_busqueda_texto),
+    (4, "Generaciones por tabla para detectar cambios de otras conexiones", _migracion_generaciones),
+    (5, "Historial de transiciones de estado para tiempos de ciclo", _migracion_transiciones),
+    (6, "Modelo de lectura desnormalizado del inventario", _migracion_inventario_vista),
+    (7, "Archivo de unidades enviadas", _migracion_archivo),
+    (8, "Listado paginado del archivo", _migracion_listado_archivo),
+    (9, "Índice para el listado paginado de envíos", _migracion_indice_envios),
+]
+VERSION_ESQUEMA = MIGRACIONES[-1][0]
+
+def _aplicar_migraciones(cursor: sqlite3.Cursor):
+    """Aplica, dentro de la transacción actual, las migraciones posteriores a PRAGMA user_version"""
+    cursor.execute("PRAGMA user_version")
+    version = cursor.fetchone()[0]
+    
+    for numero, _descripcion, migracion in MIGRACIONES:
+        if numero > version:
+            migracion(cursor)
+            cursor.execute(f"PRAGMA user_version = {numero}")
+
+def version_esquema() -> int:
+    """Devuelve la versión de esquema aplicada (PRAGMA user_version)"""
+    with get_connection(read_only=True) as conn:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
 
 # ========== FUNCIONES HELPER ==========
 def format_fecha(fecha: Union[date, str, None]) -> Optional[str]:
@@ -158,49 +1721,160 @@ def validar_fecha_no_futura(fecha: date, nombre_campo: str = "Fecha"):
     if fecha > datetime.now().date():
         raise ValueError(f"{nombre_campo} no puede ser futura")
 
+def _fecha_operacion(fecha: Union[date, str, None], nombre_campo: str) -> date:
+    """Fecha obligatoria de una operación por lotes: date o 'AAAA-MM-DD', y no futura"""
+    valor = parse_fecha(fecha) if isinstance(fecha, (date, str)) else None
+    if valor is None:
+        raise ValueError(f"{nombre_campo} inválida: {fecha}")
+    validar_fecha_no_futura(valor, nombre_campo)
+    return valor
+
 def validar_fechas_ordenadas(fecha_inicio: Optional[date], fecha_fin: Optional[date]):
     """Valida que fecha_inicio <= fecha_fin si ambas existen"""
     if fecha_inicio and fecha_fin and fecha_inicio > fecha_fin:
         raise ValueError("La fecha de inicio no puede ser posterior a la fecha final")
 
-def generar_ref(tipo: str) -> str:
+# ========== RESULTADOS COLUMNARES ==========
+# Categorías conocidas de antemano: el orden es el del negocio
+_CATEGORIAS_COLUMNA = {'estado': ESTADOS_INVENTARIO, 'tipo': TIPOS_PRODUCTO}
+# Texto muy repetido (un valor por producto): se guarda como categoría
+_COLUMNAS_CATEGORICAS = {'ref_prod', 'producto_nombre', 'nombre', 'destino'}
+
+def _es_columna_fecha(nombre: str) -> bool:
+    return 'fecha' in nombre or nombre.endswith('config_final') or nombre == 'created_at'
+
+def _a_dataframe(cursor: sqlite3.Cursor):
     """
-    Genera referencias únicas usando tabla de secuencias.
-    Compatible con SQLite (sin RETURNING en UPDATE).
-    """
-    prefijos = {
-        'DISPOSITIVO': 'DIS',
-        'SD': 'SD',
-        'CABLE_USB': 'USB',
-        'CABLE_ETHERNET': 'ETH',
-        'CABLE_C': 'C'
-    }
-    prefijo = prefijos.get(tipo, 'GEN')
+    Construye un DataFrame columna por columna a partir de un cursor ya
+    ejecutado con row_factory = None (tuplas), sin pasar por diccionarios.
+    estado y tipo quedan como categorías, las fechas como datetime64.
+    """
+    try:
+        import pandas as pd
+    except ImportError:
+        raise ValueError("Para obtener resultados como DataFrame se requiere el paquete pandas")
     
-    with get_connection(read_only=False) as conn:
-        cursor = conn.cursor()
-        
-        # Asegurar que existe el contador para este tipo
-        cursor.execute("""
-            INSERT OR IGNORE INTO secuencias (tipo, ultimo_numero) 
-            VALUES (?, 0)
-        """, (tipo,))
-        
-        # Incrementar el contador y obtener el nuevo valor
+    nombres = [columna[0] for columna in cursor.description]
+    filas = cursor.fetchall()
+    columnas = zip(*filas) if filas else (() for _ in nombres)
+    
+    datos = {}
+    for nombre, valores in zip(nombres, columnas):
+        if nombre in _CATEGORIAS_COLUMNA:
+            datos[nombre] = pd.Categorical(valores, categories=_CATEGORIAS_COLUMNA[nombre])
+        elif nombre in _COLUMNAS_CATEGORICAS:
+            datos[nombre] = pd.Categorical(valores)
+        elif _es_columna_fecha(nombre):
+            # Las fechas se repiten mucho: se convierten solo los valores distintos
+            codigos, distintas = pd.factorize(pd.Series(valores, dtype=object))
+            fechas = pd.DatetimeIndex(pd.to_datetime(distintas, format='ISO8601', errors='coerce'))
+            datos[nombre] = fechas.take(codigos, allow_fill=True, fill_value=pd.NaT)
+        else:
+            datos[nombre] = pd.Series(valores)
+    del filas
+    return pd.DataFrame(datos, columns=nombres)
+
+# ========== SECUENCIAS DE REFERENCIAS ==========
+PREFIJOS_REF = {
+    'DISPOSITIVO': 'DIS',
+    'SD': 'SD',
+    'CABLE_USB': 'USB',
+    'CABLE_ETHERNET': 'ETH',
+    'CABLE_C': 'C'
+}
+SECUENCIA_BLOQUE = 1  # Números reservados por viaje a la BD (>1 deja huecos al reiniciar el proceso)
+
+_SOPORTA_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+def _formatear_ref(tipo: str, numero: int) -> str:
+    return f"{PREFIJOS_REF.get(tipo, 'GEN')}-{numero:03d}"
+
+def _reservar_bloque(cursor: sqlite3.Cursor, tipo: str, cantidad: int) -> int:
+    """
+    Reserva `cantidad` números consecutivos de la secuencia del tipo dentro
+    de la transacción del cursor y devuelve el primero.
+    """
+    if _SOPORTA_RETURNING:
+        # Una sola sentencia: crea el contador si no existe y lo avanza
         cursor.execute("""
-            UPDATE secuencias 
-            SET ultimo_numero = ultimo_numero + 1 
-            WHERE tipo = ?
-        """, (tipo,))
-        
-        # Obtener el nuevo valor
+            INSERT INTO secuencias (tipo, ultimo_numero) VALUES (?, ?)
+            ON CONFLICT(tipo) DO UPDATE SET ultimo_numero = ultimo_numero + excluded.ultimo_numero
+            RETURNING ultimo_numero
+        """, (tipo, cantidad))
+        ultimo = cursor.fetchall()[0][0]
+    else:
+        cursor.execute("INSERT OR IGNORE INTO secuencias (tipo, ultimo_numero) VALUES (?, 0)", (tipo,))
+        cursor.execute("UPDATE secuencias SET ultimo_numero = ultimo_numero + ? WHERE tipo = ?", (cantidad, tipo))
         cursor.execute("SELECT ultimo_numero FROM secuencias WHERE tipo = ?", (tipo,))
-        resultado = cursor.fetchone()
-        nuevo_num = resultado['ultimo_numero'] if resultado else 1
-        
-    return f"{prefijo}-{nuevo_num:03d}"
+        ultimo = cursor.fetchone()[0]
+    return ultimo - cantidad + 1
+
+class _AsignadorSecuencias:
+    """
+    Reparte en memoria números de secuencia reservados por bloques.
+    Fuera de una transacción reserva max(n, bloque) números de una vez y
+    guarda el sobrante. Dentro de la transacción de quien llama reserva
+    solo lo necesario: un rollback devolvería los números a la BD y no
+    deben quedar reservados en memoria.
+    """
+    def __init__(self, bloque: int = SECUENCIA_BLOQUE):
+        self.bloque = bloque
+        self._reservas: Dict[tuple, List[int]] = {}  # (db, tipo) -> [siguiente, ultimo]
+        self._lock = threading.Lock()
+
+    def tomar(self, tipo: str, cantidad: int = 1, cursor: Optional[sqlite3.Cursor] = None) -> List[int]:
+        clave = (DB_NAME, tipo)
+        with self._lock:
+            numeros = []
+            reserva = self._reservas.get(clave)
+            if reserva:
+                hasta = min(reserva[1], reserva[0] + cantidad - 1)
+                numeros.extend(range(reserva[0], hasta + 1))
+                reserva[0] = hasta + 1
+                if reserva[0] > reserva[1]:
+                    del self._reservas[clave]
+            
+            faltan = cantidad - len(numeros)
+            if faltan > 0:
+                if cursor is not None:
+                    primero = _reservar_bloque(cursor, tipo, faltan)
+                else:
+                    # En el escritor agrupado también se está dentro de una transacción
+                    en_lote = getattr(_hilo_escritor, 'conn', None) is not None
+                    tamano = faltan if en_lote else max(faltan, self.bloque)
+                    with get_connection(read_only=False) as conn:
+                        primero = _reservar_bloque(conn.cursor(), tipo, tamano)
+                    if tamano > faltan:
+                        self._reservas[clave] = [primero + faltan, primero + tamano - 1]
+                numeros.extend(range(primero, primero + faltan))
+            return numeros
+
+    def descartar(self):
+        with self._lock:
+            self._reservas.clear()
+
+_asignador = _AsignadorSecuencias()
+
+@escritura("secuencias")
+def reservar_refs(tipo: str, cantidad: int) -> List[str]:
+    """Reserva un bloque de referencias consecutivas con un solo UPDATE"""
+    if cantidad <= 0:
+        raise ValueError("La cantidad debe ser positiva")
+    return [_formatear_ref(tipo, n) for n in _asignador.tomar(tipo, cantidad)]
+
+@escritura("secuencias")
+def generar_ref(tipo: str) -> str:
+    """
+    Genera referencias únicas usando tabla de secuencias.
+    Los números se reservan en bloques de SECUENCIA_BLOQUE.
+    """
+    return _formatear_ref(tipo, _asignador.tomar(tipo, 1)[0])
 
 # ========== FUNCIONES ESPECIALIZADAS DE STOCK ==========
+# Las lecturas de unidades usan inventario_vista (ver _migracion_inventario_vista)
+_COLUMNAS_UNIDAD = "id, producto_id, estado, fecha_ingreso, fecha_defectuoso, created_at, producto_nombre, ref_prod"
+
+@cache_consulta("inventario", "productos", "sd_configuraciones", "dispositivo_configuraciones")
 def obtener_items_para_envio(producto_id: Optional[int] = None, tipo: Optional[str] = None) -> List[Dict[str, Any]]:
     """
     Obtiene items que están listos para ser enviados.
@@ -210,123 +1884,211 @@ def obtener_items_para_envio(producto_id: Optional[int] = None, tipo: Optional[s
         cursor = conn.cursor()
         
         query = """
-            SELECT i.*, p.nombre as producto_nombre, p.ref_prod, p.tipo,
-                dc.fecha_config_inicio, dc.fecha_config_final as disp_fecha_config_final,
-                sc.config_final as sd_config_final
-            FROM inventario i
-            JOIN productos p ON i.producto_id = p.id
-            LEFT JOIN sd_configuraciones sc ON i.id = sc.inventario_id
-            LEFT JOIN dispositivo_configuraciones dc ON i.id = dc.inventario_id
-            WHERE (
-                -- Dispositivos: solo CONFIGURADOS pueden enviarse
-                (p.tipo = 'DISPOSITIVO' AND i.estado = 'CONFIGURADO')
-                OR
-                -- SDs: solo CONFIGURADAS pueden enviarse
-                (p.tipo = 'SD' AND i.estado = 'CONFIGURADO')
-                OR
-                -- Cables: cualquier DISPONIBLE puede enviarse
-                (p.tipo IN ('CABLE_USB', 'CABLE_ETHERNET', 'CABLE_C') AND i.estado = 'DISPONIBLE')
-            )
+            SELECT id, producto_id, estado, fecha_ingreso, fecha_defectuoso, created_at,
+                producto_nombre, ref_prod, tipo,
+                disp_fecha_config_inicio as fecha_config_inicio, disp_fecha_config_final,
+                sd_config_final
+            FROM inventario_vista
+            -- Dispositivos y SDs: solo CONFIGURADOS pueden enviarse
+            -- Cables: cualquier DISPONIBLE puede enviarse
+            WHERE estado = CASE WHEN tipo IN ('DISPOSITIVO', 'SD')
+                                THEN 'CONFIGURADO' ELSE 'DISPONIBLE' END
         """
         
-        params = []
-        
+        # El estado enviable como constante, para recorrer el índice (…, estado, fecha_ingreso)
         if producto_id:
-            query += " AND i.producto_id = ?"
-            params.append(producto_id)
+            query += """
+                AND producto_id = ?
+                AND estado = (SELECT CASE WHEN tipo IN ('DISPOSITIVO', 'SD')
+                                          THEN 'CONFIGURADO' ELSE 'DISPONIBLE' END
+                              FROM productos WHERE id = ?)
+            """
+            params = [producto_id, producto_id]
         elif tipo:
-            query += " AND p.tipo = ?"
-            params.append(tipo)
+            query += " AND tipo = ? AND estado = ?"
+            params = [tipo, 'CONFIGURADO' if tipo in ('DISPOSITIVO', 'SD') else 'DISPONIBLE']
+        else:
+            query += " AND estado IN ('CONFIGURADO', 'DISPONIBLE')"
+            params = []
         
-        query += " ORDER BY i.fecha_ingreso ASC"  # FIFO
+        query += " ORDER BY fecha_ingreso ASC, id ASC"  # FIFO
         
         cursor.execute(query, params)
         return [dict(row) for row in cursor.fetchall()]
 
-def obtener_sds_para_configurar() -> List[Dict[str, Any]]:
+@cache_consulta("inventario", "productos")
+def contar_stock_para_envio(producto_id: Optional[int] = None) -> Dict[int, int]:
     """
-    Obtiene SDs disponibles para configurar.
-    Verifica que no tengan ya una configuración asociada.
+    Cuenta las unidades listas para envío por producto ({producto_id: cantidad}),
+    incluidos los productos sin stock. Misma condición que obtener_items_para_envio,
+    pero sin traer las filas: cada conteo se resuelve en el índice (producto_id, estado).
     """
     with get_connection(read_only=True) as conn:
         cursor = conn.cursor()
+        query = """
+            SELECT p.id, COUNT(i.id) AS cantidad
+            FROM productos p
+            LEFT JOIN inventario i
+                ON i.producto_id = p.id
+               AND i.estado = CASE WHEN p.tipo IN ('DISPOSITIVO', 'SD')
+                                   THEN 'CONFIGURADO' ELSE 'DISPONIBLE' END
+        """
+        params = []
+        if producto_id is not None:
+            query += " WHERE p.id = ?"
+            params.append(producto_id)
+        query += " GROUP BY p.id"
         
-        cursor.execute("""
-            SELECT i.*, p.nombre as producto_nombre, p.ref_prod
-            FROM inventario i
-            JOIN productos p ON i.producto_id = p.id
-            LEFT JOIN sd_configuraciones sc ON i.id = sc.inventario_id
-            WHERE p.tipo = 'SD' 
-              AND i.estado = 'DISPONIBLE'
-              AND sc.id IS NULL
-            ORDER BY i.fecha_ingreso ASC
-        """)
-        
-        return [dict(row) for row in cursor.fetchall()]
+        cursor.execute(query, params)
+        return {row['id']: row['cantidad'] for row in cursor.fetchall()}
 
-def obtener_dispositivos_para_reiniciar() -> List[Dict[str, Any]]:
+# Unidades que admite cada transición: condición sobre inventario_vista, orden y columnas extra
+_SELECCIONES_UNIDADES = {
+    'sd_configurar': (
+        "tipo = 'SD' AND estado = 'DISPONIBLE' AND sd_config_id IS NULL",
+        "fecha_ingreso ASC, id ASC", ""),
+    'dispositivo_reiniciar': (
+        "tipo = 'DISPOSITIVO' AND estado = 'DISPONIBLE' AND disp_config_id IS NULL",
+        "fecha_ingreso ASC, id ASC", ""),
+    'dispositivo_finalizar': (
+        "tipo = 'DISPOSITIVO' AND estado = 'REINICIADO' AND disp_config_id IS NOT NULL AND disp_fecha_config_final IS NULL",
+        "disp_fecha_config_inicio DESC, id ASC", ", disp_fecha_config_inicio AS fecha_config_inicio"),
+}
+OPCIONES_POR_SELECTOR = 100  # Máximo de opciones que devuelve un selector con búsqueda
+
+@cache_consulta("inventario", "productos", "sd_configuraciones", "dispositivo_configuraciones")
+def buscar_unidades_seleccionables(seleccion: str, texto: Optional[str] = None,
+                                   limite: Optional[int] = OPCIONES_POR_SELECTOR) -> Dict[str, Any]:
     """
-    Obtiene dispositivos disponibles para iniciar reinicio.
+    Unidades que admite una transición ('sd_configurar', 'dispositivo_reiniciar'
+    o 'dispositivo_finalizar'), filtradas por ID exacto, REF o nombre.
+    Devuelve {'filas', 'total'}: como máximo `limite` filas (None: todas) y
+    el total de coincidencias, para selectores que no listan miles de opciones.
     """
+    if seleccion not in _SELECCIONES_UNIDADES:
+        raise ValueError(f"Selección inválida: {seleccion}")
+    if limite is not None and limite <= 0:
+        raise ValueError("El límite debe ser positivo")
+    condicion, orden, columnas_extra = _SELECCIONES_UNIDADES[seleccion]
+    
+    condiciones = [condicion]
+    params: List[Any] = []
+    texto = (texto or "").strip()
+    if texto:
+        filtro, params_filtro = _filtros_productos(None, texto)
+        if texto.isdigit():
+            filtro = f"(i.id = ? OR {filtro})"
+            params_filtro = [int(texto)] + params_filtro
+        condiciones.append(filtro)
+        params.extend(params_filtro)
+    where = " AND ".join(condiciones)
+    
     with get_connection(read_only=True) as conn:
         cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT i.*, p.nombre as producto_nombre, p.ref_prod
-            FROM inventario i
-            JOIN productos p ON i.producto_id = p.id
-            LEFT JOIN dispositivo_configuraciones dc ON i.id = dc.inventario_id
-            WHERE p.tipo = 'DISPOSITIVO' 
-              AND i.estado = 'DISPONIBLE'
-              AND dc.id IS NULL
-            ORDER BY i.fecha_ingreso ASC
-        """)
-        
-        return [dict(row) for row in cursor.fetchall()]
+        cursor.execute(f"""
+            SELECT {_COLUMNAS_UNIDAD}{columnas_extra}
+            FROM inventario_vista i
+            WHERE {where}
+            ORDER BY {orden}
+            {'LIMIT ?' if limite is not None else ''}
+        """, params + ([limite] if limite is not None else []))
+        filas = [dict(row) for row in cursor.fetchall()]
+        
+        total = len(filas)
+        if limite is not None and total == limite:
+            cursor.execute(f"SELECT COUNT(*) FROM inventario_vista i WHERE {where}", params)
+            total = cursor.fetchone()[0]
+        
+        return {'filas': filas, 'total': total}
+
+@cache_consulta("inventario", "productos", "sd_configuraciones", "dispositivo_configuraciones")
+def ids_unidades_seleccionables(seleccion: str) -> List[int]:
+    """IDs de todas las unidades que admite una transición, sin el resto de la fila"""
+    if seleccion not in _SELECCIONES_UNIDADES:
+        raise ValueError(f"Selección inválida: {seleccion}")
+    condicion, orden, _columnas_extra = _SELECCIONES_UNIDADES[seleccion]
+    with get_connection(read_only=True) as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        cursor.execute(f"SELECT i.id FROM inventario_vista i WHERE {condicion} ORDER BY {orden}")
+        return [fila[0] for fila in cursor.fetchall()]
+
+@cache_consulta("inventario", "productos", "sd_configuraciones")
+def obtener_sds_para_configurar() -> List[Dict[str, Any]]:
+    """
+    Obtiene SDs disponibles para configurar.
+    Verifica que no tengan ya una configuración asociada.
+    """
+    return buscar_unidades_seleccionables.sin_cache('sd_configurar', limite=None)['filas']
 
+@cache_consulta("inventario", "productos", "dispositivo_configuraciones")
+def obtener_dispositivos_para_reiniciar() -> List[Dict[str, Any]]:
+    """
+    Obtiene dispositivos disponibles para iniciar reinicio.
+    """
+    return buscar_unidades_seleccionables.sin_cache('dispositivo_reiniciar', limite=None)['filas']
+
+@cache_consulta("inventario", "productos", "dispositivo_configuraciones")
 def obtener_dispositivos_reiniciados() -> List[Dict[str, Any]]:
     """
     Obtiene dispositivos en estado REINICIADO para finalizar configuración.
     """
-    with get_connection(read_only=True) as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT i.*, p.nombre as producto_nombre, p.ref_prod,
-                   dc.fecha_config_inicio
-            FROM inventario i
-            JOIN productos p ON i.producto_id = p.id
-            JOIN dispositivo_configuraciones dc ON i.id = dc.inventario_id
-            WHERE p.tipo = 'DISPOSITIVO' 
-              AND i.estado = 'REINICIADO'
-              AND dc.fecha_config_final IS NULL
-            ORDER BY dc.fecha_config_inicio DESC
-        """)
-        return [dict(row) for row in cursor.fetchall()]
+    return buscar_unidades_seleccionables.sin_cache('dispositivo_finalizar', limite=None)['filas']
 
 # ========== GESTIÓN DE PRODUCTOS ==========
+@escritura("productos", "secuencias")
 def crear_producto(tipo: str, nombre: Optional[str] = None, ref: Optional[str] = None) -> int:
     """Crea un nuevo producto en el catálogo"""
-    if tipo not in ['DISPOSITIVO', 'SD', 'CABLE_USB', 'CABLE_ETHERNET', 'CABLE_C']:
-        raise ValueError(f"Tipo de producto inválido: {tipo}")
-    
-    if ref is None:
-        ref = generar_ref(tipo)
-    if nombre is None:
-        nombre = f"{tipo}"
+    return crear_productos([{'tipo': tipo, 'nombre': nombre, 'ref': ref}])[0]
+
+@escritura("productos", "secuencias")
+def crear_productos(productos: List[Dict[str, Any]]) -> List[int]:
+    """
+    Crea varios productos en una sola transacción.
+    productos: lista de diccionarios con 'tipo' y opcionalmente 'nombre' y 'ref'.
+    Las referencias faltantes se reservan con un solo UPDATE por tipo.
+    """
+    for producto in productos:
+        if producto.get('tipo') not in TIPOS_PRODUCTO:
+            raise ValueError(f"Tipo de producto inválido: {producto.get('tipo')}")
     
     with get_connection(read_only=False) as conn:
         cursor = conn.cursor()
-        try:
-            cursor.execute("""
-                INSERT INTO productos (ref_prod, tipo, nombre)
-                VALUES (?, ?, ?)
-            """, (ref, tipo, nombre))
-            return cursor.lastrowid
-        except sqlite3.IntegrityError as e:
-            if "UNIQUE constraint failed" in str(e):
-                raise ValueError(f"Ya existe un producto con REF '{ref}'")
-            raise ValueError(f"Error de integridad en BD: {str(e)}")
+        
+        # Reservar las referencias que falten, un bloque por tipo
+        sin_ref: Dict[str, int] = {}
+        for producto in productos:
+            if producto.get('ref') is None:
+                sin_ref[producto['tipo']] = sin_ref.get(producto['tipo'], 0) + 1
+        refs_reservadas = {
+            tipo: iter(_asignador.tomar(tipo, cantidad, cursor))
+            for tipo, cantidad in sin_ref.items()
+        }
+        
+        ids = []
+        for producto in productos:
+            tipo = producto['tipo']
+            ref = producto.get('ref')
+            if ref is None:
+                ref = _formatear_ref(tipo, next(refs_reservadas[tipo]))
+            nombre = producto.get('nombre')
+            if nombre is None:
+                nombre = f"{tipo}"
+            
+            try:
+                cursor.execute("""
+                    INSERT INTO productos (ref_prod, tipo, nombre)
+                    VALUES (?, ?, ?)
+                """, (ref, tipo, nombre))
+            except sqlite3.IntegrityError as e:
+                if "UNIQUE constraint failed" in str(e):
+                    raise ValueError(f"Ya existe un producto con REF '{ref}'")
+                raise ValueError(f"Error de integridad en BD: {str(e)}")
+            ids.append(cursor.lastrowid)
+        
+        return ids
 
+@cache_consulta("productos")
 def get_productos() -> List[Dict[str, Any]]:
     """Obtiene todos los productos del catálogo"""
     with get_connection(read_only=True) as conn:
@@ -334,112 +2096,487 @@ def get_productos() -> List[Dict[str, Any]]:
         cursor.execute("SELECT * FROM productos ORDER BY tipo, nombre")
         return [dict(row) for row in cursor.fetchall()]
 
-def verificar_producto_existe(producto_id: int) -> bool:
-    """Verifica si un producto existe en el catálogo"""
+@cache_consulta("productos")
+def verificar_producto_existe(producto_id: int) -> bool:
+    """Verifica si un producto existe en el catálogo"""
+    with get_connection(read_only=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id FROM productos WHERE id = ?", (producto_id,))
+        return cursor.fetchone() is not None
+
+# ========== GESTIÓN DE INVENTARIO ==========
+@escritura("inventario")
+def agregar_item_a_inventario(producto_id: int, cantidad: int, fecha_ingreso=None) -> List[int]:
+    """Agrega múltiples unidades de un producto al inventario"""
+    return agregar_items_a_inventario([
+        {'producto_id': producto_id, 'cantidad': cantidad, 'fecha_ingreso': fecha_ingreso}
+    ])
+
+@escritura("inventario")
+def agregar_items_a_inventario(entradas: List[Dict[str, Any]]) -> List[int]:
+    """
+    Agrega stock de varios productos en una sola transacción.
+    entradas: lista de diccionarios con 'producto_id', 'cantidad' y
+    opcionalmente 'fecha_ingreso' (por defecto hoy).
+    """
+    filas = [_normalizar_entrada_stock(e['producto_id'], e['cantidad'], e.get('fecha_ingreso')) for e in entradas]
+    
+    with get_connection(read_only=False) as conn:
+        cursor = conn.cursor()
+        
+        # Validar todos los productos del lote con una sola consulta
+        faltantes = _productos_inexistentes(cursor, [f[0] for f in filas])
+        if faltantes:
+            raise ValueError(f"El producto con ID {faltantes[0]} no existe")
+        
+        return _insertar_stock(cursor, filas)
+
+def _normalizar_entrada_stock(producto_id: int, cantidad: int, fecha_ingreso=None) -> tuple:
+    """Valida una entrada de stock y la devuelve como (producto_id, cantidad, fecha_str)"""
+    if cantidad <= 0:
+        raise ValueError("La cantidad debe ser positiva")
+    
+    if fecha_ingreso is None:
+        fecha_ingreso = datetime.now().date()
+    else:
+        if isinstance(fecha_ingreso, datetime):
+            fecha_ingreso = fecha_ingreso.date()
+        elif isinstance(fecha_ingreso, str):
+            fecha_ingreso = parse_fecha(format_fecha(fecha_ingreso))
+        validar_fecha_no_futura(fecha_ingreso, "Fecha de ingreso")
+    
+    return (producto_id, cantidad, format_fecha(fecha_ingreso))
+
+def _productos_inexistentes(cursor: sqlite3.Cursor, producto_ids: List[int]) -> List[int]:
+    """Devuelve, en orden, los IDs de producto que no existen en el catálogo"""
+    unicos = list(dict.fromkeys(producto_ids))
+    existentes = set()
+    for i in range(0, len(unicos), 500):
+        bloque = unicos[i:i + 500]
+        cursor.execute(
+            f"SELECT id FROM productos WHERE id IN ({', '.join('?' * len(bloque))})", bloque
+        )
+        existentes.update(row[0] for row in cursor.fetchall())
+    return [pid for pid in unicos if pid not in existentes]
+
+def _insertar_stock(cursor: sqlite3.Cursor, filas: List[tuple]) -> List[int]:
+    """
+    Inserta (producto_id, cantidad, fecha_str) con una sentencia por fila de
+    entrada, generando las unidades con un CTE recursivo. Dentro de la
+    transacción exclusiva los IDs AUTOINCREMENT de cada sentencia son consecutivos.
+    """
+    ids_generados = []
+    for producto_id, cantidad, fecha in filas:
+        cursor.execute("""
+            INSERT INTO inventario (producto_id, fecha_ingreso, estado)
+            WITH RECURSIVE unidades(n) AS (
+                SELECT 1 UNION ALL SELECT n + 1 FROM unidades WHERE n < ?
+            )
+            SELECT ?, ?, 'DISPONIBLE' FROM unidades
+        """, (cantidad, producto_id, fecha))
+        ultimo = cursor.lastrowid
+        ids_generados.extend(range(ultimo - cantidad + 1, ultimo + 1))
+    return ids_generados
+
+# ========== IMPORTACIÓN MASIVA DE STOCK ==========
+IMPORTACION_FILAS_POR_LOTE = 500
+
+def _leer_filas_csv(archivo) -> Iterator[Dict[str, Any]]:
+    """Lee un CSV (ruta o archivo abierto) fila por fila sin cargarlo completo"""
+    if isinstance(archivo, str):
+        with open(archivo, newline='', encoding='utf-8-sig') as f:
+            yield from csv.DictReader(f)
+        return
+    if isinstance(archivo.read(0), bytes):
+        archivo = io.TextIOWrapper(archivo, encoding='utf-8-sig', newline='')
+    yield from csv.DictReader(archivo)
+
+def _leer_filas_excel(archivo) -> Iterator[Dict[str, Any]]:
+    """Lee la primera hoja de un Excel en modo streaming (requiere openpyxl)"""
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError("Para importar archivos Excel se requiere el paquete openpyxl")
+    
+    libro = load_workbook(archivo, read_only=True, data_only=True)
+    try:
+        filas = libro.worksheets[0].iter_rows(values_only=True)
+        encabezados = [str(c).strip() if c is not None else '' for c in next(filas, ())]
+        for valores in filas:
+            if any(v is not None for v in valores):
+                yield dict(zip(encabezados, valores))
+    finally:
+        libro.close()
+
+def _procesar_lote_importacion(lote: List[tuple], errores: List[Dict[str, Any]]) -> tuple:
+    """Valida e inserta un lote de filas (numero_fila, fila) en una transacción"""
+    with get_connection(read_only=False) as conn:
+        cursor = conn.cursor()
+        
+        # Resolver todas las referencias del lote con una sola consulta
+        refs = list({str(fila.get('ref_prod') or '').strip() for _, fila in lote})
+        cursor.execute(
+            f"SELECT ref_prod, id FROM productos WHERE ref_prod IN ({', '.join('?' * len(refs))})", refs
+        )
+        ids_por_ref = {row['ref_prod']: row['id'] for row in cursor.fetchall()}
+        
+        filas = []
+        for numero, fila in lote:
+            ref = str(fila.get('ref_prod') or '').strip()
+            try:
+                if ref not in ids_por_ref:
+                    raise ValueError(f"No existe un producto con REF '{ref}'")
+                try:
+                    cantidad = int(fila.get('cantidad'))
+                except (TypeError, ValueError):
+                    raise ValueError(f"Cantidad inválida: {fila.get('cantidad')}")
+                fecha = fila.get('fecha_ingreso')
+                if isinstance(fecha, str):
+                    fecha = fecha.strip() or None
+                filas.append(_normalizar_entrada_stock(ids_por_ref[ref], cantidad, fecha))
+            except ValueError as e:
+                errores.append({'fila': numero, 'ref_prod': ref, 'error': str(e)})
+        
+        _insertar_stock(cursor, filas)
+        return len(filas), sum(f[1] for f in filas)
+
+@escritura("inventario", agrupable=False)  # Confirma por lotes
+def importar_stock(archivo, formato: Optional[str] = None,
+                   filas_por_lote: int = IMPORTACION_FILAS_POR_LOTE,
+                   al_terminar_lote: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """
+    Importa stock desde un CSV o Excel con columnas ref_prod, cantidad y
+    fecha_ingreso (opcional). Lee el archivo en streaming y confirma cada
+    lote de `filas_por_lote` filas en su propia transacción.
+    Las filas inválidas se omiten y se reportan en 'errores'.
+    al_terminar_lote recibe las métricas de cada lote al confirmarse.
+    """
+    if formato is None:
+        nombre = archivo if isinstance(archivo, str) else getattr(archivo, 'name', '')
+        formato = 'excel' if str(nombre).lower().endswith(('.xlsx', '.xlsm')) else 'csv'
+    if formato not in ('csv', 'excel'):
+        raise ValueError(f"Formato de importación no soportado: {formato}")
+    if filas_por_lote <= 0:
+        raise ValueError("El tamaño de lote debe ser positivo")
+    
+    lector = _leer_filas_excel(archivo) if formato == 'excel' else _leer_filas_csv(archivo)
+    
+    reporte = {'filas': 0, 'unidades': 0, 'segundos': 0.0, 'lotes': [], 'errores': []}
+    
+    def confirmar(lote):
+        inicio = time.perf_counter()
+        filas, unidades = _procesar_lote_importacion(lote, reporte['errores'])
+        segundos = time.perf_counter() - inicio
+        metricas_lote = {
+            'lote': len(reporte['lotes']) + 1,
+            'filas': filas,
+            'unidades': unidades,
+            'segundos': segundos,
+            'unidades_por_segundo': unidades / segundos if segundos > 0 else 0.0,
+        }
+        reporte['lotes'].append(metricas_lote)
+        reporte['filas'] += filas
+        reporte['unidades'] += unidades
+        reporte['segundos'] += segundos
+        if al_terminar_lote:
+            al_terminar_lote(metricas_lote)
+    
+    lote = []
+    for numero, fila in enumerate(lector, start=2):  # La fila 1 es el encabezado
+        lote.append((numero, fila))
+        if len(lote) >= filas_por_lote:
+            confirmar(lote)
+            lote = []
+    if lote:
+        confirmar(lote)
+    
+    return reporte
+
+_COLUMNAS_LISTADO = """
+    id,
+    estado,
+    fecha_ingreso,
+    fecha_defectuoso,
+
+    producto_nombre,
+    ref_prod,
+    tipo,
+
+    sd_config_final,
+
+    disp_fecha_config_inicio,
+    disp_fecha_config_final,
+    disp_fecha_accion
+"""
+
+_SQL_TODO_EL_INVENTARIO = f"""
+    SELECT {_COLUMNAS_LISTADO}
+    FROM inventario_historial
+    ORDER BY 
+        CASE estado 
+            WHEN 'DISPONIBLE' THEN 1
+            WHEN 'REINICIADO' THEN 2
+            WHEN 'CONFIGURADO' THEN 3
+            WHEN 'ENVIADO' THEN 4
+            ELSE 5
+        END,
+        fecha_ingreso DESC
+"""
+
+@cache_consulta("inventario", "productos", "sd_configuraciones", "dispositivo_configuraciones")
+def obtener_todo_el_inventario() -> List[Dict[str, Any]]:
+    """Obtiene todo el inventario con información relacionada (incluye las unidades archivadas)"""
+    with get_connection(read_only=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute(_SQL_TODO_EL_INVENTARIO)
+        return [dict(row) for row in cursor.fetchall()]
+
+# ========== BÚSQUEDA DE TEXTO ==========
+BUSQUEDA_LIMITE = 20
+
+def _consulta_fts(texto: str) -> Optional[str]:
+    """
+    Convierte el texto del usuario en una consulta FTS5 de prefijos:
+    'nbx-20' → '"nbx"* AND "20"*'. Devuelve None si no contiene términos.
+    """
+    terminos = re.findall(r"\w+", texto or "")
+    if not terminos:
+        return None
+    return " AND ".join(f'"{t}"*' for t in terminos)
+
+@cache_consulta("productos")
+def buscar_productos(texto: str, limite: int = BUSQUEDA_LIMITE) -> List[Dict[str, Any]]:
+    """
+    Busca productos por REF o nombre (coincidencia por prefijo de palabra),
+    ordenados por relevancia.
+    """
+    consulta = _consulta_fts(texto)
+    if consulta is None:
+        return []
+    with get_connection(read_only=True) as conn:
+        cursor = conn.cursor()
+        if _SOPORTA_FTS5:
+            cursor.execute("""
+                SELECT p.*
+                FROM productos_fts f
+                JOIN productos p ON p.id = f.rowid
+                WHERE productos_fts MATCH ?
+                ORDER BY f.rank
+                LIMIT ?
+            """, (consulta, limite))
+        else:
+            patron = f"%{texto.strip()}%"
+            cursor.execute("""
+                SELECT * FROM productos
+                WHERE ref_prod LIKE ? OR nombre LIKE ?
+                ORDER BY tipo, nombre
+                LIMIT ?
+            """, (patron, patron, limite))
+        return [dict(row) for row in cursor.fetchall()]
+
+@cache_consulta("envios", "envio_detalle")
+def buscar_envios(texto: str, limite: int = BUSQUEDA_LIMITE) -> List[Dict[str, Any]]:
+    """
+    Busca envíos por folio, destino o descripción (coincidencia por prefijo
+    de palabra), ordenados por relevancia. Mismas columnas que get_envios().
+    """
+    consulta = _consulta_fts(texto)
+    if consulta is None:
+        return []
+    with get_connection(read_only=True) as conn:
+        cursor = conn.cursor()
+        if _SOPORTA_FTS5:
+            cursor.execute("""
+                WITH coincidencias AS (
+                    SELECT rowid AS id, rank FROM envios_fts
+                    WHERE envios_fts MATCH ?
+                    ORDER BY rank
+                    LIMIT ?
+                )
+                SELECT e.*,
+                       (SELECT COUNT(*) FROM envio_detalle ed WHERE ed.envio_id = e.id) as total_items
+                FROM coincidencias c
+                JOIN envios e ON e.id = c.id
+                ORDER BY c.rank
+            """, (consulta, limite))
+        else:
+            patron = f"%{texto.strip()}%"
+            cursor.execute("""
+                SELECT e.*,
+                       (SELECT COUNT(*) FROM envio_detalle ed WHERE ed.envio_id = e.id) as total_items
+                FROM envios e
+                WHERE e.folio LIKE ? OR e.destino LIKE ? OR e.descripcion LIKE ?
+                ORDER BY e.fecha_salida DESC, e.id DESC
+                LIMIT ?
+            """, (patron, patron, patron, limite))
+        return [dict(row) for row in cursor.fetchall()]
+
+@cache_consulta("envios")
+def contar_envios(texto: str) -> int:
+    """Total de envíos que coinciden con la búsqueda de buscar_envios, sin límite"""
+    consulta = _consulta_fts(texto)
+    if consulta is None:
+        return 0
     with get_connection(read_only=True) as conn:
         cursor = conn.cursor()
-        cursor.execute("SELECT id FROM productos WHERE id = ?", (producto_id,))
-        return cursor.fetchone() is not None
-
-# ========== GESTIÓN DE INVENTARIO ==========
-def agregar_item_a_inventario(producto_id: int, cantidad: int, fecha_ingreso=None) -> List[int]:
-    """Agrega múltiples unidades de un producto al inventario"""
-    # Validaciones
-    if cantidad <= 0:
-        raise ValueError("La cantidad debe ser positiva")
-    
-    if not verificar_producto_existe(producto_id):
-        raise ValueError(f"El producto con ID {producto_id} no existe")
-    
-    if fecha_ingreso is None:
-        fecha_ingreso = datetime.now().date()
-    else:
-        validar_fecha_no_futura(fecha_ingreso, "Fecha de ingreso")
-    
-    ids_generados = []
-    with get_connection(read_only=False) as conn:
-        cursor = conn.cursor()
-        
-        for _ in range(cantidad):
+        if _SOPORTA_FTS5:
+            cursor.execute("SELECT COUNT(*) FROM envios_fts WHERE envios_fts MATCH ?", (consulta,))
+        else:
+            patron = f"%{texto.strip()}%"
             cursor.execute("""
-                INSERT INTO inventario (producto_id, fecha_ingreso, estado)
-                VALUES (?, ?, 'DISPONIBLE')
-            """, (producto_id, format_fecha(fecha_ingreso)))
-            ids_generados.append(cursor.lastrowid)
-        
-    return ids_generados
+                SELECT COUNT(*) FROM envios
+                WHERE folio LIKE ? OR destino LIKE ? OR descripcion LIKE ?
+            """, (patron, patron, patron))
+        return cursor.fetchone()[0]
 
-def obtener_todo_el_inventario() -> List[Dict[str, Any]]:
-    """Obtiene todo el inventario con información relacionada"""
-    with get_connection(read_only=True) as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT 
-                i.id,
-                i.estado,
-                i.fecha_ingreso,
-                i.fecha_defectuoso,
+# ========== LISTADO PAGINADO DEL INVENTARIO ==========
+ORDENES_INVENTARIO = ['estado', 'reciente', 'antiguo']
+INVENTARIO_POR_PAGINA = 50
 
-                p.nombre AS producto_nombre,
-                p.ref_prod,
-                p.tipo,
+def _filtros_productos(tipo: Optional[str], texto: Optional[str]) -> tuple:
+    """Condición sobre inventario_vista para filtrar por tipo y texto (REF o nombre)"""
+    condiciones = []
+    params: List[Any] = []
+    if tipo:
+        condiciones.append("i.tipo = ?")
+        params.append(tipo)
+    consulta = _consulta_fts(texto) if texto and _SOPORTA_FTS5 else None
+    if consulta:
+        condiciones.append("i.producto_id IN (SELECT rowid FROM productos_fts WHERE productos_fts MATCH ?)")
+        params.append(consulta)
+    elif texto:
+        patron = "%" + texto.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        condiciones.append(
+            "i.producto_id IN (SELECT id FROM productos WHERE ref_prod LIKE ? ESCAPE '\\' OR nombre LIKE ? ESCAPE '\\')"
+        )
+        params.extend([patron, patron])
+    return " AND ".join(condiciones), params
 
-                sc.config_final as sd_config_final,
+def _leer_cursor_inventario(cursor: str) -> list:
+    """Posición de la última fila entregada: [estado, fecha_ingreso, id]"""
+    try:
+        posicion = json.loads(cursor)
+    except (TypeError, ValueError):
+        raise ValueError("Cursor inválido")
+    if not (isinstance(posicion, list) and len(posicion) == 3
+            and posicion[0] in ESTADOS_INVENTARIO
+            and isinstance(posicion[1], str)
+            and isinstance(posicion[2], int) and not isinstance(posicion[2], bool)):
+        raise ValueError("Cursor inválido")
+    return posicion
 
-                dc.fecha_config_inicio as disp_fecha_config_inicio,
-                dc.fecha_config_final as disp_fecha_config_final,
-                dc.fecha_finalizacion_accion as disp_fecha_accion
-            FROM inventario i
-            JOIN productos p ON i.producto_id = p.id
-            LEFT JOIN sd_configuraciones sc ON i.id = sc.inventario_id
-            LEFT JOIN dispositivo_configuraciones dc ON i.id = dc.inventario_id
-            ORDER BY 
-                CASE i.estado 
-                    WHEN 'DISPONIBLE' THEN 1
-                    WHEN 'REINICIADO' THEN 2
-                    WHEN 'CONFIGURADO' THEN 3
-                    WHEN 'ENVIADO' THEN 4
-                    ELSE 5
-                END,
-                i.fecha_ingreso DESC
-        """)
-        return [dict(row) for row in cursor.fetchall()]
+@cache_consulta("inventario", "productos", "sd_configuraciones", "dispositivo_configuraciones")
+def buscar_inventario(estado: Optional[str] = None, tipo: Optional[str] = None,
+                      texto: Optional[str] = None, orden: str = 'estado',
+                      cursor: Optional[str] = None, limite: int = INVENTARIO_POR_PAGINA) -> Dict[str, Any]:
+    """
+    Obtiene una página del inventario filtrando en SQL, incluidas las
+    unidades ENVIADO ya archivadas.
+    orden: 'estado' (DISPONIBLE → DEFECTUOSO y más reciente primero, como
+    obtener_todo_el_inventario), 'reciente' o 'antiguo' por fecha de ingreso.
+    cursor: valor 'siguiente' de la página anterior (paginación por keyset).
+    Devuelve {'filas', 'total', 'siguiente'}; 'siguiente' es None en la última página.
+    """
+    if orden not in ORDENES_INVENTARIO:
+        raise ValueError(f"Orden inválido: {orden}")
+    if limite <= 0:
+        raise ValueError("El límite debe ser positivo")
+    if estado is not None and estado not in ESTADOS_INVENTARIO:
+        raise ValueError(f"Estado inválido: {estado}")
+    
+    posicion = _leer_cursor_inventario(cursor) if cursor else None
+    filtro_productos, params_productos = _filtros_productos(tipo, texto)
+    
+    with get_connection(read_only=True) as conn:
+        cur = conn.cursor()
+        
+        def pagina(estado_tramo: Optional[str], descendente: bool, desde: Optional[list], cantidad: int):
+            condiciones = []
+            params: List[Any] = []
+            if estado_tramo:
+                condiciones.append("i.estado = ?")
+                params.append(estado_tramo)
+            if filtro_productos:
+                condiciones.append(filtro_productos)
+                params.extend(params_productos)
+            if desde:
+                condiciones.append(f"(i.fecha_ingreso, i.id) {'<' if descendente else '>'} (?, ?)")
+                params.extend(desde[1:])
+            direccion = "DESC" if descendente else "ASC"
+            # Cada fuente se recorre por su propio índice; el archivo solo tiene ENVIADO
+            fuentes = ['inventario_vista']
+            if estado_tramo in (None, 'ENVIADO'):
+                fuentes.append('inventario_archivo_vista')
+            consultas = [f"""
+                SELECT * FROM (
+                    SELECT {_COLUMNAS_LISTADO}
+                    FROM {fuente} i
+                    {'WHERE ' + ' AND '.join(condiciones) if condiciones else ''}
+                    ORDER BY i.fecha_ingreso {direccion}, i.id {direccion}
+                    LIMIT ?
+                )""" for fuente in fuentes]
+            cur.execute(f"""
+                {' UNION ALL '.join(consultas)}
+                ORDER BY fecha_ingreso {direccion}, id {direccion}
+                LIMIT ?
+            """, (params + [cantidad]) * len(fuentes) + [cantidad])
+            return [dict(row) for row in cur.fetchall()]
+        
+        # Se pide una fila de más para saber si hay otra página
+        if orden == 'estado':
+            # Un tramo por estado, en el orden del listado, cada uno por índice (estado, fecha)
+            estados = [estado] if estado else ESTADOS_INVENTARIO
+            if posicion:
+                if posicion[0] not in estados:
+                    raise ValueError("Cursor inválido")
+                estados = estados[estados.index(posicion[0]):]
+            filas = []
+            for estado_tramo in estados:
+                desde = posicion if posicion and posicion[0] == estado_tramo else None
+                filas.extend(pagina(estado_tramo, True, desde, limite + 1 - len(filas)))
+                if len(filas) > limite:
+                    break
+        else:
+            filas = pagina(estado, orden == 'reciente', posicion, limite + 1)
+        
+        siguiente = None
+        if len(filas) > limite:
+            filas = filas[:limite]
+            ultima = filas[-1]
+            siguiente = json.dumps([ultima['estado'], ultima['fecha_ingreso'], ultima['id']])
+        
+        # Total: desde los contadores si no hay búsqueda de texto; ENVIADO
+        # suma el archivo, como get_conteos_tipo_estado
+        if texto:
+            condiciones = [filtro_productos]
+            params = list(params_productos)
+            if estado:
+                condiciones.append("i.estado = ?")
+                params.append(estado)
+            cur.execute(f"SELECT COUNT(*) FROM inventario_historial i WHERE {' AND '.join(condiciones)}", params)
+        else:
+            cur.execute(f"""
+                SELECT
+                    (SELECT COALESCE(SUM(total), 0) FROM contadores_inventario
+                     WHERE (? IS NULL OR estado = ?) AND (? IS NULL OR tipo = ?))
+                  + (SELECT COALESCE(SUM(total), 0) FROM contadores_archivo
+                     WHERE (? IS NULL OR ? = 'ENVIADO') AND (? IS NULL OR tipo = ?))
+            """, (estado, estado, tipo, tipo) * 2)
+        total = cur.fetchone()[0]
+        
+        return {'filas': filas, 'total': total, 'siguiente': siguiente}
 
+@cache_consulta("inventario", "productos", "sd_configuraciones", "dispositivo_configuraciones")
 def obtener_item_completo(item_id: int) -> Optional[Dict[str, Any]]:
-    """Obtiene un item del inventario con todas sus configuraciones"""
+    """Obtiene un item del inventario (o del archivo) con todas sus configuraciones"""
     with get_connection(read_only=True) as conn:
         cursor = conn.cursor()
-        cursor.execute("""
-            SELECT 
-                i.id,
-                i.producto_id,
-                i.estado,
-                i.fecha_ingreso,
-                i.fecha_defectuoso,
-                i.created_at,
-
-                p.nombre AS producto_nombre,
-                p.ref_prod,
-                p.tipo,
-
-                sc.id as sd_config_id,
-                sc.config_final as sd_config_final,
-                sc.fecha_configuracion as sd_fecha_configuracion,
-
-                dc.id as disp_config_id,
-                dc.fecha_config_inicio as disp_fecha_config_inicio,
-                dc.fecha_config_final as disp_fecha_config_final,
-                dc.fecha_finalizacion_accion as disp_fecha_accion
-            FROM inventario i
-            JOIN productos p ON i.producto_id = p.id
-            LEFT JOIN sd_configuraciones sc ON i.id = sc.inventario_id
-            LEFT JOIN dispositivo_configuraciones dc ON i.id = dc.inventario_id
-            WHERE i.id = ?
-        """, (item_id,))
+        cursor.execute("SELECT * FROM inventario_historial WHERE id = ?", (item_id,))
         
         row = cursor.fetchone()
         return dict(row) if row else None
 
+@escritura("inventario", "sd_configuraciones", "dispositivo_configuraciones")
 def actualizar_item(
     item_id: int,
     estado: Optional[str] = None,
@@ -459,10 +2596,10 @@ def actualizar_item(
         cursor.execute("SELECT estado, producto_id FROM inventario WHERE id = ?", (item_id,))
         item = cursor.fetchone()
         
-        if not item:
+        if not item and not _esta_archivado(cursor, item_id):
             raise ValueError(f"El item con ID {item_id} no existe")
         
-        if item['estado'] == 'ENVIADO':
+        if not item or item['estado'] == 'ENVIADO':
             raise ValueError("No se puede modificar un item que ya ha sido enviado")
         
         # Obtener tipo de producto
@@ -497,22 +2634,6 @@ def actualizar_item(
             
             validar_fechas_ordenadas(fecha_inicio, fecha_fin)
         
-        # Actualizar inventario
-        updates = []
-        params = []
-        
-        if estado is not None:
-            updates.append("estado = ?")
-            params.append(estado)
-        
-        if fecha_ingreso is not None:
-            updates.append("fecha_ingreso = ?")
-            params.append(format_fecha(fecha_ingreso))
-        
-        if updates:
-            params.append(item_id)
-            cursor.execute(f"UPDATE inventario SET {', '.join(updates)} WHERE id = ?", params)
-        
         # Actualizar configuración de SD si aplica
         if tipo == 'SD' and sd_config_final is not None:
             cursor.execute("SELECT id FROM sd_configuraciones WHERE inventario_id = ?", (item_id,))
@@ -569,9 +2690,26 @@ def actualizar_item(
                         disp_fecha_config_final
                     ))
         
-        conn.commit()
+        # El estado va al final: trg_transiciones_inventario toma la fecha de la
+        # transición de las configuraciones recién escritas
+        updates = []
+        params = []
+        
+        if estado is not None:
+            updates.append("estado = ?")
+            params.append(estado)
+        
+        if fecha_ingreso is not None:
+            updates.append("fecha_ingreso = ?")
+            params.append(format_fecha(fecha_ingreso))
+        
+        if updates:
+            params.append(item_id)
+            cursor.execute(f"UPDATE inventario SET {', '.join(updates)} WHERE id = ?", params)
+        
         return True
 
+@escritura("inventario")
 def marcar_como_defectuoso(item_id: int) -> bool:
     """
     Marca un item como defectuoso.
@@ -589,10 +2727,10 @@ def marcar_como_defectuoso(item_id: int) -> bool:
         """, (item_id,))
         
         item = cursor.fetchone()
-        if not item:
+        if not item and not _esta_archivado(cursor, item_id):
             raise ValueError("El item no existe")
         
-        if item['estado'] == 'ENVIADO':
+        if not item or item['estado'] == 'ENVIADO':
             raise ValueError("No se puede marcar como defectuoso un item ya enviado")
         
         tipo = item['tipo']
@@ -619,74 +2757,112 @@ def marcar_como_defectuoso(item_id: int) -> bool:
             WHERE id = ?
         """, (item_id,))
         
-        conn.commit()
         return True
 
+# ========== TRANSICIONES DE CONFIGURACIÓN (POR LOTES) ==========
+def _ids_unicos(inventario_ids: List[int]) -> List[int]:
+    """Quita ids repetidos conservando el orden"""
+    return list(dict.fromkeys(int(i) for i in inventario_ids))
+
+def _reporte_lote(ids: List[int], errores: Dict[int, str]) -> Dict[str, Any]:
+    return {
+        'procesados': [i for i in ids if i not in errores],
+        'errores': [{'id': i, 'error': errores[i]} for i in ids if i in errores],
+    }
+
+def _primer_error(reporte: Dict[str, Any]):
+    if reporte['errores']:
+        raise ValueError(reporte['errores'][0]['error'])
+
+@escritura("inventario", "dispositivo_configuraciones")
 def iniciar_configuracion_dispositivo(inventario_id: int, fecha_config_inicio) -> bool:
     """Inicia el proceso de configuración de un dispositivo"""
+    _primer_error(iniciar_configuracion_dispositivos([inventario_id], fecha_config_inicio))
+    return True
+
+@escritura("inventario", "dispositivo_configuraciones")
+def iniciar_configuracion_dispositivos(inventario_ids: List[int], fecha_config_inicio) -> Dict[str, Any]:
+    """
+    Inicia el reinicio de varios dispositivos en una sola transacción.
+    Los que no cumplen las condiciones se omiten y se reportan en 'errores';
+    devuelve {'procesados': [ids], 'errores': [{'id', 'error'}]}.
+    """
+    fecha_config_inicio = _fecha_operacion(fecha_config_inicio, "Fecha de reinicio")
+    ids = _ids_unicos(inventario_ids)
+    
     with get_connection(read_only=False) as conn:
         cursor = conn.cursor()
         
-        # Verificar que el item existe y es un dispositivo disponible
-        cursor.execute("""
-            SELECT i.*, p.tipo FROM inventario i
-            JOIN productos p ON i.producto_id = p.id
-            WHERE i.id = ? AND i.estado = 'DISPONIBLE'
-        """, (inventario_id,))
-        
-        item = cursor.fetchone()
-        if not item:
-            raise ValueError("El item no existe o no está disponible")
-        
-        if item['tipo'] != 'DISPOSITIVO':
-            raise ValueError("Solo se pueden configurar dispositivos")
-        
-        validar_fecha_no_futura(fecha_config_inicio, "Fecha de reinicio")
-        
-        # Verificar que no tenga ya una configuración iniciada
+        # Estado de todos los items con una sola consulta
         cursor.execute("""
-            SELECT id FROM dispositivo_configuraciones 
-            WHERE inventario_id = ?
-        """, (inventario_id,))
-        
-        if cursor.fetchone():
-            raise ValueError("Este dispositivo ya tiene un proceso de configuración iniciado")
+            SELECT s.value AS id, i.estado, p.tipo, dc.id AS config_id
+            FROM json_each(?) s
+            LEFT JOIN inventario i ON i.id = s.value
+            LEFT JOIN productos p ON p.id = i.producto_id
+            LEFT JOIN dispositivo_configuraciones dc ON dc.inventario_id = i.id
+        """, (json.dumps(ids),))
+        
+        errores = {}
+        for item in cursor.fetchall():
+            if item['estado'] != 'DISPONIBLE':
+                errores[item['id']] = "El item no existe o no está disponible"
+            elif item['tipo'] != 'DISPOSITIVO':
+                errores[item['id']] = "Solo se pueden configurar dispositivos"
+            elif item['config_id'] is not None:
+                errores[item['id']] = "Este dispositivo ya tiene un proceso de configuración iniciado"
+        
+        reporte = _reporte_lote(ids, errores)
+        validos = json.dumps(reporte['procesados'])
         
         # Registrar inicio de configuración y cambiar estado
         cursor.execute("""
             INSERT INTO dispositivo_configuraciones (inventario_id, fecha_config_inicio)
-            VALUES (?, ?)
-        """, (inventario_id, format_fecha(fecha_config_inicio)))
+            SELECT value, ? FROM json_each(?)
+        """, (format_fecha(fecha_config_inicio), validos))
         
         cursor.execute("""
-            UPDATE inventario SET estado = 'REINICIADO' WHERE id = ?
-        """, (inventario_id,))
+            UPDATE inventario SET estado = 'REINICIADO'
+            WHERE id IN (SELECT value FROM json_each(?))
+        """, (validos,))
         
-        return True
+        return reporte
 
+@escritura("inventario", "dispositivo_configuraciones")
 def finalizar_configuracion_dispositivo(inventario_id: int, fecha_config_final) -> bool:
     """Finaliza la configuración de un dispositivo"""
+    _primer_error(finalizar_configuracion_dispositivos([inventario_id], fecha_config_final))
+    return True
+
+@escritura("inventario", "dispositivo_configuraciones")
+def finalizar_configuracion_dispositivos(inventario_ids: List[int], fecha_config_final) -> Dict[str, Any]:
+    """
+    Finaliza la configuración de varios dispositivos reiniciados en una sola
+    transacción. Mismo formato de resultado que iniciar_configuracion_dispositivos.
+    """
+    fecha_config_final = _fecha_operacion(fecha_config_final, "Fecha de configuración final")
+    ids = _ids_unicos(inventario_ids)
+    
     with get_connection(read_only=False) as conn:
         cursor = conn.cursor()
         
-        # Verificar que el dispositivo está en proceso de reinicio
+        # Solo cuentan los dispositivos REINICIADOS con la configuración abierta
         cursor.execute("""
-            SELECT i.*, dc.fecha_config_inicio 
-            FROM inventario i
-            JOIN dispositivo_configuraciones dc ON i.id = dc.inventario_id
-            WHERE i.id = ? AND i.estado = 'REINICIADO' AND dc.fecha_config_final IS NULL
-        """, (inventario_id,))
-        
-        item = cursor.fetchone()
-        if not item:
-            raise ValueError("El dispositivo no está en proceso de reinicio o ya fue configurado")
-        
-        validar_fecha_no_futura(fecha_config_final, "Fecha de configuración final")
-        
-        # Validar que la fecha final no sea anterior a la fecha de inicio
-        fecha_inicio = parse_fecha(item['fecha_config_inicio'])
-        if fecha_inicio and fecha_inicio > fecha_config_final:
-            raise ValueError("La fecha de finalización no puede ser anterior a la fecha de inicio")
+            SELECT s.value AS id, dc.fecha_config_inicio
+            FROM json_each(?) s
+            LEFT JOIN inventario i ON i.id = s.value AND i.estado = 'REINICIADO'
+            LEFT JOIN dispositivo_configuraciones dc
+                ON dc.inventario_id = i.id AND dc.fecha_config_final IS NULL
+        """, (json.dumps(ids),))
+        
+        errores = {}
+        for item in cursor.fetchall():
+            if item['fecha_config_inicio'] is None:
+                errores[item['id']] = "El dispositivo no está en proceso de reinicio o ya fue configurado"
+            elif parse_fecha(item['fecha_config_inicio']) > fecha_config_final:
+                errores[item['id']] = "La fecha de finalización no puede ser anterior a la fecha de inicio"
+        
+        reporte = _reporte_lote(ids, errores)
+        validos = json.dumps(reporte['procesados'])
         
         # Actualizar configuración
         cursor.execute("""
@@ -694,62 +2870,73 @@ def finalizar_configuracion_dispositivo(inventario_id: int, fecha_config_final)
             SET 
                 fecha_config_final = ?,
                 fecha_finalizacion_accion = CURRENT_TIMESTAMP
-            WHERE inventario_id = ? AND fecha_config_final IS NULL
-        """, (format_fecha(fecha_config_final), inventario_id))
+            WHERE inventario_id IN (SELECT value FROM json_each(?)) AND fecha_config_final IS NULL
+        """, (format_fecha(fecha_config_final), validos))
         
         # Cambiar estado a configurado
         cursor.execute("""
-            UPDATE inventario SET estado = 'CONFIGURADO' WHERE id = ?
-        """, (inventario_id,))
+            UPDATE inventario SET estado = 'CONFIGURADO'
+            WHERE id IN (SELECT value FROM json_each(?))
+        """, (validos,))
         
-        return True
+        return reporte
 
+@escritura("inventario", "sd_configuraciones")
 def configurar_sd(inventario_id: int, config_final) -> bool:
     """Marca una SD como configurada"""
+    _primer_error(configurar_sds([inventario_id], config_final))
+    return True
+
+@escritura("inventario", "sd_configuraciones")
+def configurar_sds(inventario_ids: List[int], config_final) -> Dict[str, Any]:
+    """
+    Marca varias SDs como configuradas en una sola transacción. Mismo formato
+    de resultado que iniciar_configuracion_dispositivos.
+    """
+    config_final = _fecha_operacion(config_final, "Fecha de configuración")
+    ids = _ids_unicos(inventario_ids)
+    
     with get_connection(read_only=False) as conn:
         cursor = conn.cursor()
         
-        # Verificar que el item existe, es SD y está disponible
-        cursor.execute("""
-            SELECT i.*, p.tipo FROM inventario i
-            JOIN productos p ON i.producto_id = p.id
-            WHERE i.id = ? AND i.estado = 'DISPONIBLE'
-        """, (inventario_id,))
-        
-        item = cursor.fetchone()
-        if not item:
-            raise ValueError("La SD no existe o no está disponible")
-        
-        if item['tipo'] != 'SD':
-            raise ValueError("Solo se pueden configurar tarjetas SD")
-        
-        validar_fecha_no_futura(config_final, "Fecha de configuración")
-        
-        # Verificar que no tenga ya una configuración
         cursor.execute("""
-            SELECT id FROM sd_configuraciones 
-            WHERE inventario_id = ?
-        """, (inventario_id,))
-        
-        if cursor.fetchone():
-            raise ValueError("Esta SD ya está configurada")
+            SELECT s.value AS id, i.estado, p.tipo, sc.id AS config_id
+            FROM json_each(?) s
+            LEFT JOIN inventario i ON i.id = s.value
+            LEFT JOIN productos p ON p.id = i.producto_id
+            LEFT JOIN sd_configuraciones sc ON sc.inventario_id = i.id
+        """, (json.dumps(ids),))
+        
+        errores = {}
+        for item in cursor.fetchall():
+            if item['estado'] != 'DISPONIBLE':
+                errores[item['id']] = "La SD no existe o no está disponible"
+            elif item['tipo'] != 'SD':
+                errores[item['id']] = "Solo se pueden configurar tarjetas SD"
+            elif item['config_id'] is not None:
+                errores[item['id']] = "Esta SD ya está configurada"
+        
+        reporte = _reporte_lote(ids, errores)
+        validos = json.dumps(reporte['procesados'])
         
         # Registrar configuración
         cursor.execute("""
             INSERT INTO sd_configuraciones (inventario_id, config_final, fecha_configuracion)
-            VALUES (?, ?, date('now'))
-        """, (inventario_id, format_fecha(config_final)))
+            SELECT value, ?, date('now') FROM json_each(?)
+        """, (format_fecha(config_final), validos))
         
         # Cambiar estado
         cursor.execute("""
-            UPDATE inventario SET estado = 'CONFIGURADO' WHERE id = ?
-        """, (inventario_id,))
+            UPDATE inventario SET estado = 'CONFIGURADO'
+            WHERE id IN (SELECT value FROM json_each(?))
+        """, (validos,))
         
-        return True
+        return reporte
 
 # ========== FUNCIÓN ELIMINADA: actualizar_item_inventario (duplicada) ==========
 # La función anterior ha sido eliminada. Usar actualizar_item() en su lugar.
 
+@escritura("inventario", "sd_configuraciones", "dispositivo_configuraciones")
 def eliminar_item_inventario(item_id: int) -> bool:
     """
     Elimina un item del inventario y sus configuraciones asociadas.
@@ -762,11 +2949,11 @@ def eliminar_item_inventario(item_id: int) -> bool:
         cursor.execute("SELECT estado FROM inventario WHERE id = ?", (item_id,))
         item = cursor.fetchone()
         
-        if not item:
+        if not item and not _esta_archivado(cursor, item_id):
             raise ValueError("El item no existe")
         
-        # No permitir eliminar items enviados
-        if item['estado'] == 'ENVIADO':
+        # No permitir eliminar items enviados (también los ya archivados)
+        if not item or item['estado'] == 'ENVIADO':
             raise ValueError("No se puede eliminar un item que ya ha sido enviado")
         
         # Verificar si está en envíos (dependencia crítica)
@@ -777,12 +2964,12 @@ def eliminar_item_inventario(item_id: int) -> bool:
         # Eliminar (las configuraciones se irán por CASCADE)
         cursor.execute("DELETE FROM inventario WHERE id = ?", (item_id,))
         
-        deleted = cursor.rowcount > 0
-        conn.commit()
-        
-        return deleted
+        return cursor.rowcount > 0
 
 # ========== PROCESAMIENTO DE ENVÍOS ==========
+ENVIO_LINEAS_POR_CONSULTA = 200  # Ramas UNION ALL por consulta (SQLite admite hasta 500)
+
+@escritura("envios", "envio_detalle", "inventario")
 def procesar_envio(items: List[Dict[str, int]], folio: str, destino: str = "", 
                    descripcion: str = "", fecha_salida=None) -> Dict[str, Any]:
     """
@@ -797,69 +2984,58 @@ def procesar_envio(items: List[Dict[str, int]], folio: str, destino: str = "",
     if not folio or not folio.strip():
         raise ValueError("El folio es obligatorio")
     
+    # Consolidar cantidades por producto conservando el orden de la solicitud
+    solicitados: Dict[int, int] = {}
+    for req in items:
+        if req['cantidad'] <= 0:
+            raise ValueError("La cantidad debe ser positiva")
+        solicitados[req['producto_id']] = solicitados.get(req['producto_id'], 0) + req['cantidad']
+    
     with get_connection(read_only=False) as conn:
         cursor = conn.cursor()
         
         inventario_ids = []
         items_procesados = []
         
-        for req in items:
-            producto_id = req['producto_id']
-            cantidad_necesaria = req['cantidad']
-            
-            # Verificar que el producto existe
-            cursor.execute("SELECT nombre FROM productos WHERE id = ?", (producto_id,))
-            producto = cursor.fetchone()
-            if not producto:
-                raise ValueError(f"El producto con ID {producto_id} no existe")
-            
-            # Obtener items disponibles para envío
-            cursor.execute("""
-                SELECT i.id, p.tipo, p.nombre as producto_nombre,
-                       dc.fecha_config_final as disp_fecha_final,
-                       sc.config_final as sd_fecha_final
-                FROM inventario i
-                JOIN productos p ON i.producto_id = p.id
-                LEFT JOIN dispositivo_configuraciones dc ON i.id = dc.inventario_id
-                LEFT JOIN sd_configuraciones sc ON i.id = sc.inventario_id
-                WHERE i.producto_id = ? 
-                AND (
-                    (p.tipo = 'DISPOSITIVO' AND i.estado = 'CONFIGURADO')
-                    OR
-                    (p.tipo = 'SD' AND i.estado = 'CONFIGURADO')
-                    OR
-                    (p.tipo IN ('CABLE_USB', 'CABLE_ETHERNET', 'CABLE_C') AND i.estado = 'DISPONIBLE')
-                )
-                ORDER BY i.fecha_ingreso ASC
-                LIMIT ?
-            """, (producto_id, cantidad_necesaria))
-            
-            disponibles = cursor.fetchall()
+        if solicitados:
+            asignados = _asignar_fifo(cursor, solicitados)
             
-            if len(disponibles) < cantidad_necesaria:
-                raise ValueError(
-                    f"Stock insuficiente para {producto['nombre']}. "
-                    f"Requerido: {cantidad_necesaria}, Disponible: {len(disponibles)}"
-                )
+            cursor.execute(
+                f"SELECT id, nombre FROM productos WHERE id IN ({', '.join('?' * len(solicitados))})",
+                list(solicitados)
+            )
+            nombres = {row['id']: row['nombre'] for row in cursor.fetchall()}
             
-            # Validar fechas de configuración
-            for item in disponibles:
-                if item['tipo'] == 'DISPOSITIVO' and not item['disp_fecha_final']:
-                    raise ValueError(
-                        f"El dispositivo ID {item['id']} no tiene fecha de configuración final"
-                    )
+            # Validar en el orden de la solicitud, igual que el proceso por línea
+            for producto_id, cantidad_necesaria in solicitados.items():
+                if producto_id not in nombres:
+                    raise ValueError(f"El producto con ID {producto_id} no existe")
                 
-                if item['tipo'] == 'SD' and not item['sd_fecha_final']:
+                disponibles = asignados.get(producto_id, [])
+                if len(disponibles) < cantidad_necesaria:
                     raise ValueError(
-                        f"La SD ID {item['id']} no tiene fecha de configuración final"
+                        f"Stock insuficiente para {nombres[producto_id]}. "
+                        f"Requerido: {cantidad_necesaria}, Disponible: {len(disponibles)}"
                     )
                 
-                inventario_ids.append(item['id'])
-                items_procesados.append({
-                    'id': item['id'],
-                    'tipo': item['tipo'],
-                    'producto': item['producto_nombre']
-                })
+                # Validar fechas de configuración
+                for item in disponibles:
+                    if item['tipo'] == 'DISPOSITIVO' and not item['disp_fecha_final']:
+                        raise ValueError(
+                            f"El dispositivo ID {item['id']} no tiene fecha de configuración final"
+                        )
+                    
+                    if item['tipo'] == 'SD' and not item['sd_fecha_final']:
+                        raise ValueError(
+                            f"La SD ID {item['id']} no tiene fecha de configuración final"
+                        )
+                    
+                    inventario_ids.append(item['id'])
+                    items_procesados.append({
+                        'id': item['id'],
+                        'tipo': item['tipo'],
+                        'producto': item['producto_nombre']
+                    })
         
         # Crear el envío
         try:
@@ -874,16 +3050,17 @@ def procesar_envio(items: List[Dict[str, int]], folio: str, destino: str = "",
         
         envio_id = cursor.lastrowid
         
-        # Marcar items como enviados y crear detalle
-        for inventario_id in inventario_ids:
-            cursor.execute("""
-                UPDATE inventario SET estado = 'ENVIADO' WHERE id = ?
-            """, (inventario_id,))
-            
+        # Crear detalle y marcar items como enviados, una sentencia para todas las unidades
+        if inventario_ids:
+            ids_json = json.dumps(inventario_ids)
             cursor.execute("""
                 INSERT INTO envio_detalle (envio_id, inventario_id)
-                VALUES (?, ?)
-            """, (envio_id, inventario_id))
+                SELECT ?, value FROM json_each(?) ORDER BY key
+            """, (envio_id, ids_json))
+            cursor.execute("""
+                UPDATE inventario SET estado = 'ENVIADO'
+                WHERE id IN (SELECT value FROM json_each(?))
+            """, (ids_json,))
         
         return {
             'envio_id': envio_id,
@@ -892,85 +3069,548 @@ def procesar_envio(items: List[Dict[str, int]], folio: str, destino: str = "",
             'detalle': items_procesados
         }
 
+def _asignar_fifo(cursor: sqlite3.Cursor, solicitados: Dict[int, int]) -> Dict[int, List[sqlite3.Row]]:
+    """
+    Selecciona las unidades a enviar de todos los productos solicitados: las
+    `cantidad` más antiguas por fecha_ingreso (y luego por id) entre las que
+    están listas para envío. Una rama UNION ALL por línea, cada una con su
+    LIMIT: recorre el índice FIFO y se detiene al llegar a su cantidad, sin
+    numerar todo el stock. Devuelve producto_id -> filas en orden FIFO.
+    """
+    lineas = list(solicitados.items())
+    filas = []
+    for inicio in range(0, len(lineas), ENVIO_LINEAS_POR_CONSULTA):
+        tramo = lineas[inicio:inicio + ENVIO_LINEAS_POR_CONSULTA]
+        # LIMIT no admite columnas correlacionadas: la cantidad va como parámetro de cada rama
+        ramas = " UNION ALL ".join("""
+            SELECT * FROM (
+                SELECT ? AS orden, i.id, i.fecha_ingreso
+                FROM inventario i
+                WHERE i.producto_id = ?
+                  -- Dispositivos y SDs: CONFIGURADOS; cables: DISPONIBLES
+                  AND i.estado = (SELECT CASE WHEN tipo IN ('DISPOSITIVO', 'SD')
+                                              THEN 'CONFIGURADO' ELSE 'DISPONIBLE' END
+                                  FROM productos WHERE id = ?)
+                ORDER BY i.fecha_ingreso ASC, i.id ASC
+                LIMIT ?
+            )""" for _ in tramo)
+        params = []
+        for orden, (producto_id, cantidad) in enumerate(tramo, start=inicio):
+            params.extend((orden, producto_id, producto_id, cantidad))
+        
+        cursor.execute(f"""
+            WITH elegidos AS ({ramas})
+            SELECT i.id, i.producto_id, p.tipo, p.nombre as producto_nombre,
+                   dc.fecha_config_final as disp_fecha_final,
+                   sc.config_final as sd_fecha_final
+            FROM elegidos e
+            JOIN inventario i ON i.id = e.id
+            JOIN productos p ON p.id = i.producto_id
+            LEFT JOIN dispositivo_configuraciones dc ON i.id = dc.inventario_id
+            LEFT JOIN sd_configuraciones sc ON i.id = sc.inventario_id
+            ORDER BY e.orden, e.fecha_ingreso, e.id
+        """, params)
+        filas.extend(cursor.fetchall())
+    
+    asignados: Dict[int, List[sqlite3.Row]] = {}
+    for row in filas:
+        asignados.setdefault(row['producto_id'], []).append(row)
+    return asignados
+
+_SQL_ENVIOS = """
+    SELECT e.*, COUNT(ed.id) as total_items
+    FROM envios e
+    LEFT JOIN envio_detalle ed ON e.id = ed.envio_id
+    GROUP BY e.id
+    ORDER BY e.fecha_salida DESC, e.id DESC
+"""
+
+@cache_consulta("envios", "envio_detalle")
 def get_envios() -> List[Dict[str, Any]]:
     """Obtiene todos los envíos realizados"""
     with get_connection(read_only=True) as conn:
         cursor = conn.cursor()
-        cursor.execute("""
-            SELECT e.*, COUNT(ed.id) as total_items
+        cursor.execute(_SQL_ENVIOS)
+        return [dict(row) for row in cursor.fetchall()]
+
+@cache_consulta("envios", "envio_detalle")
+def get_envios_df():
+    """Igual que get_envios, pero como DataFrame tipado (requiere pandas)"""
+    with get_connection(read_only=True) as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        cursor.execute(_SQL_ENVIOS)
+        return _a_dataframe(cursor)
+
+ENVIOS_POR_PAGINA = 50
+
+def _leer_cursor_envios(cursor: str) -> list:
+    """Posición del último envío entregado: [fecha_salida, id]"""
+    try:
+        posicion = json.loads(cursor)
+    except (TypeError, ValueError):
+        raise ValueError("Cursor inválido")
+    if not (isinstance(posicion, list) and len(posicion) == 2
+            and isinstance(posicion[0], str)
+            and isinstance(posicion[1], int) and not isinstance(posicion[1], bool)):
+        raise ValueError("Cursor inválido")
+    return posicion
+
+@cache_consulta("envios", "envio_detalle")
+def listar_envios(cursor: Optional[str] = None, limite: int = ENVIOS_POR_PAGINA) -> Dict[str, Any]:
+    """
+    Una página de envíos, del más reciente al más antiguo, con las columnas
+    de get_envios(). cursor: valor 'siguiente' de la página anterior.
+    Devuelve {'filas', 'total', 'siguiente'} como buscar_inventario.
+    """
+    if limite <= 0:
+        raise ValueError("El límite debe ser positivo")
+    posicion = _leer_cursor_envios(cursor) if cursor else None
+    
+    with get_connection(read_only=True) as conn:
+        cur = conn.cursor()
+        cur.execute(f"""
+            SELECT e.*,
+                   (SELECT COUNT(*) FROM envio_detalle ed WHERE ed.envio_id = e.id) as total_items
             FROM envios e
-            LEFT JOIN envio_detalle ed ON e.id = ed.envio_id
-            GROUP BY e.id
+            {'WHERE (e.fecha_salida, e.id) < (?, ?)' if posicion else ''}
             ORDER BY e.fecha_salida DESC, e.id DESC
-        """)
-        return [dict(row) for row in cursor.fetchall()]
+            LIMIT ?
+        """, (posicion or []) + [limite + 1])
+        filas = [dict(row) for row in cur.fetchall()]
+        
+        siguiente = None
+        if len(filas) > limite:
+            filas = filas[:limite]
+            siguiente = json.dumps([filas[-1]['fecha_salida'], filas[-1]['id']])
+        
+        cur.execute("SELECT valor FROM contadores WHERE clave = 'envios'")
+        fila = cur.fetchone()
+        return {'filas': filas, 'total': fila[0] if fila else 0, 'siguiente': siguiente}
 
+@cache_consulta("envio_detalle", "inventario", "productos", "sd_configuraciones", "dispositivo_configuraciones")
 def get_detalle_envio(envio_id: int) -> List[Dict[str, Any]]:
     """Obtiene el detalle completo de un envío"""
     with get_connection(read_only=True) as conn:
         cursor = conn.cursor()
         cursor.execute("""
-            SELECT ed.*, i.estado,
-                   p.nombre as producto_nombre, p.ref_prod, p.tipo,
-                   sc.config_final as sd_config_final,
-                   dc.fecha_config_final as disp_config_final
+            SELECT ed.*, v.estado,
+                   v.producto_nombre, v.ref_prod, v.tipo,
+                   v.sd_config_final,
+                   v.disp_fecha_config_final as disp_config_final
             FROM envio_detalle ed
-            JOIN inventario i ON ed.inventario_id = i.id
-            JOIN productos p ON i.producto_id = p.id
-            LEFT JOIN sd_configuraciones sc ON i.id = sc.inventario_id
-            LEFT JOIN dispositivo_configuraciones dc ON i.id = dc.inventario_id
+            JOIN inventario_historial v ON ed.inventario_id = v.id
             WHERE ed.envio_id = ?
         """, (envio_id,))
         return [dict(row) for row in cursor.fetchall()]
 
+@cache_consulta("inventario", "productos", "envios")
 def get_metricas() -> Dict[str, int]:
-    """Obtiene métricas generales del inventario"""
+    """
+    Obtiene métricas generales del inventario.
+    Se leen de los contadores mantenidos por triggers: cuesta lo mismo
+    sin importar el tamaño del inventario.
+    """
+    with get_connection(read_only=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT tipo, estado, total FROM contadores_inventario")
+        conteos = _agrupar_conteos(cursor.fetchall())
+        cursor.execute("SELECT valor FROM contadores WHERE clave = 'envios'")
+        fila = cursor.fetchone()
+        return _metricas_desde_conteos(conteos, fila[0] if fila else 0)
+
+@cache_consulta("inventario", "productos")
+def get_conteos_tipo_estado() -> Dict[str, Dict[str, int]]:
+    """
+    Obtiene el número de unidades por tipo y estado (todas las combinaciones)
+    desde los contadores. ENVIADO incluye las unidades archivadas.
+    """
     with get_connection(read_only=True) as conn:
         cursor = conn.cursor()
-        metricas = {}
-        
-        # Total en inventario (no enviados)
-        cursor.execute("SELECT COUNT(*) FROM inventario WHERE estado IN ('DISPONIBLE', 'REINICIADO', 'CONFIGURADO')")
-        metricas['total_en_inventario'] = cursor.fetchone()[0]
-        
-        # Total de envíos
-        cursor.execute("SELECT COUNT(*) FROM envios")
-        metricas['total_envios'] = cursor.fetchone()[0]
-        
-        # SDs configuradas
         cursor.execute("""
-            SELECT COUNT(*)
-            FROM inventario i
-            JOIN productos p ON i.producto_id = p.id
-            WHERE p.tipo = 'SD' AND i.estado = 'CONFIGURADO'
+            SELECT c.tipo, c.estado,
+                   c.total + CASE WHEN c.estado = 'ENVIADO' THEN COALESCE(a.total, 0) ELSE 0 END
+            FROM contadores_inventario c
+            LEFT JOIN contadores_archivo a ON a.tipo = c.tipo
         """)
-        metricas['sds_configuradas'] = cursor.fetchone()[0]
-        
-        # Dispositivos configurados
+        return _agrupar_conteos(cursor.fetchall())
+
+def calcular_metricas() -> Dict[str, int]:
+    """Calcula las métricas directamente de las tablas base con un solo recorrido agregado"""
+    with get_connection(read_only=True) as conn:
+        cursor = conn.cursor()
         cursor.execute("""
-            SELECT COUNT(*)
+            SELECT p.tipo, i.estado, COUNT(*) AS total
             FROM inventario i
             JOIN productos p ON i.producto_id = p.id
-            WHERE p.tipo = 'DISPOSITIVO' AND i.estado = 'CONFIGURADO'
+            GROUP BY p.tipo, i.estado
         """)
-        metricas['dispositivos_configurados'] = cursor.fetchone()[0]
-        
-        # Dispositivos reiniciados
+        conteos = _agrupar_conteos(cursor.fetchall())
+        cursor.execute("SELECT COUNT(*) FROM envios")
+        return _metricas_desde_conteos(conteos, cursor.fetchone()[0])
+
+@escritura("inventario", "productos", "envios")
+def verificar_contadores(reparar: bool = False) -> bool:
+    """
+    Compara los contadores con un recálculo desde las tablas base.
+    Con reparar=True los reconstruye si no coinciden. Devuelve True si coincidían.
+    """
+    with get_connection(read_only=False) as conn:
+        cursor = conn.cursor()
         cursor.execute("""
-            SELECT COUNT(*)
-            FROM inventario i
-            JOIN productos p ON i.producto_id = p.id
-            WHERE p.tipo = 'DISPOSITIVO' AND i.estado = 'REINICIADO'
+            SELECT COUNT(*) FROM contadores_inventario c
+            LEFT JOIN (
+                SELECT p.tipo, i.estado, COUNT(*) AS total
+                FROM inventario i
+                JOIN productos p ON i.producto_id = p.id
+                GROUP BY p.tipo, i.estado
+            ) conteo ON conteo.tipo = c.tipo AND conteo.estado = c.estado
+            WHERE c.total != COALESCE(conteo.total, 0)
         """)
-        metricas['dispositivos_reiniciados'] = cursor.fetchone()[0]
-        
-        # Dispositivos defectuosos
+        diferencias = cursor.fetchone()[0]
+        cursor.execute("SELECT COUNT(*) FROM contadores_inventario")
+        combinaciones = cursor.fetchone()[0]
+        cursor.execute("SELECT (SELECT valor FROM contadores WHERE clave = 'envios') IS (SELECT COUNT(*) FROM envios)")
+        envios_ok = bool(cursor.fetchone()[0])
         cursor.execute("""
-            SELECT COUNT(*)
-            FROM inventario i
-            JOIN productos p ON i.producto_id = p.id
-            WHERE p.tipo = 'DISPOSITIVO' AND i.estado = 'DEFECTUOSO'
+            SELECT (SELECT COALESCE(SUM(total), 0) FROM contadores_archivo) = (SELECT COUNT(*) FROM inventario_archivo)
+               AND (SELECT COUNT(*) FROM contadores_archivo) = ?
+               AND NOT EXISTS (
+                   SELECT 1 FROM contadores_archivo c
+                   WHERE c.total != (SELECT COUNT(*) FROM inventario_archivo a
+                                     JOIN productos p ON a.producto_id = p.id WHERE p.tipo = c.tipo)
+               )
+        """, (len(TIPOS_PRODUCTO),))
+        archivo_ok = bool(cursor.fetchone()[0])
+        
+        correctos = diferencias == 0 and envios_ok and combinaciones == len(TIPOS_PRODUCTO) * len(ESTADOS_INVENTARIO)
+        if not correctos and reparar:
+            _reconstruir_contadores(cursor)
+        if not archivo_ok and reparar:
+            _reconstruir_contadores_archivo(cursor)
+        return correctos and archivo_ok
+
+@escritura("inventario", "productos", "sd_configuraciones", "dispositivo_configuraciones")
+def verificar_inventario_vista(reparar: bool = False) -> bool:
+    """
+    Compara inventario_vista con las tablas base, fila por fila.
+    Con reparar=True la reconstruye si no coinciden. Devuelve True si coincidían.
+    """
+    with get_connection(read_only=False) as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT EXISTS (SELECT * FROM inventario_vista EXCEPT {_SQL_FILAS_INVENTARIO_VISTA})
+                OR EXISTS ({_SQL_FILAS_INVENTARIO_VISTA} EXCEPT SELECT * FROM inventario_vista)
         """)
-        metricas['dispositivos_defectuosos'] = cursor.fetchone()[0]
-        
-        return metricas
\ No newline at end of file
+        correcta = not cursor.fetchone()[0]
+        if not correcta and reparar:
+            _reconstruir_inventario_vista(cursor)
+            # Otras conexiones no ven el cambio en las tablas base: se avisa por las generaciones
+            cursor.execute("UPDATE generaciones SET generacion = generacion + 1 WHERE tabla = 'inventario'")
+        return correcta
+
+def _agrupar_conteos(filas) -> Dict[str, Dict[str, int]]:
+    """Convierte filas (tipo, estado, total) en {tipo: {estado: total}} con todas las combinaciones"""
+    conteos = {tipo: {estado: 0 for estado in ESTADOS_INVENTARIO} for tipo in TIPOS_PRODUCTO}
+    for tipo, estado, total in filas:
+        conteos.setdefault(tipo, {})[estado] = total
+    return conteos
+
+def _metricas_desde_conteos(conteos: Dict[str, Dict[str, int]], total_envios: int) -> Dict[str, int]:
+    return {
+        # Total en inventario (no enviados)
+        'total_en_inventario': sum(
+            por_estado.get(estado, 0)
+            for por_estado in conteos.values()
+            for estado in ('DISPONIBLE', 'REINICIADO', 'CONFIGURADO')
+        ),
+        'total_envios': total_envios,
+        'sds_configuradas': conteos['SD']['CONFIGURADO'],
+        'dispositivos_configurados': conteos['DISPOSITIVO']['CONFIGURADO'],
+        'dispositivos_reiniciados': conteos['DISPOSITIVO']['REINICIADO'],
+        'dispositivos_defectuosos': conteos['DISPOSITIVO']['DEFECTUOSO'],
+    }
+
+# ========== ARCHIVO DE UNIDADES ENVIADAS ==========
+# Las unidades ENVIADO no vuelven a cambiar: se mueven (con sus configuraciones)
+# a las tablas *_archivo para que la tabla de trabajo, sus índices y los
+# listados crezcan con el stock en mano y no con el histórico de envíos.
+# inventario_historial, buscar_inventario, obtener_todo_el_inventario,
+# get_detalle_envio, obtener_item_completo y las exportaciones siguen viendo
+# la historia completa; ENVIADO cuenta también lo archivado. El archivo solo
+# cambia junto con inventario, así que comparte su etiqueta de caché.
+ARCHIVO_DIAS_MINIMOS = 30           # Antigüedad mínima del envío para archivar sus unidades
+ARCHIVO_UMBRAL_ENVIADOS = 10000     # ENVIADO en la tabla de trabajo que disparan el archivo
+ARCHIVO_FILAS_POR_LOTE = 5000       # Unidades por transacción
+
+_COLUMNAS_CONFIGURACION = {
+    'sd_configuraciones': "id, inventario_id, config_final, fecha_configuracion, imagen_quemada, created_at",
+    'dispositivo_configuraciones':
+        "id, inventario_id, fecha_config_inicio, fecha_config_final, fecha_finalizacion_accion, created_at",
+}
+
+@escritura("inventario", "sd_configuraciones", "dispositivo_configuraciones", agrupable=False)  # Confirma por lotes
+def archivar_enviados(dias_minimos: int = ARCHIVO_DIAS_MINIMOS,
+                      filas_por_lote: int = ARCHIVO_FILAS_POR_LOTE) -> Dict[str, Any]:
+    """
+    Mueve al archivo las unidades ENVIADO cuyo envío salió hace al menos
+    dias_minimos días. Cada lote va en su propia transacción para no retener
+    el bloqueo de escritura. Devuelve {'unidades', 'lotes', 'segundos'}.
+    """
+    if dias_minimos < 0:
+        raise ValueError("Los días mínimos no pueden ser negativos")
+    if filas_por_lote <= 0:
+        raise ValueError("El tamaño de lote debe ser positivo")
+    
+    limite = format_fecha(date.today() - timedelta(days=dias_minimos))
+    reporte = {'unidades': 0, 'lotes': 0, 'segundos': 0.0}
+    inicio = time.perf_counter()
+    while True:
+        with get_connection(read_only=False) as conn:
+            cursor = conn.cursor()
+            # Solo recorre las ENVIADO que siguen en la tabla de trabajo (idx_vista_estado_fecha)
+            cursor.execute("""
+                SELECT v.id FROM inventario_vista v
+                JOIN envio_detalle ed ON ed.inventario_id = v.id
+                JOIN envios e ON e.id = ed.envio_id
+                WHERE v.estado = 'ENVIADO' AND e.fecha_salida <= ?
+                LIMIT ?
+            """, (limite, filas_por_lote))
+            lote = [row[0] for row in cursor.fetchall()]
+            if not lote:
+                break
+            ids = json.dumps(lote)
+            
+            cursor.execute("""
+                INSERT INTO inventario_archivo (id, producto_id, estado, fecha_ingreso, fecha_defectuoso, created_at)
+                SELECT id, producto_id, estado, fecha_ingreso, fecha_defectuoso, created_at
+                FROM inventario WHERE id IN (SELECT value FROM json_each(?))
+            """, (ids,))
+            archivadas = cursor.rowcount
+            for tabla, columnas in _COLUMNAS_CONFIGURACION.items():
+                cursor.execute(f"""
+                    INSERT INTO {tabla}_archivo ({columnas})
+                    SELECT {columnas} FROM {tabla} WHERE inventario_id IN (SELECT value FROM json_each(?))
+                """, (ids,))
+                cursor.execute(f"DELETE FROM {tabla} WHERE inventario_id IN (SELECT value FROM json_each(?))", (ids,))
+            cursor.execute("DELETE FROM inventario WHERE id IN (SELECT value FROM json_each(?))", (ids,))
+        
+        reporte['unidades'] += archivadas
+        reporte['lotes'] += 1
+    reporte['segundos'] = time.perf_counter() - inicio
+    return reporte
+
+def archivar_si_hace_falta(umbral: int = ARCHIVO_UMBRAL_ENVIADOS) -> Optional[Dict[str, Any]]:
+    """
+    Archiva las unidades enviadas si las ENVIADO de la tabla de trabajo
+    superan el umbral. La comprobación lee los contadores: es barata en cada envío.
+    Devuelve el reporte de archivar_enviados, o None si no hizo falta.
+    """
+    with get_connection(read_only=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COALESCE(SUM(total), 0) FROM contadores_inventario WHERE estado = 'ENVIADO'")
+        if cursor.fetchone()[0] <= umbral:
+            return None
+    return archivar_enviados()
+
+_logger_archivo = logging.getLogger("inventario.archivo")
+_archivo_en_curso = threading.Lock()
+
+def archivar_en_segundo_plano(umbral: int = ARCHIVO_UMBRAL_ENVIADOS) -> bool:
+    """
+    Lanza archivar_si_hace_falta en un hilo aparte, fuera de la petición que
+    procesó el envío: un error del archivo no afecta al envío ya confirmado y
+    solo se registra. Devuelve False si ya había un archivo en curso.
+    """
+    if not _archivo_en_curso.acquire(blocking=False):
+        return False
+    
+    def archivar():
+        try:
+            reporte = archivar_si_hace_falta(umbral)
+            if reporte:
+                _logger_archivo.info("Archivadas %d unidades en %d lotes (%.1f s)",
+                                     reporte['unidades'], reporte['lotes'], reporte['segundos'])
+        except Exception:
+            _logger_archivo.exception("No se pudieron archivar las unidades enviadas")
+        finally:
+            _archivo_en_curso.release()
+    
+    threading.Thread(target=archivar, name="archivo-enviados", daemon=True).start()
+    return True
+
+def _esta_archivado(cursor: sqlite3.Cursor, item_id: int) -> bool:
+    """Las unidades archivadas ya no están en inventario, pero siguen siendo ENVIADO"""
+    cursor.execute("SELECT 1 FROM inventario_archivo WHERE id = ?", (item_id,))
+    return cursor.fetchone() is not None
+
+# ========== TIEMPOS DE CICLO ==========
+AGRUPACIONES_CICLO = {
+    'etapa': "''",
+    'semana': "strftime('%Y-%W', t.fecha)",
+    'producto': "t.producto_id",
+}
+CICLO_SEMANAS_POR_DEFECTO = 12
+
+@cache_consulta("inventario")
+def reporte_tiempos_ciclo(desde: Optional[date] = None, hasta: Optional[date] = None,
+                          agrupar: str = 'etapa') -> List[Dict[str, Any]]:
+    """
+    Tiempo en días de cada etapa (DISPONIBLE → REINICIADO, REINICIADO →
+    CONFIGURADO, CONFIGURADO → ENVIADO...) para las transiciones ocurridas
+    entre desde y hasta (por defecto, las últimas 12 semanas).
+    agrupar: 'etapa', 'semana' o 'producto'.
+    Cada fila trae unidades, promedio, mediana y p95 (percentil por rango más cercano).
+    """
+    if agrupar not in AGRUPACIONES_CICLO:
+        raise ValueError(f"Agrupación inválida: {agrupar}")
+    hasta = hasta or date.today()
+    desde = desde or hasta - timedelta(weeks=CICLO_SEMANAS_POR_DEFECTO)
+    validar_fechas_ordenadas(desde, hasta)
+    
+    with get_connection(read_only=True) as conn:
+        cursor = conn.cursor()
+        # Solo se recorre el rango de fechas de idx_transiciones_fecha
+        cursor.execute(f"""
+            WITH tramo AS (
+                SELECT t.estado_anterior, t.estado_nuevo, {AGRUPACIONES_CICLO[agrupar]} AS grupo, t.dias
+                FROM transiciones_inventario t
+                WHERE t.fecha BETWEEN ? AND ? AND t.dias IS NOT NULL
+            ),
+            rangos AS (
+                SELECT *,
+                       ROW_NUMBER() OVER w AS n,
+                       COUNT(*) OVER (PARTITION BY estado_anterior, estado_nuevo, grupo) AS total
+                FROM tramo
+                WINDOW w AS (PARTITION BY estado_anterior, estado_nuevo, grupo ORDER BY dias)
+            )
+            SELECT r.estado_anterior, r.estado_nuevo, r.grupo,
+                   MAX(r.total) AS unidades,
+                   ROUND(AVG(r.dias), 2) AS promedio_dias,
+                   MIN(CASE WHEN r.n >= (r.total + 1) / 2 THEN r.dias END) AS mediana_dias,
+                   MIN(CASE WHEN r.n >= (r.total * 95 + 99) / 100 THEN r.dias END) AS p95_dias
+            FROM rangos r
+            GROUP BY r.estado_anterior, r.estado_nuevo, r.grupo
+            ORDER BY r.grupo, r.estado_anterior, r.estado_nuevo
+        """, (format_fecha(desde), format_fecha(hasta)))
+        filas = [dict(row) for row in cursor.fetchall()]
+        
+        nombres = {}
+        if agrupar == 'producto' and filas:
+            ids = list({f['grupo'] for f in filas})
+            cursor.execute(
+                f"SELECT id, ref_prod, nombre FROM productos WHERE id IN ({', '.join('?' * len(ids))})", ids
+            )
+            nombres = {row['id']: f"{row['ref_prod']} - {row['nombre']}" for row in cursor.fetchall()}
+    
+    for fila in filas:
+        fila['etapa'] = f"{fila.pop('estado_anterior')} → {fila.pop('estado_nuevo')}"
+        grupo = fila.pop('grupo')
+        if agrupar == 'semana':
+            fila['semana'] = grupo
+        elif agrupar == 'producto':
+            fila['producto_id'] = grupo
+            fila['producto'] = nombres.get(grupo, f"ID {grupo}")
+    return filas
+
+# ========== EXPORTACIÓN ==========
+# Las exportaciones recorren la consulta con fetchmany en lotes acotados y
+# escriben cada lote antes de leer el siguiente: la memoria usada no depende
+# del número de filas. Se ordenan por id para que SQLite no tenga que ordenar.
+EXPORTACION_FILAS_POR_LOTE = 5000
+FORMATOS_EXPORTACION = ['csv', 'parquet']
+
+_SQL_EXPORTACIONES = {
+    'inventario': f"SELECT {_COLUMNAS_LISTADO} FROM inventario_historial ORDER BY id",
+    'envios': """
+        SELECT
+            ed.id,
+            ed.envio_id,
+            e.folio,
+            e.fecha_salida,
+            e.destino,
+            e.descripcion,
+            ed.inventario_id,
+            v.ref_prod,
+            v.producto_nombre,
+            v.tipo,
+            v.sd_config_final,
+            v.disp_fecha_config_final AS disp_config_final
+        FROM envio_detalle ed
+        JOIN envios e ON ed.envio_id = e.id
+        JOIN inventario_historial v ON ed.inventario_id = v.id
+        ORDER BY ed.id
+    """,
+}
+_COLUMNAS_ENTERAS = {'id', 'envio_id', 'inventario_id'}
+
+def _lotes_exportacion(cursor: sqlite3.Cursor, filas_por_lote: int) -> Iterator[List[tuple]]:
+    while True:
+        filas = cursor.fetchmany(filas_por_lote)
+        if not filas:
+            return
+        yield filas
+
+def _escribir_csv(cursor: sqlite3.Cursor, destino, filas_por_lote: int) -> int:
+    """Escribe en una ruta o archivo abierto (texto o binario) en UTF-8 con BOM, como lo lee Excel"""
+    if isinstance(destino, str):
+        with open(destino, 'w', newline='', encoding='utf-8-sig') as f:
+            return _escribir_csv(cursor, f, filas_por_lote)
+    
+    texto = destino
+    if isinstance(destino, io.IOBase) and not isinstance(destino, io.TextIOBase):
+        texto = io.TextIOWrapper(destino, encoding='utf-8-sig', newline='')
+    try:
+        escritor = csv.writer(texto)
+        escritor.writerow([columna[0] for columna in cursor.description])
+        total = 0
+        for filas in _lotes_exportacion(cursor, filas_por_lote):
+            escritor.writerows(filas)
+            total += len(filas)
+        return total
+    finally:
+        if texto is not destino:
+            texto.flush()
+            texto.detach()  # El archivo del llamador queda abierto
+
+def _escribir_parquet(cursor: sqlite3.Cursor, destino, filas_por_lote: int) -> int:
+    """Escribe un grupo de filas Parquet por lote (requiere pyarrow)"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ValueError("Para exportar a Parquet se requiere el paquete pyarrow")
+    
+    # Esquema fijo: un lote con la columna vacía no debe cambiar el tipo
+    esquema = pa.schema([
+        (columna[0], pa.int64() if columna[0] in _COLUMNAS_ENTERAS else pa.string())
+        for columna in cursor.description
+    ])
+    total = 0
+    with pq.ParquetWriter(destino, esquema) as escritor:
+        for filas in _lotes_exportacion(cursor, filas_por_lote):
+            arreglos = [pa.array(valores, type=campo.type) for valores, campo in zip(zip(*filas), esquema)]
+            escritor.write_batch(pa.RecordBatch.from_arrays(arreglos, schema=esquema))
+            total += len(filas)
+    return total
+
+def exportar(tabla: str, destino, formato: str = 'csv',
+             filas_por_lote: int = EXPORTACION_FILAS_POR_LOTE) -> int:
+    """
+    Exporta el inventario completo ('inventario') o todas las unidades
+    enviadas con los datos de su envío ('envios') a CSV o Parquet.
+    destino: ruta o archivo abierto. Devuelve el número de filas escritas.
+    """
+    if tabla not in _SQL_EXPORTACIONES:
+        raise ValueError(f"Exportación no soportada: {tabla}")
+    if formato not in FORMATOS_EXPORTACION:
+        raise ValueError(f"Formato de exportación no soportado: {formato}")
+    if filas_por_lote <= 0:
+        raise ValueError("El tamaño de lote debe ser positivo")
+    
+    escribir = _escribir_parquet if formato == 'parquet' else _escribir_csv
+    with get_connection(read_only=True) as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        cursor.execute(_SQL_EXPORTACIONES[tabla])
+        return escribir(cursor, destino, filas_por_lote)
@@ -0,0 +1,265 @@
+"""
+Pruebas de api.py sobre una base temporal.
+
+Uso:
+    python -m unittest test_api
+"""
+import http.client
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from datetime import date
+from urllib.parse import quote
+
+import api
+import db
+
+
+class PruebasApi(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.directorio = tempfile.mkdtemp()
+        cls.db_anterior = db.DB_NAME
+        db.DB_NAME = os.path.join(cls.directorio, "inventario.db")
+        cls.servidor = api.crear_servidor("127.0.0.1", 0)
+        cls.hilo = threading.Thread(target=cls.servidor.serve_forever, daemon=True)
+        cls.hilo.start()
+        cls.puerto = cls.servidor.server_address[1]
+
+        cls.producto_sd = db.crear_producto('SD', 'SD prueba')
+        cls.ids_sd = db.agregar_item_a_inventario(cls.producto_sd, 3, date(2026, 1, 1))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.servidor.shutdown()
+        cls.servidor.server_close()
+        db.cerrar_conexiones()
+        db.DB_NAME = cls.db_anterior
+        shutil.rmtree(cls.directorio, ignore_errors=True)
+
+    def setUp(self):
+        self.conexion = http.client.HTTPConnection("127.0.0.1", self.puerto, timeout=5)
+
+    def tearDown(self):
+        self.conexion.close()
+
+    def pedir(self, metodo: str, ruta: str, cuerpo=None):
+        datos = json.dumps(cuerpo).encode('utf-8') if cuerpo is not None else None
+        self.conexion.request(metodo, ruta, body=datos,
+                              headers={'Content-Type': 'application/json'} if datos else {})
+        respuesta = self.conexion.getresponse()
+        return respuesta.status, json.loads(respuesta.read())
+
+    # ========== CONEXIONES PERSISTENTES ==========
+    def test_cuerpo_de_ruta_inexistente_no_contamina_la_conexion(self):
+        estado, _ = self.pedir('POST', '/no-existe', {'relleno': 'x' * 100})
+        self.assertEqual(estado, 404)
+        estado, respuesta = self.pedir('GET', '/salud')
+        self.assertEqual(estado, 200)
+        self.assertEqual(respuesta['estado'], 'ok')
+
+    def test_cuerpo_con_metodo_no_permitido_no_contamina_la_conexion(self):
+        estado, _ = self.pedir('POST', '/metricas', {'relleno': 'x' * 100})
+        self.assertEqual(estado, 405)
+        estado, _ = self.pedir('GET', '/salud')
+        self.assertEqual(estado, 200)
+
+    def test_cuerpo_demasiado_grande_cierra_la_conexion(self):
+        self.conexion.putrequest('POST', '/productos')
+        self.conexion.putheader('Content-Length', str(api.API_MAX_CUERPO_BYTES + 1))
+        self.conexion.endheaders()
+        respuesta = self.conexion.getresponse()
+        respuesta.read()
+        self.assertEqual(respuesta.status, 413)
+        self.assertEqual(respuesta.getheader('Connection'), 'close')
+
+    # ========== VALIDACIÓN ==========
+    def test_fecha_nula_en_transicion(self):
+        estado, respuesta = self.pedir('POST', '/sd/configuraciones', {'ids': self.ids_sd[:1], 'fecha': None})
+        self.assertEqual(estado, 400)
+        self.assertIn('fecha', respuesta['error'])
+
+    def test_cantidad_decimal(self):
+        entrada = {'producto_id': self.producto_sd, 'cantidad': 1.9}
+        estado, respuesta = self.pedir('POST', '/inventario/ingresos', {'entradas': [entrada]})
+        self.assertEqual(estado, 400)
+        self.assertIn('cantidad', respuesta['error'])
+
+        entrada['cantidad'] = 2.0
+        estado, respuesta = self.pedir('POST', '/inventario/ingresos', {'entradas': [entrada]})
+        self.assertEqual(estado, 200)
+        self.assertEqual(len(respuesta['ids']), 2)
+
+    def test_cursor_invalido(self):
+        for cursor in ('["DISPONIBLE"]', '[1, "2026-01-01", 1]', '["ENVIADO", "2026-01-01", 1]', 'no-json'):
+            with self.subTest(cursor=cursor):
+                estado, respuesta = self.pedir('GET', f'/inventario?estado=DISPONIBLE&cursor={quote(cursor)}')
+                self.assertEqual(estado, 400)
+                self.assertEqual(respuesta['error'], "Cursor inválido")
+
+    def test_paginacion_con_cursor(self):
+        estado, primera = self.pedir('GET', '/inventario?estado=DISPONIBLE&limite=1')
+        self.assertEqual(estado, 200)
+        self.assertIsNotNone(primera['siguiente'])
+        estado, segunda = self.pedir('GET', f"/inventario?estado=DISPONIBLE&limite=1&cursor={quote(primera['siguiente'])}")
+        self.assertEqual(estado, 200)
+        self.assertNotEqual(primera['filas'][0]['id'], segunda['filas'][0]['id'])
+
+    def test_limite_no_positivo(self):
+        for ruta in ('/productos?texto=sd&limite=-1', '/inventario?limite=0', '/envios?limite=-1'):
+            with self.subTest(ruta=ruta):
+                estado, respuesta = self.pedir('GET', ruta)
+                self.assertEqual(estado, 400)
+                self.assertIn('limite', respuesta['error'])
+
+    # ========== PRODUCTOS E INGRESOS ==========
+    def crear_con_stock(self, tipo: str, nombre: str, cantidad: int) -> tuple:
+        """Crea un producto y le ingresa stock por la API; devuelve (producto_id, ids)"""
+        estado, respuesta = self.pedir('POST', '/productos', {'productos': [{'tipo': tipo, 'nombre': nombre}]})
+        self.assertEqual(estado, 200)
+        producto_id = respuesta['ids'][0]
+        entrada = {'producto_id': producto_id, 'cantidad': cantidad, 'fecha_ingreso': '2026-01-01'}
+        estado, respuesta = self.pedir('POST', '/inventario/ingresos', {'entradas': [entrada]})
+        self.assertEqual(estado, 200)
+        return producto_id, respuesta['ids']
+
+    def test_crear_productos(self):
+        nuevos = [{'tipo': 'CABLE_USB', 'nombre': 'Cable alfa'}, {'tipo': 'CABLE_C', 'nombre': 'Cable beta'}]
+        estado, respuesta = self.pedir('POST', '/productos', {'productos': nuevos})
+        self.assertEqual(estado, 200)
+        self.assertEqual(len(respuesta['ids']), 2)
+
+        estado, encontrados = self.pedir('GET', '/productos?texto=alfa')
+        self.assertEqual(estado, 200)
+        self.assertEqual([p['id'] for p in encontrados], respuesta['ids'][:1])
+
+        estado, respuesta = self.pedir('POST', '/productos', {'productos': [{'tipo': 'OTRO'}]})
+        self.assertEqual(estado, 400)
+
+    def test_ingresos_varias_entradas(self):
+        producto_a, _ = self.crear_con_stock('CABLE_USB', 'Ingreso A', 1)
+        producto_b, _ = self.crear_con_stock('CABLE_ETHERNET', 'Ingreso B', 1)
+        entradas = [
+            {'producto_id': producto_a, 'cantidad': 3},
+            {'producto_id': producto_b, 'cantidad': 2, 'fecha_ingreso': '2026-02-01'},
+        ]
+        estado, respuesta = self.pedir('POST', '/inventario/ingresos', {'entradas': entradas})
+        self.assertEqual(estado, 200)
+        self.assertEqual(len(respuesta['ids']), 5)
+
+        estado, item = self.pedir('GET', f"/inventario/{respuesta['ids'][-1]}")
+        self.assertEqual(estado, 200)
+        self.assertEqual((item['producto_id'], item['estado'], item['fecha_ingreso']),
+                         (producto_b, 'DISPONIBLE', '2026-02-01'))
+
+    # ========== TRANSICIONES POR LOTES ==========
+    def test_configurar_sds_con_errores_parciales(self):
+        _, ids_sd = self.crear_con_stock('SD', 'SD lote', 2)
+        _, ids_cable = self.crear_con_stock('CABLE_USB', 'Cable lote', 1)
+        cuerpo = {'ids': ids_sd + ids_cable + [999999], 'fecha': '2026-03-01'}
+        estado, respuesta = self.pedir('POST', '/sd/configuraciones', cuerpo)
+        self.assertEqual(estado, 200)
+        self.assertEqual(sorted(respuesta['procesados']), sorted(ids_sd))
+        self.assertEqual(sorted(e['id'] for e in respuesta['errores']), sorted(ids_cable + [999999]))
+
+        estado, item = self.pedir('GET', f'/inventario/{ids_sd[0]}')
+        self.assertEqual((item['estado'], item['sd_config_final']), ('CONFIGURADO', '2026-03-01'))
+
+    def test_reinicio_y_finalizacion(self):
+        _, ids = self.crear_con_stock('DISPOSITIVO', 'Dispositivo lote', 3)
+        estado, respuesta = self.pedir('POST', '/dispositivos/reinicios', {'ids': ids[:2], 'fecha': '2026-03-01'})
+        self.assertEqual(estado, 200)
+        self.assertEqual(sorted(respuesta['procesados']), ids[:2])
+
+        # El tercero no se reinició: no se puede finalizar
+        estado, respuesta = self.pedir('POST', '/dispositivos/finalizaciones', {'ids': ids, 'fecha': '2026-03-02'})
+        self.assertEqual(estado, 200)
+        self.assertEqual(sorted(respuesta['procesados']), ids[:2])
+        self.assertEqual([e['id'] for e in respuesta['errores']], ids[2:])
+
+        estado, item = self.pedir('GET', f'/inventario/{ids[0]}')
+        self.assertEqual((item['estado'], item['disp_fecha_config_final']), ('CONFIGURADO', '2026-03-02'))
+
+    def test_marcar_defectuosos(self):
+        _, ids = self.crear_con_stock('CABLE_C', 'Cable defectuoso', 2)
+        estado, respuesta = self.pedir('POST', '/inventario/defectuosos', {'ids': [ids[0], 999999]})
+        self.assertEqual(estado, 200)
+        self.assertEqual(respuesta['procesados'], [ids[0]])
+        self.assertEqual([e['id'] for e in respuesta['errores']], [999999])
+
+        estado, item = self.pedir('GET', f'/inventario/{ids[0]}')
+        self.assertEqual(item['estado'], 'DEFECTUOSO')
+
+    # ========== ENVÍOS ==========
+    def test_procesar_envio(self):
+        producto_id, ids = self.crear_con_stock('CABLE_USB', 'Cable envío', 3)
+        envio = {'items': [{'producto_id': producto_id, 'cantidad': 2}], 'folio': 'API-UNO',
+                 'destino': 'Bodega norte', 'fecha_salida': '2026-03-05'}
+        estado, respuesta = self.pedir('POST', '/envios', envio)
+        self.assertEqual(estado, 200)
+        self.assertEqual(respuesta['items_procesados'], 2)
+        # FIFO: salen las unidades más antiguas, en orden de ingreso
+        self.assertEqual([d['id'] for d in respuesta['detalle']], ids[:2])
+
+        estado, detalle = self.pedir('GET', f"/envios/{respuesta['envio_id']}")
+        self.assertEqual(estado, 200)
+        self.assertEqual(sorted(d['inventario_id'] for d in detalle), ids[:2])
+
+        estado, encontrados = self.pedir('GET', '/envios?texto=API-UNO')
+        self.assertEqual(estado, 200)
+        self.assertEqual([e['id'] for e in encontrados['filas']], [respuesta['envio_id']])
+
+        # Sin stock suficiente no se envía nada
+        envio = {'items': [{'producto_id': producto_id, 'cantidad': 5}], 'folio': 'API-DOS'}
+        estado, _ = self.pedir('POST', '/envios', envio)
+        self.assertEqual(estado, 400)
+
+    def test_envios_lote(self):
+        producto_id, _ = self.crear_con_stock('CABLE_ETHERNET', 'Cable lote envío', 3)
+        envios = [
+            {'items': [{'producto_id': producto_id, 'cantidad': 2}], 'folio': 'LOTE-1'},
+            {'items': [{'producto_id': producto_id, 'cantidad': 2}], 'folio': 'LOTE-2'},  # Solo queda 1
+            {'items': [{'producto_id': producto_id, 'cantidad': 1}], 'folio': 'LOTE-3'},
+        ]
+        estado, respuesta = self.pedir('POST', '/envios/lote', {'envios': envios})
+        self.assertEqual(estado, 200)
+        self.assertEqual([p['indice'] for p in respuesta['procesados']], [0, 2])
+        self.assertEqual([e['indice'] for e in respuesta['errores']], [1])
+
+        estado, stock = self.pedir('GET', f'/envios/stock?producto_id={producto_id}')
+        self.assertEqual(estado, 200)
+        self.assertEqual(stock, {str(producto_id): 0})
+
+    def test_listado_de_envios_por_paginas(self):
+        producto_id, _ = self.crear_con_stock('CABLE_C', 'Cable páginas', 2)
+        for folio in ('PAG-1', 'PAG-2'):
+            estado, _ = self.pedir('POST', '/envios', {'items': [{'producto_id': producto_id, 'cantidad': 1}],
+                                                       'folio': folio})
+            self.assertEqual(estado, 200)
+
+        estado, primera = self.pedir('GET', '/envios?limite=1')
+        self.assertEqual(estado, 200)
+        self.assertEqual(len(primera['filas']), 1)
+        self.assertGreaterEqual(primera['total'], 2)
+        estado, segunda = self.pedir('GET', f"/envios?limite=1&cursor={quote(primera['siguiente'])}")
+        self.assertEqual(estado, 200)
+        self.assertNotEqual(primera['filas'][0]['id'], segunda['filas'][0]['id'])
+
+    # ========== LECTURAS ==========
+    def test_metricas_y_conteos(self):
+        estado, antes = self.pedir('GET', '/metricas')
+        self.assertEqual(estado, 200)
+        self.crear_con_stock('CABLE_USB', 'Cable métricas', 4)
+        estado, despues = self.pedir('GET', '/metricas')
+        self.assertEqual(despues['total_en_inventario'], antes['total_en_inventario'] + 4)
+
+        estado, conteos = self.pedir('GET', '/conteos')
+        self.assertEqual(estado, 200)
+        self.assertEqual(set(conteos), set(db.TIPOS_PRODUCTO))
+
+
+if __name__ == "__main__":
+    unittest.main()